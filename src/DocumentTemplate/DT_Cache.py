@@ -0,0 +1,207 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Cache the rendered text of a template section
+
+   The 'cache' tag renders its section once and reuses the text until it
+   expires::
+
+     <dtml-cache key="'navigation'" ttl="60" vary="language">
+       <dtml-in navigation_items>...</dtml-in>
+     </dtml-cache>
+
+   The 'key' attribute is a Python expression, the 'vary' attribute a
+   list of names separated by whitespace.  The text is cached separately
+   for every value of the key and of the named variables, so everything
+   the section depends on, such as the user for personalized text, has
+   to be part of them.  Every section has its own entries, identified by
+   its source and the template rendering it: the physical path of
+   templates stored in a Zope application, otherwise the template object,
+   see 'String._cache_identity'.  Text is only shared between processes
+   for templates with a physical path, so a 'FileCache' directory must
+   not be shared between different applications.  Sections rendered
+   outside of a template are not cached.
+
+   The 'ttl' attribute gives the number of seconds the text is kept,
+   without it the text is kept until it is evicted from the cache.
+
+   The 'backend' attribute names the cache backend in 'backends' to use,
+   'default' if it is not given.  The default backend is a 'MemoryCache'
+   for the process; 'FileCache' stores the text in a directory, so that
+   it can be shared between processes.  Backends have a
+   'get(key)' method returning the cached text or None and a
+   'set(key, text, ttl)' method.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+import time
+from threading import Lock
+
+from ._DocumentTemplate import render_blocks
+from .DT_Util import Eval
+from .DT_Util import ParseError
+from .DT_Util import parse_params
+
+
+class MemoryCache:
+    """Keep rendered text in memory.
+
+    The least recently used entries are evicted when the text of all
+    entries grows beyond `max_size` characters.
+    """
+
+    def __init__(self, max_size=10000000):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            text, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                self.size -= len(text)
+                return None
+            self.entries.move_to_end(key)
+            return text
+
+    def set(self, key, text, ttl=None):
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            entries = self.entries
+            old = entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            if len(text) > self.max_size:
+                return
+            entries[key] = text, expires
+            self.size += len(text)
+            while self.size > self.max_size:
+                text, expires = entries.popitem(last=False)[1]
+                self.size -= len(text)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class FileCache:
+    """Keep rendered text in files in `directory`.
+
+    Entries are written atomically, so that several processes can share
+    the directory.  Expired files are replaced when the entry is set
+    again but never removed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def filename(self, key):
+        return os.path.join(
+            self.directory,
+            hashlib.sha256(key.encode('utf-8')).hexdigest() + '.txt')
+
+    def get(self, key):
+        try:
+            with open(self.filename(key), encoding='utf-8', newline='') as f:
+                expires = f.readline().strip()
+                text = f.read()
+            if expires and float(expires) <= time.time():
+                return None
+        except (OSError, ValueError):
+            return None
+        return text
+
+    def set(self, key, text, ttl=None):
+        expires = '' if ttl is None else repr(time.time() + ttl)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with open(fd, 'w', encoding='utf-8', newline='') as f:
+                    f.write(expires + '\n')
+                    f.write(text)
+                os.replace(tmp, self.filename(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            # Caching is an optimization, rendering must not fail.
+            pass
+
+
+backends = {'default': MemoryCache()}
+
+
+class Cache:
+    blockContinuations = ()
+    name = 'cache'
+    key = ttl = None
+    section_id = ''
+
+    def __init__(self, blocks, encoding=None):
+        tname, args, section = blocks[0]
+        self.__name__ = args
+        self.encoding = encoding
+        self.section = section.blocks
+        args = parse_params(args, key='', ttl='', vary='',
+                            backend='default')
+        if '' in args:
+            raise ParseError('Unnamed attribute, "%s"' % args[''], 'cache')
+        if 'key' in args:
+            self.key = Eval(args['key']).eval
+        if 'ttl' in args:
+            try:
+                self.ttl = float(args['ttl'])
+            except ValueError:
+                raise ParseError('ttl must be a number of seconds', 'cache')
+        self.vary = args.get('vary', '').split()
+        self.backend = args.get('backend', 'default')
+
+    def set_source(self, source):
+        """Set the source of the tag, which identifies its section."""
+        self.section_id = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def render(self, md):
+        template = getattr(md, '_template', None)
+        if template is None:
+            return render_blocks(self.section, md, encoding=self.encoding)
+        key = [self.section_id, template._cache_identity(), self.__name__]
+        if self.key is not None:
+            key.append(str(self.key(md)))
+        for name in self.vary:
+            try:
+                key.append(str(md[name]))
+            except KeyError:
+                key.append('')
+        key = '\0'.join(key)
+
+        backend = backends.get(self.backend)
+        if backend is None:
+            raise ValueError('Unknown cache backend, %s' % self.backend)
+        text = backend.get(key)
+        if text is None:
+            text = render_blocks(self.section, md, encoding=self.encoding)
+            if isinstance(text, bytes):
+                return text
+            backend.set(key, text, self.ttl)
+        return text
+
+    __call__ = render
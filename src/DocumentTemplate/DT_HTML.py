@@ -27,96 +27,63 @@ FactoryDefaultString = "Factory Default"
 
 
 class dtml_re_class:
-    """ This needs to be replaced before 2.4.  It's a hackaround. """
+    """Find DTML tags in HTML document template source.
+
+    All tag forms are recognized by a single compiled expression, so
+    that the source is scanned just once.
+    """
+
+    tokens = re.compile(
+        r'<!--\#(?P<comment>.*?)-->'  # <!--#name args-->
+        r'|<(?P<close>/?)dtml-(?P<tag>(?:[^">]|"[^"]*")*)>'  # <dtml-name args>
+        r'|&dtml-(?P<entity>[-a-zA-Z0-9_.]+);'  # &dtml-name;
+        r'|&dtml\.(?P<modifiers>[a-zA-Z0-9_.]*)'  # &dtml.modifiers-name;
+        r'-(?P<entity_name>[-a-zA-Z0-9_.]+);'
+        r'|(?P<unterminated><!--\#|</?dtml-)',
+        re.DOTALL)
 
     def search(self, text, start=0,
                name_match=re.compile('[\000- ]*[a-zA-Z]+[\000- ]*').match,
                end_match=re.compile('[\000- ]*(/|end)', re.IGNORECASE).match,
-               start_search=re.compile('[<&]').search,
-               ent_name=re.compile('[-a-zA-Z0-9_.]+').match,
                ):
 
-        while 1:
-            mo = start_search(text, start)
-            if mo is None:
-                return None
-            s = mo.start(0)
-            if text[s:s + 5] == '<!--#':
-                n = s + 5
-                e = text.find('-->', n)
-                if e < 0:
-                    return None
-                en = 3
-
-                mo = end_match(text, n)
-                if mo is not None:
-                    l_ = mo.end(0) - mo.start(0)
-                    end = text[n:n + l_].strip()
-                    n = n + l_
-                else:
-                    end = ''
-
-            elif text[s:s + 6] == '<dtml-':
-                e = n = s + 6
-                while 1:
-                    e = text.find('>', e + 1)
-                    if e < 0:
-                        return None
-                    if len(text[n:e].split('"')) % 2:
-                        # check for even number of "s inside
-                        break
-
-                en = 1
-                end = ''
-
-            elif text[s:s + 7] == '</dtml-':
-                e = n = s + 7
-                while 1:
-                    e = text.find('>', e + 1)
-                    if e < 0:
-                        return None
-                    if len(text[n:e].split('"')) % 2:
-                        # check for even number of "s inside
-                        break
-
-                en = 1
-                end = '/'
+        mo = self.tokens.search(text, start)
+        if mo is None:
+            return None
+        s = mo.start(0)
+        kind = mo.lastgroup
 
+        d = self.__dict__
+        if kind == 'entity':
+            d[1] = d['end'] = ''
+            d[2] = d['name'] = 'var'
+            d[0] = mo.group(0)
+            d[3] = d['args'] = mo.group('entity') + ' html_quote'
+            self._start = s
+            return self
+        elif kind == 'entity_name':
+            d[1] = d['end'] = ''
+            d[2] = d['name'] = 'var'
+            d[0] = mo.group(0)
+            d[3] = d['args'] = (mo.group('entity_name') + ' ' +  # NOQA: W504
+                                mo.group('modifiers').replace('.', ' '))
+            self._start = s
+            return self
+        elif kind == 'comment':
+            n, e = mo.span('comment')
+            end_mo = end_match(text, n)
+            if end_mo is not None:
+                l_ = end_mo.end(0) - end_mo.start(0)
+                end = text[n:n + l_].strip()
+                n = n + l_
             else:
-                if text[s:s + 5] == '&dtml' and text[s + 5] in '.-':
-                    n = s + 6
-                    e = text.find(';', n)
-                    if e >= 0:
-                        args = text[n:e]
-                        l_ = len(args)
-                        mo = ent_name(args)
-                        if mo is not None:
-                            if mo.end(0) - mo.start(0) == l_:
-                                d = self.__dict__
-                                if text[s + 5] == '-':
-                                    d[1] = d['end'] = ''
-                                    d[2] = d['name'] = 'var'
-                                    d[0] = text[s:e + 1]
-                                    d[3] = d['args'] = args + ' html_quote'
-                                    self._start = s
-                                    return self
-                                else:
-                                    nn = args.find('-')
-                                    if nn >= 0 and nn < l_ - 1:
-                                        d[1] = d['end'] = ''
-                                        d[2] = d['name'] = 'var'
-                                        d[0] = text[s:e + 1]
-                                        args = (args[nn + 1:] +  # NOQA: W504
-                                                ' ' +  # NOQA: W504
-                                                args[:nn].replace('.', ' '))
-                                        d[3] = d['args'] = args
-                                        self._start = s
-                                        return self
-
-                start = s + 1
-                continue
-
-            break
+                end = ''
+        elif kind == 'tag':
+            n, e = mo.span('tag')
+            end = mo.group('close')
+        else:
+            # The start of a tag without its end, stop looking.
+            return None
 
         mo = name_match(text, n)
         if mo is None:
@@ -128,8 +95,7 @@ class dtml_re_class:
 
         args = text[a:e].strip()
 
-        d = self.__dict__
-        d[0] = text[s:e + en]
+        d[0] = text[s:e + (3 if kind == 'comment' else 1)]
         d[1] = d['end'] = end
         d[2] = d['name'] = name
         d[3] = d['args'] = args
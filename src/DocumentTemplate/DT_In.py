@@ -75,6 +75,26 @@
       reverse_expr -- This calculated parameter allows you to calculate the
       need of reversing on the fly.
 
+      group_by -- Insert the text once for every group of elements next
+      to each other with the same value of the named variable, after
+      sorting and reversing.  Sort by the same variable to get one group
+      for every value.  The value is 'sequence-key' and the list of the
+      elements of the group is 'sequence-item', e.g. for an inner 'in'
+      tag.  The groups themselves are not pushed onto the namespace and
+      batches count groups instead of elements::
+
+        <dtml-in books sort=author group_by=author>
+          <h2>&dtml-sequence-key;</h2>
+          <dtml-in sequence-item><dtml-var title></dtml-in>
+        </dtml-in>
+
+      stream -- Insert the elements of an iterator, like a generator or
+      a database cursor, as they are taken from it, keeping only the
+      previous, the current and the next element in memory.  The
+      sequence is not sorted, reversed, grouped or batched then, and
+      variables that need the whole sequence, like 'sequence-length'
+      and the summary statistics, are not available.
+
       Within an 'in' block, variables are substituted from the
       elements of the iteration unless the 'no_push_item' optional
       is specified.  The elements may be either instance or mapping
@@ -270,6 +290,11 @@
 
                 batch-size -- The size of the batch.
 
+             The batches in 'previous-batches' and 'next-batches' are
+             computed when they are accessed.  A pager can show a few
+             of many batches with a slice or a batched 'in' tag, e.g.
+             '<dtml-in next-batches mapping size=10>'.
+
       For each of the variables listed above with names ending in
       "-index", there are variables with names ending in "-number",
       "-roman", "-Roman", "-letter", and "-Letter" that are indexed
@@ -315,6 +340,17 @@
       Missing values are either 'None' or the attribute 'Value'
       of the module 'Missing', if present.
 
+    Prefetching
+
+      If the sequence has a '__dtml_prefetch__' method, it is called
+      once before the items are inserted with the start and end of the
+      slice of the sequence that is inserted and a set of the names
+      the section looks up.  This lets the sequence load the items at
+      once.  The slice is the whole sequence if it is sorted, as all
+      items are needed for sorting it, and the names include the sort
+      keys then.  Names in expressions are included, but not the names
+      tags look up while they are rendered.
+
     'else' continuation tag within in
 
       An 'else' tag may be used as a continuation tag in the 'in' tag.
@@ -330,21 +366,27 @@
 """
 
 import functools
+import heapq
+import itertools
 import re
 import sys
 from operator import itemgetter
+from operator import methodcaller
 
 from zope.sequencesort.ssort import _Smallest
 
 from ._DocumentTemplate import InstanceDict
+from ._DocumentTemplate import iter_blocks
 from ._DocumentTemplate import join_unicode
 from ._DocumentTemplate import render_blocks
 from .DT_InSV import opt
 from .DT_InSV import sequence_variables
 from .DT_Util import Eval
 from .DT_Util import ParseError
+from .DT_Util import SequenceWindow
 from .DT_Util import ValidationError
 from .DT_Util import add_with_prefix
+from .DT_Util import guarded_items
 from .DT_Util import name_param
 from .DT_Util import parse_params
 from .DT_Util import sequence_ensure_subscription
@@ -359,16 +401,18 @@ TupleType = tuple
 StringTypes = (str, bytes)
 
 
+def render_section(section, md, encoding=None):
+    # Render a section as a single chunk, for joining the chunks of an
+    # in tag right away.
+    return (render_blocks(section, md, encoding=encoding), )
+
+
 class InFactory:
     blockContinuations = ('else', )
     name = 'in'
 
     def __call__(self, blocks, encoding=None):
-        i = InClass(blocks, encoding)
-        if i.batch:
-            return i.renderwb
-        else:
-            return i.renderwob
+        return InClass(blocks, encoding)
 
 
 In = InFactory()
@@ -377,9 +421,11 @@ In = InFactory()
 class InClass:
     elses = None
     expr = sort = batch = mapping = no_push_item = None
+    names = None
     start_name_re = None
     reverse = None
     sort_expr = reverse_expr = None
+    group_by = stream = None
 
     def __init__(self, blocks, encoding=None):
         tname, args, section = blocks[0]
@@ -389,7 +435,7 @@ class InClass:
                             skip_unauthorized=1,
                             previous=1, next=1, expr='', sort='',
                             reverse=1, sort_expr='', reverse_expr='',
-                            prefix='')
+                            prefix='', group_by='', stream=1)
         self.args = args
         self.encoding = encoding
 
@@ -410,6 +456,12 @@ class InClass:
         if 'no_push_item' in args:
             self.no_push_item = args['no_push_item']
 
+        if 'group_by' in args:
+            self.group_by = args['group_by']
+            if not self.group_by:
+                raise ParseError('group_by needs the name of a variable',
+                                 'in')
+
         if 'mapping' in args:
             self.mapping = args['mapping']
         for n in 'start', 'size', 'end':
@@ -429,6 +481,15 @@ class InClass:
                     attributes were used.
                     """ % n, 'in')
 
+        if 'stream' in args:
+            self.stream = args['stream']
+            for n in ('sort', 'sort_expr', 'reverse', 'reverse_expr',
+                      'group_by', 'start', 'end', 'size'):
+                if n in args:
+                    raise ParseError(
+                        'The %s attribute cannot be used with the stream '
+                        'attribute.' % n, 'in')
+
         if 'start' in args:
             v = args['start']
             if isinstance(v, str):
@@ -456,7 +517,31 @@ class InClass:
                     raise ParseError('name in else does not match in', 'in')
             self.elses = section.blocks
 
+    def __call__(self, md):
+        if self.batch:
+            return self.renderwb(md)
+        if self.stream:
+            return join_unicode(list(self.iter_renderstream(
+                md, render_section)), encoding=self.encoding)
+        return self.renderwob(md)
+
+    def iter_render(self, md):
+        if self.batch:
+            return self.iter_renderwb(md)
+        if self.stream:
+            return self.iter_renderstream(md)
+        return self.iter_renderwob(md)
+
     def renderwb(self, md):
+        return join_unicode(list(self.iter_renderwb(md, render_section)),
+                            encoding=self.encoding)
+
+    def renderwob(self, md):
+        """RENDER WithOutBatch"""
+        return join_unicode(list(self.iter_renderwob(md, render_section)),
+                            encoding=self.encoding)
+
+    def iter_renderwb(self, md, render=iter_blocks):
         expr = self.expr
         name = self.__name__
         if expr is None:
@@ -477,8 +562,8 @@ class InClass:
             sequence[0]
         except IndexError:
             if self.elses:
-                return render_blocks(self.elses, md, encoding=self.encoding)
-            return ''
+                yield from render(self.elses, md, encoding=self.encoding)
+            return
 
         section = self.section
         params = self.args
@@ -486,17 +571,7 @@ class InClass:
         mapping = self.mapping
         no_push_item = self.no_push_item
 
-        if self.sort_expr is not None:
-            self.sort = self.sort_expr.eval(md)
-            sequence = self.sort_sequence(sequence, md)
-        elif self.sort is not None:
-            sequence = self.sort_sequence(sequence, md)
-
-        if self.reverse_expr is not None and self.reverse_expr.eval(md):
-            sequence = self.reverse_sequence(sequence)
-        elif self.reverse is not None:
-            sequence = self.reverse_sequence(sequence)
-
+        # The batch only depends on the length of the sequence.
         next = previous = 0
         try:
             start = int_param(params, md, 'start', 0)
@@ -506,12 +581,48 @@ class InClass:
         size = int_param(params, md, 'size', 0)
         overlap = int_param(params, md, 'overlap', 0)
         orphan = int_param(params, md, 'orphan', '0')
-        start, end, sz = opt(start, end, size, orphan, sequence)
+        # The batch of groups is only known after grouping.
+        grouped = self.group_by is not None
+        if not grouped:
+            start, end, sz = opt(start, end, size, orphan, sequence)
         if 'next' in params:
             next = 1
         if 'previous' in params:
             previous = 1
 
+        if self.sort_expr is not None:
+            self.sort = self.sort_expr.eval(md)
+            sort = True
+        else:
+            sort = self.sort is not None
+
+        reverse = self.reverse_expr is not None and self.reverse_expr.eval(md)
+        if not reverse:
+            reverse = self.reverse is not None
+
+        if getattr(sequence, '__dtml_prefetch__', None) is not None:
+            if sort or grouped:
+                self.prefetch(sequence, 0, len(sequence), sort)
+            elif reverse:
+                length = len(sequence)
+                self.prefetch(sequence, length - end, length + 1 - start)
+            else:
+                self.prefetch(sequence, start - 1, end)
+
+        if sort:
+            # Only this batch and the next one (for the next-sequence
+            # variables) have to be in order, unless more is asked for.
+            limit = None if reverse or grouped else end + sz + orphan
+            sequence = self.sort_sequence(sequence, md, limit)
+
+        if reverse:
+            sequence = self.reverse_sequence(sequence)
+
+        if grouped:
+            sequence = self.group_sequence(sequence, md)
+            no_push_item = True
+            start, end, sz = opt(start, end, size, orphan, sequence)
+
         last = end - 1
         first = start - 1
 
@@ -524,8 +635,6 @@ class InClass:
                                   self.start_name_re, prefix)
         kw = vars.data
         pkw = add_with_prefix(kw, 'sequence', prefix)
-        for k, v in list(kw.items()):
-            pkw[k] = v
         pkw['sequence-step-size'] = sz
         pkw['sequence-step-overlap'] = overlap
         pkw['sequence-step-start'] = start
@@ -535,10 +644,10 @@ class InClass:
         pkw['sequence-step-orphan'] = orphan
 
         kw['mapping'] = mapping
+        vars.bounds = first, last
 
         push = md._push
         pop = md._pop
-        render = render_blocks
 
         if cache:
             push(cache)
@@ -548,16 +657,14 @@ class InClass:
                 if first > 0:
                     pstart, pend, psize = opt(0, first + overlap,
                                               sz, orphan, sequence)
-                    pkw['previous-sequence'] = 1
+                    vars.previous = 1
                     pkw['previous-sequence-start-index'] = pstart - 1
                     pkw['previous-sequence-end-index'] = pend - 1
                     pkw['previous-sequence-size'] = pend + 1 - pstart
-                    result = render(section, md, encoding=self.encoding)
+                    yield from render(section, md, encoding=self.encoding)
 
                 elif self.elses:
-                    result = render(self.elses, md, encoding=self.encoding)
-                else:
-                    result = ''
+                    yield from render(self.elses, md, encoding=self.encoding)
             elif next:
                 try:
                     # The following line is a sneaky way to test whether
@@ -566,26 +673,30 @@ class InClass:
                     sequence[end]
                 except IndexError:
                     if self.elses:
-                        result = render(self.elses, md, encoding=self.encoding)
-                    else:
-                        result = ''
+                        yield from render(self.elses, md,
+                                          encoding=self.encoding)
                 else:
                     pstart, pend, psize = opt(end + 1 - overlap, 0,
                                               sz, orphan, sequence)
-                    pkw['next-sequence'] = 1
+                    vars.next = 1
                     pkw['next-sequence-start-index'] = pstart - 1
                     pkw['next-sequence-end-index'] = pend - 1
                     pkw['next-sequence-size'] = pend + 1 - pstart
-                    result = render(section, md, encoding=self.encoding)
+                    yield from render(section, md, encoding=self.encoding)
             else:
-                result = []
-                append = result.append
                 guarded_getitem = getattr(md, 'guarded_getitem', None)
+                allowed = None
+                if guarded_getitem is not None and \
+                   'skip_unauthorized' in params and \
+                   params['skip_unauthorized']:
+                    allowed = guarded_items(md, sequence, first, end)
+                # One namespace is rebound to the items in turn.
+                namespace = None
                 for index in range(first, end):
                     # preset
-                    pkw['previous-sequence'] = 0
+                    vars.previous = 0
                     # now more often defined then previously
-                    pkw['next-sequence'] = 0
+                    vars.next = 0
                     #
                     if index == first or index == last:
                         # provide batching information
@@ -593,7 +704,7 @@ class InClass:
                             pstart, pend, psize = opt(0, first + overlap,
                                                       sz, orphan, sequence)
                             if index == first:
-                                pkw['previous-sequence'] = 1
+                                vars.previous = 1
                             pkw['previous-sequence-start-index'] = pstart - 1
                             pkw['previous-sequence-end-index'] = pend - 1
                             pkw['previous-sequence-size'] = pend + 1 - pstart
@@ -605,7 +716,7 @@ class InClass:
                             pstart, pend, psize = opt(end + 1 - overlap, 0,
                                                       sz, orphan, sequence)
                             if index == last:
-                                pkw['next-sequence'] = 1
+                                vars.next = 1
                             pkw['next-sequence-start-index'] = pstart - 1
                             pkw['next-sequence-end-index'] = pend - 1
                             pkw['next-sequence-size'] = pend + 1 - pstart
@@ -613,23 +724,24 @@ class InClass:
                             pass
 
                     if index == last:
-                        pkw['sequence-end'] = 1
+                        vars.end = 1
 
-                    if guarded_getitem is not None:
+                    if allowed is not None:
+                        if index not in allowed:
+                            if index == first:
+                                vars.start = 0
+                            continue
+                        client = allowed[index]
+                    elif guarded_getitem is not None:
                         try:
                             client = guarded_getitem(sequence, index)
                         except ValidationError as vv:
-                            if 'skip_unauthorized' in params and \
-                               params['skip_unauthorized']:
-                                if index == first:
-                                    pkw['sequence-start'] = 0
-                                continue
                             raise ValidationError('(item {}): {}'.format(
                                 index, vv), sys.exc_info()[2])
                     else:
                         client = sequence[index]
 
-                    pkw['sequence-index'] = index
+                    vars.index = index
                     t = type(client)
                     if t is TupleType and len(client) == 2:
                         client = client[1]
@@ -641,30 +753,32 @@ class InClass:
                         push(client)
                     elif t in StringTypes:
                         pushed = 0
+                    elif namespace is None:
+                        pushed = 1
+                        namespace = InstanceDict(client, md)
+                        push(namespace)
                     else:
                         pushed = 1
-                        push(InstanceDict(client, md))
+                        namespace.rebind(client)
+                        push(namespace)
 
                     try:
-                        append(render(section, md, encoding=self.encoding))
+                        yield from render(section, md,
+                                          encoding=self.encoding)
                     finally:
                         if pushed:
                             pop()
 
                     if index == first:
-                        pkw['sequence-start'] = 0
-
-                result = join_unicode(result, encoding=self.encoding)
+                        vars.start = 0
 
         finally:
             if cache:
                 pop()
             pop()
 
-        return result
-
-    def renderwob(self, md):
-        """RENDER WithOutBatch"""
+    def iter_renderwob(self, md, render=iter_blocks):
+        """RENDER WithOutBatch, generating the text in chunks"""
         expr = self.expr
         name = self.__name__
         if expr is None:
@@ -685,8 +799,8 @@ class InClass:
             sequence[0]
         except IndexError:
             if self.elses:
-                return render_blocks(self.elses, md, encoding=self.encoding)
-            return ''
+                yield from render(self.elses, md, encoding=self.encoding)
+            return
 
         section = self.section
         mapping = self.mapping
@@ -694,8 +808,14 @@ class InClass:
 
         if self.sort_expr is not None:
             self.sort = self.sort_expr.eval(md)
-            sequence = self.sort_sequence(sequence, md)
-        elif self.sort is not None:
+            sort = True
+        else:
+            sort = self.sort is not None
+
+        if getattr(sequence, '__dtml_prefetch__', None) is not None:
+            self.prefetch(sequence, 0, len(sequence), sort)
+
+        if sort:
             sequence = self.sort_sequence(sequence, md)
 
         if self.reverse_expr is not None and self.reverse_expr.eval(md):
@@ -703,39 +823,130 @@ class InClass:
         elif self.reverse is not None:
             sequence = self.reverse_sequence(sequence)
 
+        if self.group_by is not None:
+            sequence = self.group_sequence(sequence, md)
+            no_push_item = True
+
         prefix = self.args.get('prefix')
         vars = sequence_variables(sequence, alt_prefix=prefix)
-        kw = vars.data
-        pkw = add_with_prefix(kw, 'sequence', prefix)
-        for k, v in list(kw.items()):
-            pkw[k] = v
-        kw['mapping'] = mapping
+        vars.data['mapping'] = mapping
 
         l_ = len(sequence)
         last = l_ - 1
+        vars.bounds = 0, last
 
         push = md._push
         pop = md._pop
-        render = render_blocks
 
         if cache:
             push(cache)
         push(vars)
         try:
-            result = []
-            append = result.append
             guarded_getitem = getattr(md, 'guarded_getitem', None)
+            allowed = None
+            if guarded_getitem is not None and \
+               'skip_unauthorized' in self.args and \
+               self.args['skip_unauthorized']:
+                allowed = guarded_items(md, sequence, 0, l_)
+            namespace = None
             for index in range(l_):
                 if index == last:
-                    pkw['sequence-end'] = 1
+                    vars.end = 1
+                if allowed is not None:
+                    if index not in allowed:
+                        if index == 1:
+                            vars.start = 0
+                        continue
+                    client = allowed[index]
+                elif guarded_getitem is not None:
+                    try:
+                        client = guarded_getitem(sequence, index)
+                    except ValidationError as vv:
+                        raise ValidationError(
+                            f'(item {index}): {vv}',
+                            sys.exc_info()[2])
+                else:
+                    client = sequence[index]
+
+                vars.index = index
+                t = type(client)
+                if t is TupleType and len(client) == 2:
+                    client = client[1]
+
+                if no_push_item:
+                    pushed = 0
+                elif mapping:
+                    pushed = 1
+                    push(client)
+                elif t in StringTypes:
+                    pushed = 0
+                elif namespace is None:
+                    pushed = 1
+                    namespace = InstanceDict(client, md)
+                    push(namespace)
+                else:
+                    pushed = 1
+                    namespace.rebind(client)
+                    push(namespace)
+
+                try:
+                    yield from render(section, md, encoding=self.encoding)
+                finally:
+                    if pushed:
+                        pop()
+                if index == 0:
+                    vars.start = 0
+
+        finally:
+            if cache:
+                pop()
+            pop()
+
+    def iter_renderstream(self, md, render=iter_blocks):
+        """RENDER the items of a stream as they are taken from it"""
+        expr = self.expr
+        name = self.__name__
+        if expr is None:
+            sequence = md[name]
+        else:
+            sequence = expr(md)
+
+        if isinstance(sequence, str):
+            raise ValueError(
+                'Strings are not allowed as input to the in tag.')
+
+        sequence = SequenceWindow(iter(sequence))
+        if not sequence.has(0):
+            if self.elses:
+                yield from render(self.elses, md, encoding=self.encoding)
+            return
+
+        section = self.section
+        mapping = self.mapping
+        no_push_item = self.no_push_item
+
+        prefix = self.args.get('prefix')
+        vars = sequence_variables(sequence, alt_prefix=prefix)
+        vars.data['mapping'] = mapping
+
+        push = md._push
+        pop = md._pop
+
+        push(vars)
+        try:
+            guarded_getitem = getattr(md, 'guarded_getitem', None)
+            namespace = None
+            for index in itertools.count():
+                if not sequence.move(index):
+                    break
+                if not sequence.has(index + 1):
+                    vars.end = 1
                 if guarded_getitem is not None:
                     try:
                         client = guarded_getitem(sequence, index)
                     except ValidationError as vv:
                         if 'skip_unauthorized' in self.args and \
                            self.args['skip_unauthorized']:
-                            if index == 1:
-                                pkw['sequence-start'] = 0
                             continue
                         raise ValidationError(
                             f'(item {index}): {vv}',
@@ -743,7 +954,7 @@ class InClass:
                 else:
                     client = sequence[index]
 
-                pkw['sequence-index'] = index
+                vars.index = index
                 t = type(client)
                 if t is TupleType and len(client) == 2:
                     client = client[1]
@@ -755,28 +966,103 @@ class InClass:
                     push(client)
                 elif t in StringTypes:
                     pushed = 0
+                elif namespace is None:
+                    pushed = 1
+                    namespace = InstanceDict(client, md)
+                    push(namespace)
                 else:
                     pushed = 1
-                    push(InstanceDict(client, md))
+                    namespace.rebind(client)
+                    push(namespace)
 
                 try:
-                    append(render(section, md, encoding=self.encoding))
+                    yield from render(section, md, encoding=self.encoding)
                 finally:
                     if pushed:
                         pop()
-                if index == 0:
-                    pkw['sequence-start'] = 0
-
-            result = join_unicode(result, encoding=self.encoding)
+                vars.start = 0
 
         finally:
-            if cache:
-                pop()
             pop()
 
-        return result
+    def prefetch(self, sequence, start, end, sort=False):
+        """Let the sequence load the items from `start` to `end` at once.
+
+        The sequence's `__dtml_prefetch__` method is called with the
+        bounds of the slice and the names the section looks up, as far
+        as they are known without rendering it, plus the names of the
+        sort keys if the sequence is sorted.
+        """
+        names = self.names
+        if names is None:
+            names = self.names = used_names(self.section)
+        if sort and self.sort:
+            names = names | {field.split('/')[0].strip()
+                             for field in self.sort.split(',')}
+        if self.group_by is not None:
+            names = names | {self.group_by}
+        sequence.__dtml_prefetch__(start, end, names)
+
+    def group_sequence(self, sequence, md):
+        """Return the groups of the items of the sequence.
+
+        A group is a (key, items) pair of the items next to each other
+        which have the same value of the variable named by 'group_by'.
+        The items are checked with the template's security policy before
+        their keys are read, so 'skip_unauthorized' leaves out the items
+        that may not be accessed.
+        """
+        guarded_getitem = getattr(md, 'guarded_getitem', None)
+        if guarded_getitem is not None:
+            if self.args.get('skip_unauthorized'):
+                allowed = guarded_items(md, sequence, 0, len(sequence))
+                sequence = [allowed[index] for index in sorted(allowed)]
+            else:
+                checked = []
+                for index in range(len(sequence)):
+                    try:
+                        checked.append(guarded_getitem(sequence, index))
+                    except ValidationError as vv:
+                        raise ValidationError(
+                            f'(item {index}): {vv}',
+                            sys.exc_info()[2])
+                sequence = checked
+        get = getattr(md, 'guarded_getattr', None)
+        if get is None:
+            get = getattr
+        name = self.group_by
+        mapping = self.mapping
+        groups = []
+        items = key = None
+        for client in sequence:
+            v = client
+            if isinstance(client, tuple) and len(client) == 2:
+                v = client[1]
+            if mapping:
+                k = v.get(name)
+            else:
+                try:
+                    k = get(v, name)
+                except AttributeError:
+                    k = None
+            if not basic_type(type(k)):
+                try:
+                    k = k()
+                except Exception:
+                    pass
+            if items is None or k != key:
+                key = k
+                items = []
+                groups.append((key, items))
+            items.append(client)
+        return groups
 
-    def sort_sequence(self, sequence, md):
+    def sort_sequence(self, sequence, md, limit=None):
+        """Return the sorted sequence.
+
+        If `limit` is given and much smaller than the sequence, only the
+        first `limit` items are sorted until others are asked for.
+        """
 
         # Modified with multiple sort fields by Ross Lazarus
         # April 7 2000 rossl@med.usyd.edu.au
@@ -848,9 +1134,22 @@ class InClass:
 
             s.append((k, client))
 
+        if limit is not None and limit * PARTIAL_SORT_RATIO < len(s) and \
+           totally_ordered(s):
+            if not need_sortfunc:
+                return PartiallySorted(s, itemgetter(0), False, limit)
+            if len({multiplier for field, func, multiplier in sf_list}) == 1:
+                keys = [field_key(i, func, multsort)
+                        for i, (field, func, multiplier) in enumerate(sf_list)]
+                if len(keys) == 1:
+                    key = keys[0]
+                else:
+                    def key(pair):
+                        return tuple([k(pair) for k in keys])
+                return PartiallySorted(s, key, sf_list[0][2] < 0, limit)
+
         if need_sortfunc:
-            by = SortBy(multsort, sf_list)
-            s.sort(key=functools.cmp_to_key(by))
+            sort_by_functions(s, multsort, sf_list)
         else:
             # In python 3 a key is required when tuples in the list have
             # the same sort key to prevent attempting to compare the second
@@ -901,10 +1200,14 @@ def nocase(str1, str2):
 
 if 'locale' in sys.modules:  # only if locale is already imported
     from locale import strcoll
+    from locale import strxfrm
 
     def strcoll_nocase(str1, str2):
         return strcoll(str1.lower(), str2.lower())
 
+    def strxfrm_nocase(str1):
+        return strxfrm(str1.lower())
+
 
 def make_sortfunctions(sortfields, md):
     """Create a sort function
@@ -957,6 +1260,176 @@ def make_sortfunctions(sortfields, md):
     return sf_list
 
 
+def used_names(blocks):
+    """Return the names the blocks look up, as far as they are known
+    without rendering them.
+
+    This includes the names in expressions and, for sequence variables
+    like 'sequence-var-title', the name of the item's variable.
+    """
+    names = set()
+    add_used_names(blocks, names)
+    names.discard('')
+    return frozenset(names)
+
+
+def add_used_names(blocks, names):
+    for block in blocks or ():
+        if isinstance(block, str):
+            continue
+        if isinstance(block, tuple):
+            if block[0] == 'v':
+                add_used_name(block[1], names)
+            elif block[0] == 'i':
+                # Conditions alternate with their sections, an else
+                # section comes last.
+                parts = block[1:]
+                for i in range(0, len(parts) - 1, 2):
+                    add_used_name(parts[i], names)
+                    add_used_names(parts[i + 1], names)
+                if len(parts) % 2:
+                    add_used_names(parts[-1], names)
+            continue
+        expr = getattr(block, 'expr', None)
+        if expr is not None:
+            add_used_name(expr, names)
+        elif isinstance(getattr(block, '__name__', None), str) and \
+                hasattr(block, 'expr'):
+            add_used_name(block.__name__, names)
+        args = getattr(block, 'args', None)
+        if isinstance(args, list):  # let
+            for name, value in args:
+                add_used_name(value, names)
+        for attr in ('section', 'elses'):
+            sub = getattr(block, attr, None)
+            if isinstance(sub, list):
+                add_used_names(sub, names)
+
+
+def add_used_name(name, names):
+    if isinstance(name, str):
+        if name.startswith('sequence-var-'):
+            name = name[13:]
+        names.add(name)
+        return
+    expr = getattr(name, '__self__', name)
+    if isinstance(expr, Eval):
+        if expr.used is None:
+            expr.prepUnrestrictedCode()
+        names.update(name for name in expr.used
+                     if not name.startswith('_'))
+
+
+def sort_key(func):
+    """Return a key function that sorts like the comparison function func.
+
+    Returns None for sorting by the values themselves.  Only functions
+    looked up in the namespace are used to compare values.
+    """
+    if func is cmp:
+        return None
+    if func is nocase:
+        return methodcaller('lower')
+    if 'strcoll' in globals():
+        if func is strcoll:
+            return strxfrm
+        if func is strcoll_nocase:
+            return strxfrm_nocase
+    return functools.cmp_to_key(func)
+
+
+def field_key(i, func, multsort):
+    """Return the key function for (key, client) pairs sorting by the
+    i-th field with the comparison function func."""
+    key = sort_key(func)
+    if not multsort:
+        if key is None:
+            return itemgetter(0)
+
+        def field_key(pair):
+            return key(pair[0])
+    elif key is None:
+        def field_key(pair):
+            return pair[0][i]
+    else:
+        def field_key(pair):
+            return key(pair[0][i])
+    return field_key
+
+
+def sort_by_functions(s, multsort, sf_list):
+    """Sort a list of (key, client) pairs by the functions in sf_list.
+
+    The list is sorted by one field after the other, beginning with the
+    last; as every pass is stable, this orders the pairs like comparing
+    all fields at once.
+    """
+    for i in range(len(sf_list) - 1, -1, -1):
+        field, func, multiplier = sf_list[i]
+        s.sort(key=field_key(i, func, multsort), reverse=multiplier < 0)
+
+
+# Only sort the first items of a sequence if it has this many times more.
+PARTIAL_SORT_RATIO = 8
+
+
+def totally_ordered(pairs):
+    """Return whether the keys of the (key, client) `pairs` are totally
+    ordered, so that selecting the smallest ones agrees with sorting.
+
+    `_Smallest`, the key of missing values, is smaller than itself and
+    NaN is not equal to itself.
+    """
+    for k, client in pairs:
+        for v in (k if isinstance(k, list) else (k,)):
+            if v is _Smallest or v != v:
+                return False
+    return True
+
+
+class PartiallySorted:
+    """A sorted sequence of which only the first items are sorted.
+
+    `pairs` is a list of (key, client) pairs, `limit` the number of
+    items to select with a heap.  The whole list is sorted as soon as
+    any other item is asked for.
+    """
+
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __init__(self, pairs, key, reverse, limit):
+        self.pairs = pairs
+        self.key = key
+        self.reverse = reverse
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        self.first = [client for k, client in select(limit, pairs, key)]
+        self.items = None
+        self.length = len(pairs)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if self.items is None and isinstance(index, int) and \
+           0 <= index < len(self.first):
+            return self.first[index]
+        return self.sorted()[index]
+
+    def __iter__(self):
+        return iter(self.sorted())
+
+    def sorted(self):
+        items = self.items
+        if items is None:
+            pairs = self.pairs
+            pairs.sort(key=self.key, reverse=self.reverse)
+            items = self.items = [client for k, client in pairs]
+            self.pairs = self.first = None
+        return items
+
+
+# Not used any more since sorting is done with key functions, kept so that
+# it can still be imported from here.
 class SortBy:
     def __init__(self, multsort, sf_list):
         self.multsort = multsort
@@ -13,7 +13,12 @@
 """Sequence variables support"""
 
 import re
+from functools import reduce
+from itertools import islice
 from math import sqrt
+from operator import add
+from operator import attrgetter
+from operator import mul
 
 import roman
 
@@ -26,12 +31,48 @@ try:
 except ModuleNotFoundError:
     mv = None
 
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
 TupleType = tuple
 
+# The values of a variable are taken from the items in chunks of this
+# many values for the statistics.
+CHUNK_SIZE = 4096
+
+# Use numpy, if it is installed, for chunks of numbers of one type with
+# at least this many values.
+NUMPY_MIN_COUNT = 1000
+
+
+def index_getter(method):
+    """Return a function calling `method` with the current index."""
+    def get(self):
+        index = self.index
+        if index is None:
+            raise KeyError('sequence-index')
+        return method(self, index)
+    return get
+
 
 class sequence_variables:
 
-    alt_prefix = None
+    # The state of the current row is kept in slots, so that the loop
+    # sets a few attributes per row instead of writing to `data`.
+    __slots__ = ('items', 'query_string', 'start_name_re', 'alt_prefix',
+                 'getters', 'summaries', 'groups', 'data', 'bounds',
+                 'index', 'start', 'end', 'previous', 'next')
+
+    # The variables of the state of the current row and their slots.
+    state_names = {
+        'sequence-index': 'index',
+        'sequence-start': 'start',
+        'sequence-end': 'end',
+        'previous-sequence': 'previous',
+        'next-sequence': 'next',
+    }
 
     def __init__(self,
                  items=None,
@@ -43,15 +84,22 @@ class sequence_variables:
         self.items = items
         self.query_string = query_string
         self.start_name_re = start_name_re
+        self.alt_prefix = alt_prefix + '_' if alt_prefix else None
         if alt_prefix:
-            self.alt_prefix = alt_prefix + '_'
-
-        self.data = {
-            'previous-sequence': 0,
-            'next-sequence': 0,
-            'sequence-start': 1,
-            'sequence-end': 0,
-        }
+            self.getters = self.prefixed(self.alt_prefix)
+        else:
+            self.getters = self.sequence_getters
+
+        self.summaries = {}
+        self.groups = {}
+        self.data = {}
+        # The indexes of the first and last item that are inserted.
+        self.bounds = None
+        self.index = None
+        self.start = 1
+        self.end = 0
+        self.previous = 0
+        self.next = 0
 
     def __len__(self):
         return 1
@@ -98,20 +146,59 @@ class sequence_variables:
             return item[name]
         return getattr(item, name)
 
+    def current(self):
+        """Return the index of the current item."""
+        index = self.index
+        if index is None:
+            raise KeyError('sequence-index')
+        return index
+
     def first(self, name, key=''):
-        data = self.data
-        if data['sequence-start']:
+        if self.start:
             return 1
-        index = data['sequence-index']
+        index = self.current()
+        changes = self.changes(name)
+        if changes is not None:
+            offset = index - self.bounds[0]
+            if 0 < offset < len(changes):
+                return changes[offset]
         return self.value(index, name) != self.value(index - 1, name)
 
     def last(self, name, key=''):
-        data = self.data
-        if data['sequence-end']:
+        if self.end:
             return 1
-        index = data['sequence-index']
+        index = self.current()
+        changes = self.changes(name)
+        if changes is not None:
+            offset = index + 1 - self.bounds[0]
+            if 0 < offset < len(changes):
+                return changes[offset]
         return self.value(index, name) != self.value(index + 1, name)
 
+    def changes(self, name):
+        """Return whether the value of `name` differs from the one of the
+        item before for the items from the start to the end of `bounds`.
+
+        The values of the items are only looked up once for all 'first-'
+        and 'last-' variables.  None is returned if there are no bounds
+        or if not all items have the variable.
+        """
+        groups = self.groups
+        if name not in groups:
+            changes = None
+            if self.bounds is not None:
+                first, last = self.bounds
+                try:
+                    values = [self.value(index, name)
+                              for index in range(first, last + 1)]
+                except Exception:
+                    pass
+                else:
+                    changes = [1] + [value != previous for value, previous
+                                     in zip(values[1:], values)]
+            groups[name] = changes
+        return groups[name]
+
     def length(self, ignored):
         l_ = self['sequence-length'] = len(self.items)
         return l_
@@ -167,171 +254,76 @@ class sequence_variables:
     )
 
     def statistics(self, name, key):
-        items = self.items
         data = self.data
         mapping = data['mapping']
-        count = sum = sumsq = 0
-        min = max = None
-        smin = smax = None
-        values = []
-        svalues = []
-        for item in items:
+        stat = key[:-len(name) - 1]
+        summary = self.summaries.get(name)
+        if summary is None:
+            summary = self.summaries[name] = Summary(
+                lambda: self.column(name, mapping), len(self.items))
+        value = data[key] = summary[stat]
+        return value
+
+    def column(self, name, mapping):
+        """Generate the values of the variable `name` of the items in
+        lists of up to 'CHUNK_SIZE' values.
+
+        Items without the variable are left out.
+        """
+        items = iter(self.items)
+        while True:
+            chunk = list(islice(items, CHUNK_SIZE))
+            if not chunk:
+                return
             try:
                 if mapping:
-                    item = item[name]
+                    values = [item[name] for item in chunk]
                 else:
-                    try:
-                        item = getattr(item, name)
-                    except Exception:
-                        if name != 'item':
-                            raise
-                try:
-                    if item is mv:
-                        item = None
-                    if isinstance(item, int):
-                        s = item * int(item)
-                    else:
-                        s = item * item
-                    sum = sum + item
-                    sumsq = sumsq + s
-                    values.append(item)
-                    if min is None:
-                        min = max = item
-                    else:
-                        if item < min:
-                            min = item
-                        if item > max:
-                            max = item
-                except TypeError:
-                    if item is not None and item is not mv:
-                        if smin is None:
-                            smin = smax = item
-                        else:
-                            if item < smin:
-                                smin = item
-                            if item > smax:
-                                smax = item
-                        svalues.append(item)
+                    values = [getattr(item, name) for item in chunk]
             except Exception:
-                pass
-
-        # Initialize all stats to empty strings:
-        for stat in self.statistic_names:
-            data[f'{stat}-{name}'] = ''
-
-        count = len(values)
-        try:  # Numeric statistics
-            n = float(count)
-            mean = sum / n
-            sumsq = sumsq / n - mean * mean
-            data['mean-%s' % name] = mean
-            data['total-%s' % name] = sum
-            data['variance-n-%s' % name] = sumsq
-            data['standard-deviation-n-%s' % name] = sqrt(sumsq)
-            if count > 1:
-                sumsq = sumsq * n / (n - 1)
-                data['variance-%s' % name] = sumsq
-                data['standard-deviation-%s' % name] = sqrt(sumsq)
-            else:
-                data['variance-%s' % name] = ''
-                data['standard-deviation-%s' % name] = ''
-        except ZeroDivisionError:
-            if min is None:
-                min, max, values = smin, smax, svalues
-            else:
-                if smin < min:
-                    min = smin
-                if smax > max:
-                    max = smax
-                values = values + svalues
-            count = len(values)
-
-        data['count-%s' % name] = count
-        if min is not None:
-            data['min-%s' % name] = min
-            data['max-%s' % name] = max
-            values.sort()
-            if count == 1:
-                data['median-%s' % name] = min
-            else:
-                if count % 2 != 0:
-                    data['median-%s' % name] = values[count // 2]
-                else:
-                    half = count // 2
+                values = []
+                for item in chunk:
                     try:
-                        data['median-%s' %
-                             name] = (values[half] + values[half - 1]) // 2
+                        if mapping:
+                            item = item[name]
+                        else:
+                            try:
+                                item = getattr(item, name)
+                            except Exception:
+                                if name != 'item':
+                                    raise
                     except Exception:
-                        try:
-                            data['median-%s' %
-                                 name] = ("between {} and {}".format(
-                                     values[half], values[half - 1]))
-                        except Exception:
-                            pass
-
-        return data[key]
+                        continue
+                    values.append(item)
+            yield values
 
     def next_batches(self, suffix='batches', key=''):
         if suffix != 'batches':
             raise KeyError(key)
-        data = self.data
-        sequence = self.items
-        try:
-            if not data['next-sequence']:
-                return ()
-            sz = data['sequence-step-size']
-            start = data['sequence-step-start']
-            end = data['sequence-step-end']
-            l_ = len(sequence)
-            orphan = data['sequence-step-orphan']
-            overlap = data['sequence-step-overlap']
-        except Exception:
-            pass
-        r = []
-        while end < l_:
-            start, end, spam = opt(end + 1 - overlap, 0, sz, orphan, sequence)
-            v = sequence_variables(self.items, self.query_string,
-                                   self.start_name_re)
-            d = v.data
-            d['batch-start-index'] = start - 1
-            d['batch-end-index'] = end - 1
-            d['batch-size'] = end + 1 - start
-            d['mapping'] = data['mapping']
-            r.append(v)
-        data['next-batches'] = r
+        if not self.next:
+            return ()
+        r = self.data['next-batches'] = NextBatches(self)
         return r
 
     def previous_batches(self, suffix='batches', key=''):
         if suffix != 'batches':
             raise KeyError(key)
-        data = self.data
-        sequence = self.items
-        try:
-            if not data['previous-sequence']:
-                return ()
-            sz = data['sequence-step-size']
-            start = data['sequence-step-start']
-            end = data['sequence-step-end']
-            orphan = data['sequence-step-orphan']
-            overlap = data['sequence-step-overlap']
-        except Exception:
-            pass
-        r = []
-        while start > 1:
-            start, end, spam = opt(0, start - 1 + overlap, sz, orphan,
-                                   sequence)
-            v = sequence_variables(self.items, self.query_string,
-                                   self.start_name_re)
-            d = v.data
-            d['batch-start-index'] = start - 1
-            d['batch-end-index'] = end - 1
-            d['batch-size'] = end + 1 - start
-            d['mapping'] = data['mapping']
-            r.append(v)
-        r.reverse()
-        data['previous-batches'] = r
+        if not self.previous:
+            return ()
+        r = self.data['previous-batches'] = PreviousBatches(self)
         return r
 
+    def batch(self, start, end):
+        """Return the variables of the batch from `start` to `end`."""
+        v = sequence_variables(self.items, self.query_string,
+                               self.start_name_re)
+        d = v.data
+        d['batch-start-index'] = start - 1
+        d['batch-end-index'] = end - 1
+        d['batch-size'] = end + 1 - start
+        d['mapping'] = self.data['mapping']
+        return v
+
     special_prefixes = {
         'first': first,
         'last': last,
@@ -345,21 +337,74 @@ class sequence_variables:
     for n in statistic_names:
         special_prefixes[n] = statistics
 
+    # The variables computed from the index of an item, for example
+    # 'sequence-even' or 'batch-end-number', and their methods.
+    index_methods = {
+        'number': number,
+        'even': even,
+        'odd': odd,
+        'letter': letter,
+        'Letter': Letter,
+        'key': key,
+        'item': item,
+        'roman': roman,
+        'Roman': Roman,
+        'length': length,
+        'query': query,
+    }
+    # The variables of the current item, looked up without parsing them.
+    sequence_getters = {name: attrgetter(slot)
+                        for name, slot in state_names.items()}
+    sequence_getters.update(('sequence-' + suffix, index_getter(method))
+                            for suffix, method in index_methods.items())
+    sequence_getters['sequence-index'] = current
+    sequence_getters['sequence-query'] = query
+
+    @classmethod
+    def prefixed(cls, alt_prefix):
+        """Return the variables of the current item, including the ones
+        with `alt_prefix`."""
+        getters = dict(cls.sequence_getters)
+        for name, getter in cls.sequence_getters.items():
+            if name.startswith('sequence-'):
+                name = name[9:]
+            getters[alt_prefix + name] = getter
+        return getters
+
     def __setitem__(self, key, value):
+        slot = self.state_names.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+            return
         self.data[key] = value
         if self.alt_prefix:
             if key.startswith('sequence-'):
                 key = key[9:]
             self.data[self.alt_prefix + key] = value
 
-    def __getitem__(self,
-                    key,
-                    special_prefixes=special_prefixes,
-                    special_prefix=special_prefixes.__contains__):
+    def __getitem__(self, key):
         data = self.data
         if key in data:
             return data[key]
 
+        getter = self.getters.get(key)
+        if getter is not None:
+            return getter(self)
+
+        if key.startswith('sequence-var-') and '-' not in key[13:]:
+            index = self.index
+            if index is not None:
+                try:
+                    return self.value(index, key[13:])
+                except Exception:
+                    pass
+
+        return self.lookup(key)
+
+    def lookup(self, key,
+               special_prefixes=special_prefixes,
+               special_prefix=special_prefixes.__contains__):
+        """Look up the variable `key` that is not the current state."""
         l_ = key.rfind('-')
         if l_ < 0:
             alt_prefix = self.alt_prefix
@@ -378,13 +423,13 @@ class sequence_variables:
             suffix = key[l_ + 1:]
             prefix = key[:l_]
 
-        if hasattr(self, suffix):
+        if suffix in self.index_methods:
             try:
-                v = data[prefix + '-index']
+                v = self.index_of(prefix)
             except Exception:
                 pass
             else:
-                return getattr(self, suffix)(v)
+                return self.index_methods[suffix](self, v)
 
         if special_prefix(prefix):
             return special_prefixes[prefix](self, suffix, key)
@@ -392,7 +437,7 @@ class sequence_variables:
         if prefix[-4:] == '-var':
             prefix = prefix[:-4]
             try:
-                return self.value(data[prefix + '-index'], suffix)
+                return self.value(self.index_of(prefix), suffix)
             except Exception:
                 pass
 
@@ -401,6 +446,391 @@ class sequence_variables:
 
         raise KeyError(key)
 
+    def index_of(self, prefix):
+        """Return the index of the item of `prefix`, for example the one
+        of 'batch-start'."""
+        if prefix == 'sequence':
+            return self.current()
+        return self.data[prefix + '-index']
+
+
+# Values of these types are added up without checking every value.
+NUMBER_TYPES = frozenset((int, float, bool))
+
+
+class Summary:
+    """Summary statistics of the values of a variable.
+
+    `column` returns an iterable of lists of the values and `length` is
+    the number of items they come from.  The count, total, extremes and
+    the sums for the mean and the variance are accumulated in one pass
+    over the values when the first of them is asked for, without keeping
+    the values; only the median needs all of them.  Values that can be
+    multiplied and added to the sums are numbers, like Decimal values.
+    If there are numbers among the values, the statistics are those of
+    the numbers, otherwise only the count, minimum, maximum and median of
+    the values that are not missing are available.  Statistics that are
+    not available are empty strings.
+    """
+
+    def __init__(self, column, length=0):
+        self.column = column
+        self.length = length
+        self.sums = None
+        self.results = {}
+
+    def __getitem__(self, stat):
+        results = self.results
+        if stat not in results:
+            results[stat] = getattr(self, stat.replace('-', '_'))()
+        return results[stat]
+
+    def accumulate(self, keep=False):
+        sums = self.sums
+        if sums is None or keep:
+            sums = Sums(keep)
+            for values in self.column():
+                sums.add(values)
+            if not keep:
+                self.sums = sums
+        return sums
+
+    def count(self):
+        sums = self.accumulate()
+        return sums.count if sums.count else sums.others
+
+    def min(self):
+        sums = self.accumulate()
+        low = sums.low if sums.count else sums.other_low
+        return '' if low is None else low
+
+    def max(self):
+        sums = self.accumulate()
+        high = sums.high if sums.count else sums.other_high
+        return '' if high is None else high
+
+    def total(self):
+        sums = self.accumulate()
+        return sums.total if sums.count else ''
+
+    def mean(self):
+        sums = self.accumulate()
+        if not sums.count:
+            return ''
+        return divide(sums.total, sums.count)
+
+    def variance_n(self):
+        sums = self.accumulate()
+        if not sums.count:
+            return ''
+        mean = self['mean']
+        return divide(sums.sumsq, sums.count) - mean * mean
+
+    def variance(self):
+        count = self.accumulate().count
+        if count < 2:
+            return ''
+        return divide(self['variance-n'] * count, count - 1)
+
+    def standard_deviation_n(self):
+        variance = self['variance-n']
+        return '' if variance == '' else sqrt(max(variance, 0.0))
+
+    def standard_deviation(self):
+        variance = self['variance']
+        return '' if variance == '' else sqrt(max(variance, 0.0))
+
+    def median(self):
+        if self.accumulate().checked:
+            # Which values are numbers depends on the sums before them.
+            sums = self.accumulate(keep=True)
+            values = sums.numbers if sums.count else sums.other_values
+        else:
+            values = []
+            for chunk in self.column():
+                values.extend(chunk)
+        count = len(values)
+        if not count:
+            return ''
+        half = count // 2
+        array = None
+        if numpy is not None and count >= NUMPY_MIN_COUNT and \
+           set(map(type, values)) in ({int}, {float}):
+            array = numpy.array(values)
+        if array is not None and array.dtype != object:
+            # Partitioning finds the middle values without sorting.
+            middle = numpy.partition(array, [half - 1, half])
+            low, high = middle[[half - 1, half]].tolist()
+        else:
+            try:
+                values.sort()
+            except TypeError:
+                return ''
+            low, high = values[half - 1], values[half]
+        if count % 2:
+            return high
+        try:
+            return (high + low) // 2
+        except Exception:
+            try:
+                return f"between {high} and {low}"
+            except Exception:
+                return ''
+
+
+def divide(total, count):
+    """Divide `total` by the number `count` as a float, or as it is for
+    numbers that do not mix with floats, like Decimal values."""
+    try:
+        return total / float(count)
+    except TypeError:
+        return total / count
+
+
+class Sums:
+    """The count, total, sum of squares and extremes of numbers, and the
+    count and extremes of other values, accumulated in chunks.
+
+    The numbers are added up one after the other, also with numpy, so
+    that the results do not depend on the size of the chunks.  A value is
+    a number if it can be multiplied with itself and added to the sums
+    so far, as with the formulas the statistics always had.  With `keep`
+    the numbers and the other values are kept in lists.  `checked` tells
+    whether values were checked one by one, otherwise all of them are
+    plain numbers.
+    """
+
+    def __init__(self, keep=False):
+        self.count = self.total = self.sumsq = 0
+        self.low = self.high = None
+        self.others = 0
+        self.other_low = self.other_high = None
+        self.ordered = True
+        self.checked = False
+        self.numbers = self.other_values = None
+        if keep:
+            self.numbers = []
+            self.other_values = []
+
+    def add(self, values):
+        types = set(map(type, values))
+        if types <= NUMBER_TYPES and type(self.total) in NUMBER_TYPES and \
+           type(self.sumsq) in NUMBER_TYPES:
+            if values:
+                self.add_numbers(values, types)
+            return
+        self.checked = True
+        for value in values:
+            if value is not None and value is not mv:
+                self.add_value(value)
+
+    def add_value(self, value):
+        try:
+            if isinstance(value, int):
+                square = value * int(value)
+            else:
+                square = value * value
+            total = self.total + value
+            sumsq = self.sumsq + square
+            if self.low is not None:
+                low = value < self.low
+                high = value > self.high
+        except TypeError:
+            self.add_other(value)
+            return
+        except Exception:
+            # The value is left out, as always.
+            return
+        self.total = total
+        self.sumsq = sumsq
+        self.count += 1
+        if self.low is None:
+            self.low = self.high = value
+        else:
+            if low:
+                self.low = value
+            if high:
+                self.high = value
+        if self.numbers is not None:
+            self.numbers.append(value)
+
+    def add_numbers(self, values, types):
+        array = None
+        if numpy is not None and len(values) >= NUMPY_MIN_COUNT:
+            array = self.add_vectorized(values, types)
+        if array is None:
+            self.total = reduce(add, values, self.total)
+            self.sumsq = reduce(add, map(mul, values, values), self.sumsq)
+            low, high = min(values), max(values)
+        else:
+            low, high = array.min().item(), array.max().item()
+        self.count += len(values)
+        if self.numbers is not None:
+            self.numbers.extend(values)
+        if self.low is None:
+            self.low, self.high = low, high
+        else:
+            if low < self.low:
+                self.low = low
+            if high > self.high:
+                self.high = high
+
+    def add_vectorized(self, values, types):
+        """Add the sums of `values` computed with numpy and return them
+        as an array, if they are all integers or all floats, or None.
+
+        Integers are only summed by numpy if the sums cannot overflow.
+        """
+        if types == {float}:
+            array = numpy.array(values, dtype=float)
+            sums = array * array
+            sums[0] += float(self.sumsq)
+            self.sumsq = float(numpy.add.accumulate(sums)[-1])
+            sums = array.copy()
+            sums[0] += float(self.total)
+            self.total = float(numpy.add.accumulate(sums)[-1])
+            return array
+        if types == {int} and type(self.total) is int:
+            try:
+                array = numpy.array(values, dtype=numpy.int64)
+            except OverflowError:
+                return None
+            bound = max(-int(array.min()), int(array.max()))
+            if bound * bound * len(values) >= 1 << 63:
+                return None
+            self.total += int(array.sum())
+            self.sumsq += int(numpy.dot(array, array))
+            return array
+        return None
+
+    def add_other(self, value):
+        self.others += 1
+        if self.other_values is not None:
+            self.other_values.append(value)
+        if not self.ordered:
+            return
+        if self.other_low is None:
+            self.other_low = self.other_high = value
+        else:
+            try:
+                if value < self.other_low:
+                    self.other_low = value
+                if value > self.other_high:
+                    self.other_high = value
+            except TypeError:
+                # Without an order there are no extremes.
+                self.ordered = False
+                self.other_low = self.other_high = None
+
+
+class Batches:
+    """The batches before or after the current batch.
+
+    The batches are computed when they are accessed, so that neither the
+    sequence nor all batches have to be loaded for showing a few of
+    them, e.g. with a slice, and only the length of the last batch needs
+    the length of the sequence.
+    """
+
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __init__(self, variables):
+        data = variables.data
+        self.variables = variables
+        self.sequence = variables.items
+        self.size = data['sequence-step-size']
+        self.orphan = data['sequence-step-orphan']
+        self.overlap = data['sequence-step-overlap']
+        # Batches overlapping completely would never end.
+        self.step = max(self.size - self.overlap, 1)
+        self.start = data['sequence-step-start']
+        self.end = data['sequence-step-end']
+
+    def has(self, index):
+        try:
+            self.sequence[index]
+        except Exception:
+            return False
+        return True
+
+    def __bool__(self):
+        return self.exists(0)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or not self.exists(index):
+            raise IndexError(index)
+        return self.variables.batch(*self.bounds(index))
+
+
+class NextBatches(Batches):
+    """The batches after the current batch."""
+
+    def exists(self, index):
+        if not index:
+            return self.has(self.end)
+        # The batch before ends before the end of the sequence and does
+        # not take the rest as orphans.
+        end = self.first() + (index - 1) * self.step + self.size - 1
+        return self.has(end + max(self.orphan - 1, 0))
+
+    def first(self):
+        return self.end + 1 - self.overlap
+
+    def bounds(self, index):
+        return opt(self.first() + index * self.step, 0, self.size,
+                   self.orphan, self.sequence)[:2]
+
+    def __len__(self):
+        length = len(self.sequence)
+        if self.end >= length:
+            return 0
+        rest = (length - self.first() - self.size + 1
+                - max(self.orphan - 1, 0))
+        return 1 + max(-(-rest // self.step), 0)
+
+
+class PreviousBatches(Batches):
+    """The batches before the current batch, beginning with the first."""
+
+    def __init__(self, variables):
+        super().__init__(variables)
+        if self.start > 1:
+            # The end of the first batch before the current may have to
+            # be moved to the end of the sequence, so it does not fit
+            # the steps of the others.
+            self.last = opt(0, self.start - 1 + self.overlap, self.size,
+                            self.orphan, self.sequence)[:2]
+            start = self.last[0]
+            if start > 1:
+                self.length = 2 + max(
+                    (start - 1 - max(self.orphan, 1)) // self.step, 0)
+            else:
+                self.length = 1
+        else:
+            self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def exists(self, index):
+        return index < self.length
+
+    def bounds(self, index):
+        index = self.length - 1 - index
+        if not index:
+            return self.last
+        start = self.last[0] - (index - 1) * self.step
+        return opt(0, start - 1 + self.overlap, self.size, self.orphan,
+                   self.sequence)[:2]
+
 
 def opt(start, end, size, orphan, sequence):
     if size < 1:
@@ -42,6 +42,7 @@
 
 import re
 
+from ._DocumentTemplate import iter_blocks
 from ._DocumentTemplate import render_blocks
 from .DT_Util import Eval
 from .DT_Util import ParseError
@@ -73,21 +74,33 @@ class Let:
                         '\n<pre>\n%s\n</pre>\n' % v.args[0],
                         'let')
 
+    def assign(self, d, md):
+        for name, expr in self.args:
+            if isinstance(expr, str):
+                d[name] = md[expr]
+            else:
+                d[name] = expr(md)
+
     def render(self, md):
         d = {}
         md._push(d)
         try:
-            for name, expr in self.args:
-                if isinstance(expr, str):
-                    d[name] = md[expr]
-                else:
-                    d[name] = expr(md)
+            self.assign(d, md)
             return render_blocks(self.section, md, encoding=self.encoding)
         finally:
             md._pop(1)
 
     __call__ = render
 
+    def iter_render(self, md):
+        d = {}
+        md._push(d)
+        try:
+            self.assign(d, md)
+            yield from iter_blocks(self.section, md, encoding=self.encoding)
+        finally:
+            md._pop(1)
+
 
 def parse_let_params(
         text,
@@ -11,8 +11,18 @@
 #
 ##############################################################################
 
+import copyreg
+import hashlib
+import importlib.metadata
+import importlib.util
+import io
+import marshal
 import os
+import pickle
 import re
+import tempfile
+import types
+import uuid
 from threading import Lock
 
 from AccessControl.class_init import InitializeClass
@@ -20,8 +30,13 @@ from AccessControl.SecurityInfo import ClassSecurityInfo
 
 import DocumentTemplate as _dt
 
+from ._DocumentTemplate import CompiledBlocks
 from ._DocumentTemplate import InstanceDict
 from ._DocumentTemplate import TemplateDict
+from ._DocumentTemplate import compile_blocks
+from ._DocumentTemplate import encode_text
+from ._DocumentTemplate import iter_blocks
+from ._DocumentTemplate import join_unicode
 from ._DocumentTemplate import render_blocks
 from .DT_Return import DTReturn
 from .DT_Return import ReturnTag
@@ -29,6 +44,7 @@ from .DT_Util import ParseError
 from .DT_Var import Call
 from .DT_Var import Comment
 from .DT_Var import Var
+from .ustr import ustr
 
 
 _marker = []  # Create a new marker object.
@@ -94,9 +110,20 @@ class String:
         'raise': ('raise', 'DT_Raise', 'Raise'),
         'try': ('try', 'DT_Try', 'Try'),
         'let': ('let', 'DT_Let', 'Let'),
+        'cache': ('cache', 'DT_Cache', 'Cache'),
         'return': ReturnTag,
     }
 
+    # Set to a true value to render cooked templates through generated
+    # Python code instead of interpreting the block tree.
+    security.declarePrivate('compile_blocks')  # NOQA: D001
+    compile_blocks = False
+
+    # Set to a true value to let the namespace of top-level renderings
+    # remember where names were found, see TemplateDict.lookup_cache_info.
+    security.declarePrivate('cache_lookups')  # NOQA: D001
+    cache_lookups = False
+
     @security.private
     def SubTemplate(self, name):
         return String('', __name__=name)
@@ -176,16 +203,34 @@ class String:
 
     @security.private
     def parse(self, text, start=0, result=None, tagre=None):
+        """Parse `text` into a list of blocks.
+
+        The text is scanned once.  Block tags that are still open are
+        kept on a stack together with the sections parsed so far.
+        """
         if result is None:
-            result = []
+            result = self.new_blocks()
         if tagre is None:
             tagre = self.tagre()
+
+        # If this is an older object without encoding set we use the old
+        # pre-Zope 4 default.
+        encoding = getattr(self, 'encoding', _dt.OLD_DEFAULT_ENCODING)
+
+        # State of the innermost open block tag: its command, start tag,
+        # start location and arguments, the sections completed so far,
+        # and the name, tag and arguments of the current section.
+        scommand = stag = sloc = None
+        sa = ''
+        blocks = tname = sname = sargs = None
+        stack = []
+
         mo = tagre.search(text, start)
         while mo:
             l_ = mo.start(0)
 
             try:
-                tag, args, command, coname = self._parseTag(mo)
+                tag, args, command, coname = self._parseTag(mo, scommand, sa)
             except ParseError as m:
                 self.parse_error(m.args[0], m.args[1], text, l_)
 
@@ -195,9 +240,17 @@ class String:
             start = l_ + len(tag)
 
             if hasattr(command, 'blockContinuations'):
-                start = self.parse_block(text, start, result, tagre,
-                                         tag, l_, args, command)
-            else:
+                # New open tag, its sections are collected until the
+                # closing tag is found.
+                stack.append((scommand, stag, sloc, sa, blocks,
+                              tname, sname, sargs, result))
+                scommand, stag, sloc, sa = command, tag, l_, args
+                blocks = []
+                tname, sname, sargs = command.name, tag, args
+                result = self.new_blocks()
+                start = self.skip_eol(text, start)
+
+            elif command:
                 try:
                     if command is Var:
                         r = command(args, self.varExtra(mo))
@@ -209,101 +262,58 @@ class String:
                 except ParseError as m:
                     self.parse_error(m.args[0], tag, text, l_)
 
-            mo = tagre.search(text, start)
-
-        text = text[start:]
-        if text:
-            result.append(text)
-        return result
-
-    @security.private
-    def skip_eol(self, text, start, eol=re.compile('[ \t]*\n')):
-        # if block open is followed by newline, then skip past newline
-        mo = eol.match(text, start)
-        if mo is not None:
-            start = start + mo.end(0) - mo.start(0)
-
-        return start
-
-    @security.private
-    def parse_block(self, text, start, result, tagre,
-                    stag, sloc, sargs, scommand):
-
-        start = self.skip_eol(text, start)
-
-        # If this is an older object without encoding set we use the old
-        # pre-Zope 4 default.
-        encoding = getattr(self, 'encoding', _dt.OLD_DEFAULT_ENCODING)
-        blocks = []
-        tname = scommand.name
-        sname = stag
-        sstart = start
-        sa = sargs
-        while 1:
-
-            mo = tagre.search(text, start)
-            if mo is None:
-                self.parse_error('No closing tag', stag, text, sloc)
-            l_ = mo.start(0)
-
-            try:
-                tag, args, command, coname = self._parseTag(mo, scommand, sa)
-            except ParseError as m:
-                self.parse_error(m.args[0], m.args[1], text, l_)
-
-            if command:
-                start = l_ + len(tag)
-                if hasattr(command, 'blockContinuations'):
-                    # New open tag.  Need to find closing tag.
-                    start = self.parse_close(text, start, tagre, tag, l_,
-                                             command, args)
             else:
                 # Either a continuation tag or an end tag
                 section = self.SubTemplate(sname)
-                section._v_blocks = section.blocks = self.parse(
-                    text[:l_], sstart)
+                section._v_blocks = section.blocks = result
                 section._v_cooked = None
                 blocks.append((tname, sargs, section))
 
-                start = self.skip_eol(text, l_ + len(tag))
+                start = self.skip_eol(text, start)
 
                 if coname:
-                    tname = coname
-                    sname = tag
-                    sargs = args
-                    sstart = start
+                    tname, sname, sargs = coname, tag, args
+                    result = self.new_blocks()
                 else:
                     try:
                         r = scommand(blocks, encoding=encoding)
+                        if hasattr(r, 'set_source'):
+                            # The source of the whole block tag.
+                            r.set_source(text[sloc:start])
                         if hasattr(r, 'simple_form'):
                             r = r.simple_form
-                        result.append(r)
                     except ParseError as m:
                         self.parse_error(m.args[0], stag, text, l_)
 
-                    return start
+                    (scommand, stag, sloc, sa, blocks,
+                     tname, sname, sargs, result) = stack.pop()
+                    result.append(r)
 
-    @security.private
-    def parse_close(self, text, start, tagre, stag, sloc, scommand, sa):
-        while 1:
             mo = tagre.search(text, start)
-            if mo is None:
-                self.parse_error('No closing tag', stag, text, sloc)
-            l_ = mo.start(0)
 
-            try:
-                tag, args, command, coname = self._parseTag(mo, scommand, sa)
-            except ParseError as m:
-                self.parse_error(m.args[0], m.args[1], text, l_)
+        if stack:
+            self.parse_error('No closing tag', stag, text, sloc)
 
-            start = l_ + len(tag)
-            if command:
-                if hasattr(command, 'blockContinuations'):
-                    # New open tag.  Need to find closing tag.
-                    start = self.parse_close(text, start, tagre, tag, l_,
-                                             command, args)
-            elif not coname:
-                return start
+        text = text[start:]
+        if text:
+            result.append(text)
+        return result
+
+    @security.private
+    def new_blocks(self):
+        """Return an empty list for parsed blocks."""
+        if self.compile_blocks:
+            return CompiledBlocks()
+        return []
+
+    @security.private
+    def skip_eol(self, text, start, eol=re.compile('[ \t]*\n')):
+        # if block open is followed by newline, then skip past newline
+        mo = eol.match(text, start)
+        if mo is not None:
+            start = start + mo.end(0) - mo.start(0)
+
+        return start
 
     security.declarePrivate('shared_globals')  # NOQA: D001
     shared_globals = {}
@@ -442,7 +452,161 @@ class String:
 
         """
         encoding = getattr(self, 'encoding', None)
+        md, pushed, saved = self._push_namespace(client, mapping, kw)
+        try:
+            value = self.ZDocumentTemplate_beforeRender(md, _marker)
+            if value is _marker:
+                try:
+                    result = render_blocks(self._v_blocks, md,
+                                           encoding=encoding)
+                except DTReturn as v:
+                    result = v.v
+                self.ZDocumentTemplate_afterRender(md, result)
+                return result
+            else:
+                return value
+        finally:
+            self._pop_namespace(md, pushed, saved)
+
+    # The size in characters the chunks generated by iter_render grow to
+    # before they are handed out.
+    security.declarePrivate('stream_chunk_size')  # NOQA: D001
+    stream_chunk_size = 65536
 
+    def iter_render(self, client=None, mapping={}, **kw):
+        """Generate a document from a document template in chunks.
+
+        Takes the same arguments as calling the template, but returns an
+        iterator over the text of the document instead of the text, so
+        that large documents can be sent out while they are rendered.
+        Nested ``in``, ``with`` and ``let`` tags are rendered in chunks
+        as well, other tags are rendered in one go.
+
+        As the document is never held as a whole it is not passed to
+        ``ZDocumentTemplate_afterRender``.  A ``return`` tag can only
+        replace the document as long as no chunk was handed out yet.
+        """
+        encoding = getattr(self, 'encoding', None)
+        md, pushed, saved = self._push_namespace(client, mapping, kw)
+        try:
+            value = self.ZDocumentTemplate_beforeRender(md, _marker)
+            if value is not _marker:
+                yield value
+                return
+
+            chunk_size = self.stream_chunk_size
+            chunks = []
+            size = 0
+            sent = False
+            try:
+                for chunk in iter_blocks(self._v_blocks, md, encoding):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= chunk_size:
+                        sent = True
+                        yield join_unicode(chunks, encoding=encoding)
+                        chunks = []
+                        size = 0
+            except DTReturn as v:
+                if sent:
+                    raise
+                yield v.v
+                return
+            if chunks:
+                yield join_unicode(chunks, encoding=encoding)
+        finally:
+            self._pop_namespace(md, pushed, saved)
+
+    def render_to(self, out, client=None, mapping={}, output_encoding=None,
+                  **kw):
+        """Write a document generated from a document template to `out`.
+
+        `out` is a text or binary stream or a callable that gets called
+        with the text.  The text is encoded with `output_encoding` if it
+        is given, text written to binary streams is encoded with the
+        encoding of the template or UTF-8.
+
+        The other arguments are the same as for calling the template.
+        Nested ``in``, ``with`` and ``let`` tags write their text as it
+        is generated instead of returning it to be joined, see
+        `iter_render`.
+        """
+        write = getattr(out, 'write', out)
+        encoding = output_encoding
+        if encoding is None and isinstance(
+                out, (io.RawIOBase, io.BufferedIOBase)):
+            encoding = getattr(self, 'encoding', None) or 'utf-8'
+
+        for chunk in self.iter_render(client, mapping, **kw):
+            if not isinstance(chunk, str):
+                # The value of a return tag or a cached document.
+                if not isinstance(chunk, bytes):
+                    chunk = ustr(chunk)
+                chunk = join_unicode([chunk],
+                                     encoding=getattr(self, 'encoding', None))
+            if encoding is not None:
+                chunk = chunk.encode(encoding)
+            write(chunk)
+
+    def render_encoded(self, client=None, mapping={}, output_encoding=None,
+                       **kw):
+        """Generate a document from a document template as bytes.
+
+        Takes the same arguments as calling the template and returns the
+        text encoded with `output_encoding`, by default the encoding of
+        the template or UTF-8.  The literal text of compiled templates is
+        encoded once, only inserted values are encoded while rendering.
+
+        The document is not passed to ``ZDocumentTemplate_afterRender``,
+        which expects text.
+        """
+        encoding = getattr(self, 'encoding', None)
+        if output_encoding is None:
+            output_encoding = encoding or 'utf-8'
+        md, pushed, saved = self._push_namespace(client, mapping, kw)
+        try:
+            value = self.ZDocumentTemplate_beforeRender(md, _marker)
+            if value is _marker:
+                render = self._encoded_renderer(output_encoding)
+                rendered = []
+                try:
+                    render(rendered, md, encoding)
+                except DTReturn as v:
+                    value = v.v
+                else:
+                    return b''.join(rendered)
+            if not isinstance(value, (str, bytes)):
+                value = ustr(value)
+            return encode_text(value, encoding, output_encoding)
+        finally:
+            self._pop_namespace(md, pushed, saved)
+
+    @security.private
+    def _encoded_renderer(self, output_encoding):
+        """Return the function rendering the blocks encoded with
+        `output_encoding`.
+
+        The top-level blocks are compiled for every output encoding, also
+        if `compile_blocks` is not set, so that their literal text is
+        encoded once.  Tags render their sections to text as usual.
+        """
+        blocks = self._v_blocks
+        renderers = getattr(self, '_v_encoded', None)
+        if renderers is None or renderers[0] is not blocks:
+            renderers = self._v_encoded = (blocks, {})
+        render = renderers[1].get(output_encoding)
+        if render is None:
+            render = renderers[1][output_encoding] = compile_blocks(
+                blocks, output_encoding)
+        return render
+
+    @security.private
+    def _push_namespace(self, client, mapping, kw):
+        """Set up the namespace to render the template in.
+
+        Returns the namespace, the number of mappings pushed onto it and
+        the state to restore with `_pop_namespace` when done.
+        """
         if mapping is None:
             mapping = {}
         if hasattr(mapping, 'taintWrapper'):
@@ -476,6 +640,8 @@ class String:
                 pushed = pushed + 1
         else:
             md = TemplateDict()
+            if self.cache_lookups:
+                md._enable_lookup_cache()
             push = md._push
             shared_globals = self.shared_globals
             if shared_globals:
@@ -486,6 +652,7 @@ class String:
                 push(mapping)
             md.guarded_getattr = self.guarded_getattr
             md.guarded_getitem = self.guarded_getitem
+            md.guarded_filter = self.guarded_filter
             if client is not None:
                 if isinstance(client, tuple):
                     md.this = client[-1]
@@ -497,6 +664,8 @@ class String:
         if level > 200:
             raise SystemError('infinite recursion in document template')
         md.level = level + 1
+        template = md._template
+        md._template = self
 
         if client is not None:
             if isinstance(client, tuple):
@@ -518,25 +687,38 @@ class String:
             push(kw)
             pushed = pushed + 1
 
+        return md, pushed, (level, template)
+
+    @security.private
+    def _pop_namespace(self, md, pushed, saved):
+        """Restore the namespace after rendering the template in it."""
+        if pushed:
+            md._pop(pushed)  # Get rid of circular reference!
+        # Restore the previous level and template
+        md.level, md._template = saved
+
+    @security.private
+    def _cache_identity(self):
+        """Return what tells the template apart in the keys of the text
+        cached by its 'cache' tags.
+
+        This is the physical path of templates stored in a Zope
+        application, otherwise an id made up for this template object.
+        """
         try:
-            value = self.ZDocumentTemplate_beforeRender(md, _marker)
-            if value is _marker:
-                try:
-                    result = render_blocks(self._v_blocks, md,
-                                           encoding=encoding)
-                except DTReturn as v:
-                    result = v.v
-                self.ZDocumentTemplate_afterRender(md, result)
-                return result
-            else:
-                return value
-        finally:
-            if pushed:
-                md._pop(pushed)  # Get rid of circular reference!
-            md.level = level  # Restore previous level
+            path = self.getPhysicalPath()
+        except Exception:
+            path = None
+        if path and len(path) > 1 and path[0] == '':
+            return '/'.join(path)
+        identity = getattr(self, '_v_cache_identity', None)
+        if identity is None:
+            identity = self._v_cache_identity = uuid.uuid4().hex
+        return identity
 
     guarded_getattr = None
     guarded_getitem = None
+    guarded_filter = None
 
     def __str__(self):
         return self.read()
@@ -554,10 +736,78 @@ class String:
 InitializeClass(String)
 
 
+try:
+    _dt_version = importlib.metadata.version('DocumentTemplate')
+except importlib.metadata.PackageNotFoundError:  # pragma: no cover
+    _dt_version = ''
+
+# Bump whenever the layout of cached parse results changes.
+CACHE_FORMAT = 2
+
+
+def _reduce_code(code):
+    return marshal.loads, (marshal.dumps(code), )
+
+
+class BlockPickler(pickle.Pickler):
+    """Pickler for cooked blocks, which may contain compiled expressions."""
+
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[types.CodeType] = _reduce_code
+
+
+def load_cached_blocks(filename, header):
+    """Return the blocks stored in `filename` or None.
+
+    The blocks are only returned if they were stored with the given
+    `header`.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            unpickler = pickle.Unpickler(f)
+            if unpickler.load() != header:
+                return None
+            return unpickler.load()
+    except Exception:
+        # A missing, damaged or outdated cache file, the template gets
+        # parsed.
+        return None
+
+
+def store_cached_blocks(filename, header, blocks):
+    """Store `blocks` in `filename`, return whether this succeeded."""
+    directory = os.path.dirname(filename)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickler = BlockPickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.dump(header)
+            pickler.dump(blocks)
+        os.replace(tmp, filename)
+    except Exception:
+        # Not all tags can be pickled, the cache is just an optimization.
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
 class FileMixin:
     # Mix-in class to abstract certain file-related attributes
     edited_source = ''
 
+    # Directory in which parsed templates are stored across processes,
+    # set it to enable the cache.  The cache directory must only be
+    # writable by trusted users as cached templates are loaded using
+    # pickle.
+    cache_directory = None
+
     security = ClassSecurityInfo()
 
     def __init__(self, file_name='', mapping=None, __name__='', **vars):
@@ -583,6 +833,32 @@ class FileMixin:
             return raw
         return ''
 
+    @security.private
+    def cook(self):
+        if self.edited_source or not self.raw or not self.cache_directory:
+            return super().cook()
+
+        with COOKLOCK:
+            path = os.path.abspath(self.raw)
+            mtime = os.stat(path).st_mtime_ns
+            source = self.read()
+            klass = self.__class__
+            encoding = getattr(self, 'encoding', None)
+            key = '\0'.join((klass.__module__, klass.__qualname__, path,
+                             str(encoding), str(bool(self.compile_blocks))))
+            filename = os.path.join(
+                self.cache_directory,
+                hashlib.sha256(key.encode('utf-8')).hexdigest() + '.dtml')
+            header = (CACHE_FORMAT, importlib.util.MAGIC_NUMBER, _dt_version,
+                      mtime, hashlib.sha256(source.encode('utf-8')).digest())
+
+            blocks = load_cached_blocks(filename, header)
+            if blocks is None:
+                blocks = self.parse(source)
+                store_cached_blocks(filename, header, blocks)
+            self._v_blocks = blocks
+            self._v_cooked = None
+
 
 InitializeClass(FileMixin)
 
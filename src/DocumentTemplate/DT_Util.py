@@ -13,6 +13,8 @@
 """DTML Utilities
 """
 
+import ast
+import functools
 import re
 import string
 from types import BuiltinFunctionType
@@ -20,6 +22,7 @@ from types import FunctionType
 
 from AccessControl.tainted import TaintedString
 from AccessControl.ZopeGuards import _safe_globals
+from RestrictedPython.compile import compile_restricted_eval
 from RestrictedPython.Eval import RestrictionCapableEval
 from RestrictedPython.Guards import safe_builtins
 from RestrictedPython.Utilities import utility_builtins
@@ -153,6 +156,27 @@ TemplateDict.getattr = careful_getattr
 TemplateDict.hasattr = careful_hasattr
 
 
+def guarded_items(md, sequence, start, end):
+    """Return the items of `sequence` from `start` to `end` that may be
+    accessed, as a dict by index.
+
+    The 'guarded_filter' method of the template decides for all items at
+    once, if there is one, otherwise 'guarded_getitem' is called for
+    every item.
+    """
+    guarded_filter = getattr(md, 'guarded_filter', None)
+    if guarded_filter is not None:
+        return dict(guarded_filter(sequence, start, end))
+    getitem = md.guarded_getitem
+    items = {}
+    for index in range(start, end):
+        try:
+            items[index] = getitem(sequence, index)
+        except ValidationError:
+            pass
+    return items
+
+
 def namespace(self, **kw):
     """Create a tuple consisting of a single instance whose attributes are
     provided as keyword arguments."""
@@ -185,7 +209,46 @@ def render(self, v):
 TemplateDict.render = render
 
 
+# The number of compiled expressions shared between all Eval instances.
+# The caches are created with this size when the module is imported,
+# changing it later has no effect.
+EVAL_CACHE_SIZE = 2000
+
+
+@functools.lru_cache(maxsize=EVAL_CACHE_SIZE)
+def compile_unrestricted(expr):
+    """Compile `expr`, return the code and the names the expression uses."""
+    exp_node = ast.parse(expr, '<string>', 'eval')
+    code = compile(exp_node, '<string>', 'eval')
+    used = {node.id for node in ast.walk(exp_node)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    return code, tuple(used)
+
+
+@functools.lru_cache(maxsize=EVAL_CACHE_SIZE)
+def compile_restricted(expr):
+    """Compile `expr` with restrictions, return the code and used names."""
+    result = compile_restricted_eval(expr, '<string>')
+    if result.errors:
+        raise SyntaxError(result.errors[0])
+    return result.code, tuple(result.used_names)
+
+
 class Eval(RestrictionCapableEval):
+    """Python expression in a document template.
+
+    Compiled code is shared between all expressions with the same text.
+    """
+
+    def prepRestrictedCode(self):
+        if self.rcode is None:
+            self.rcode, self.used = compile_restricted(self.expr)
+
+    def prepUnrestrictedCode(self):
+        if self.ucode is None:
+            self.ucode, used = compile_unrestricted(self.expr)
+            if self.used is None:
+                self.used = used
 
     def eval(self, md):
         gattr = getattr(md, 'guarded_getattr', None)
@@ -505,3 +568,53 @@ class SequenceFromIter:
             except IndexError:
                 pass
         return len(self.data)
+
+
+class SequenceWindow:
+    """Forward-only view of an iterator.
+
+    Only the items from the one before the current item on are kept, so
+    that the items can be inserted one after the other in constant
+    memory.  Earlier items are discarded and the length is unknown.
+    """
+
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    finished = False
+
+    def __init__(self, it):
+        self.it = it
+        self.start = 0  # the index of the first item in data
+        self.data = []
+
+    def has(self, idx):
+        """Return whether there is an item at `idx`."""
+        data = self.data
+        while not self.finished and idx >= self.start + len(data):
+            try:
+                data.append(next(self.it))
+            except StopIteration:
+                self.finished = True
+        return self.start <= idx < self.start + len(data)
+
+    def move(self, idx):
+        """Make `idx` the current index and discard the items before the
+        one before it.  Return whether there is an item at `idx`."""
+        discard = idx - 1 - self.start
+        if discard > 0:
+            del self.data[:discard]
+            self.start += discard
+        return self.has(idx)
+
+    def __getitem__(self, idx):
+        if idx < self.start:
+            raise IndexError(f"item {idx} was discarded")
+        if not self.has(idx):
+            raise IndexError(idx)
+        return self.data[idx - self.start]
+
+    def __len__(self):
+        raise TypeError('the length of a stream is unknown')
+
+    def __iter__(self):
+        raise TypeError('a stream can only be inserted once')
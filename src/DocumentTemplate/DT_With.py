@@ -34,6 +34,7 @@
 
 from ._DocumentTemplate import InstanceDict
 from ._DocumentTemplate import TemplateDict
+from ._DocumentTemplate import iter_blocks
 from ._DocumentTemplate import render_blocks
 from .DT_Util import name_param
 from .DT_Util import parse_params
@@ -61,7 +62,9 @@ class With:
         if 'only' in args and args['only']:
             self.only = 1
 
-    def render(self, md):
+    def namespace(self, md):
+        # Return the namespace to render the section in and the data to
+        # push onto it.
         expr = self.expr
         if isinstance(expr, str):
             v = md[expr]
@@ -80,7 +83,13 @@ class With:
                 md.guarded_getattr = _md.guarded_getattr
             if hasattr(_md, 'guarded_getitem'):
                 md.guarded_getitem = _md.guarded_getitem
+            if hasattr(_md, 'guarded_filter'):
+                md.guarded_filter = _md.guarded_filter
+            md._template = getattr(_md, '_template', None)
+        return md, v
 
+    def render(self, md):
+        md, v = self.namespace(md)
         md._push(v)
         try:
             return render_blocks(self.section, md, encoding=self.encoding)
@@ -88,3 +97,11 @@ class With:
             md._pop(1)
 
     __call__ = render
+
+    def iter_render(self, md):
+        md, v = self.namespace(md)
+        md._push(v)
+        try:
+            yield from iter_blocks(self.section, md, encoding=self.encoding)
+        finally:
+            md._pop(1)
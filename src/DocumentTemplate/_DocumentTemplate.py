@@ -82,6 +82,13 @@ Access Control
     objects are accessed as instance attributes or when they are
     accessed through keyed access in an expression.
 
+    If provided, the 'guarded_filter' method will be called with a
+    sequence and the start and end index of a slice of it when items
+    that may not be accessed are skipped, for example with the
+    'skip_unauthorized' attribute of the 'in' tag.  It returns the
+    (index, item) pairs of the items that may be accessed, in order, so
+    that the decisions for many items can be made at once.
+
 Document Templates may be created 4 ways:
 
     DocumentTemplate.String -- Creates a document templated from a
@@ -103,6 +110,8 @@ Document Templates may be created 4 ways:
         from a named file.
 """
 
+from bisect import bisect_right
+
 from Acquisition import aq_base
 from ExtensionClass import Base
 from zExceptions import HTTPException
@@ -141,7 +150,10 @@ def join_unicode(rendered, encoding=None):
 def render_blocks(blocks, md, encoding=None):
     rendered = []
 
-    render_blocks_(blocks, rendered, md, encoding)
+    if isinstance(blocks, CompiledBlocks):
+        blocks.render_into(rendered, md, encoding)
+    else:
+        render_blocks_(blocks, rendered, md, encoding)
 
     l_ = len(rendered)
     if l_ == 0:
@@ -248,6 +260,318 @@ def render_blocks_(blocks, rendered, md, encoding):
             rendered.append(block)
 
 
+def iter_blocks(blocks, md, encoding=None):
+    """Generate the rendered text of a list of cooked blocks in chunks.
+
+    Tags that have an ``iter_render(md)`` method are streamed as well,
+    all other tags are called and their text is generated as one chunk.
+    """
+    for block in blocks:
+        if isinstance(block, tuple) and \
+           len(block) > 1 and \
+           isinstance(block[0], str):
+
+            first_char = block[0][0]
+            if first_char == 'v':  # var
+                t = block[1]
+                if isinstance(t, str):
+                    t = md[t]
+                else:
+                    t = t(md)
+                t = render_var(t, len(block) == 3, encoding)
+                if t:
+                    yield t
+
+            elif first_char == 'i':  # if
+                bs = len(block) - 1  # subtract code
+                cache = {}
+                md._push(cache)
+                try:
+                    m = bs - 1
+                    icond = 0
+                    while icond < m:
+                        cond = block[icond + 1]
+                        if isinstance(cond, str):
+                            # We have to be careful to handle key errors here
+                            n = cond
+                            try:
+                                cond = md[cond]
+                            except KeyError as t:
+                                if n != t.args[0]:
+                                    raise
+                                cond = None
+                            else:
+                                cache[n] = cond
+                        else:
+                            cond = cond(md)
+
+                        if cond:
+                            block = block[icond + 2]
+                            if block:
+                                yield from iter_blocks(block, md, encoding)
+                            m = -1
+                            break
+
+                        icond += 2
+
+                    if icond == m:
+                        block = block[icond + 1]
+                        if block:
+                            yield from iter_blocks(block, md, encoding)
+                finally:
+                    md._pop()
+
+            else:
+                raise ValueError(
+                    'Invalid DTML command code, %s', block[0])
+
+        elif isinstance(block, (str, bytes)):
+            if block:
+                yield block
+
+        else:
+            iter_render = getattr(block, 'iter_render', None)
+            if iter_render is None:
+                block = block(md)
+                if block:
+                    yield block
+            else:
+                yield from iter_render(md)
+
+
+def render_var(t, quote, encoding):
+    """Convert the value of a 'v' block to the text that gets inserted.
+
+    This is the slow path of the compiled renderer, it is used for every
+    value that is not a plain string, and the conversion of ``iter_blocks``.
+    """
+    if not isinstance(t, (str, bytes)):
+        # This might be a TaintedString object
+        untaintmethod = getattr(t, '__untaint__', None)
+        if untaintmethod is not None:
+            # Quote it
+            t = untaintmethod()
+            if not isinstance(t, (str, bytes)):
+                t = ustr(t)
+            return t
+        t = ustr(t)
+
+    if quote:
+        if isinstance(t, str):
+            if '&' in t or '<' in t or '>' in t or '"' in t:
+                t = html_quote(t, encoding=encoding)
+        else:
+            # never skip the quoting for byte strings
+            t = html_quote(t, encoding=encoding)
+    return t
+
+
+class CompiledBlocks(list):
+    """Cooked blocks rendered through a generated Python function.
+
+    The function is generated from the block tree the first time the
+    blocks are rendered.  It produces the same output as
+    ``render_blocks_`` but avoids the per block type dispatch.
+    """
+
+    _render = None
+
+    def __reduce__(self):
+        # The generated function is not pickled but regenerated on demand.
+        return self.__class__, (list(self), )
+
+    def render_into(self, rendered, md, encoding):
+        render = self._render
+        if render is None:
+            render = self._render = compile_blocks(self)
+        render(rendered, md, encoding)
+
+
+def compile_blocks(blocks, output_encoding=None):
+    """Compile a list of cooked blocks to a Python function.
+
+    The function is called with the list to append the rendered text
+    to, the namespace and the encoding.  If `output_encoding` is given,
+    the function appends the text encoded with it.
+    """
+    return BlockCompiler(output_encoding).compile(blocks)
+
+
+def encode_text(t, encoding, output_encoding):
+    """Encode text inserted into a document rendered to bytes.
+
+    Byte strings are taken to be encoded with the template `encoding`,
+    as in ``join_unicode``, and are only recoded if needed.
+    """
+    if isinstance(t, str):
+        return t.encode(output_encoding)
+    if encoding is None:
+        encoding = _dt.OLD_DEFAULT_ENCODING
+    if encoding == output_encoding:
+        return t
+    return t.decode(encoding).encode(output_encoding)
+
+
+class BlockCompiler:
+    """Generate the source of a render function from cooked blocks."""
+
+    # Sections nested deeper than this are compiled to functions of
+    # their own to stay well within the limits of the Python compiler.
+    max_depth = 24
+
+    def __init__(self, output_encoding=None):
+        self.output_encoding = output_encoding
+        self.lines = []
+        self.globals = {
+            '_render_var': render_var,
+            '_html_quote': html_quote,
+            '_encode_text': encode_text,
+            '_output_encoding': output_encoding,
+        }
+        self.caches = 0
+
+    def compile(self, blocks):
+        self.emit(0, 'def render_compiled(rendered, md, encoding):')
+        self.emit(1, 'append = rendered.append')
+        self.section(blocks, 1)
+        if self.caches:
+            self.lines[2:2] = ['    push = md._push', '    pop = md._pop']
+        code = compile('\n'.join(self.lines) + '\n', '<dtml>', 'exec')
+        exec(code, self.globals)
+        return self.globals['render_compiled']
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def constant(self, ob):
+        name = '_c%d' % len(self.globals)
+        self.globals[name] = ob
+        return name
+
+    def section(self, blocks, depth):
+        if depth > self.max_depth:
+            self.emit(depth, '%s(rendered, md, encoding)' % self.constant(
+                compile_blocks(blocks, self.output_encoding)))
+            return
+        start = len(self.lines)
+        for block in blocks:
+            if isinstance(block, tuple) and \
+               len(block) > 1 and \
+               isinstance(block[0], str):
+                first_char = block[0][0]
+                if first_char == 'v':
+                    self.var(block, depth)
+                elif first_char == 'i':
+                    self.if_(block, depth)
+                else:
+                    self.emit(depth, "raise ValueError("
+                              "'Invalid DTML command code, %%s', %s)" %
+                              self.constant(block[0]))
+            elif isinstance(block, (str, bytes)):
+                if block:
+                    self.literal(block, depth)
+            else:
+                self.emit(depth, 't = %s(md)' % self.constant(block))
+                self.emit(depth, 'if t:')
+                self.emit(depth + 1, 'append(%s)' % self.encoded('t'))
+        if len(self.lines) == start:
+            self.emit(depth, 'pass')
+
+    def var(self, block, depth):
+        emit = self.emit
+        t = block[1]
+        if isinstance(t, str):
+            emit(depth, f't = md[{t!r}]')
+        else:
+            emit(depth, 't = %s(md)' % self.constant(t))
+        if len(block) == 3:
+            emit(depth, 'if t.__class__ is str:')
+            emit(depth + 1,
+                 "if '&' in t or '<' in t or '>' in t or '\"' in t:")
+            emit(depth + 2, 't = _html_quote(t, encoding=encoding)')
+            emit(depth, 'else:')
+            emit(depth + 1, 't = _render_var(t, True, encoding)')
+        else:
+            emit(depth, 'if t.__class__ is not str:')
+            emit(depth + 1, 't = _render_var(t, False, encoding)')
+        emit(depth, 'if t:')
+        if self.output_encoding is None:
+            emit(depth + 1, 'append(t)')
+        else:
+            emit(depth + 1, 'if t.__class__ is str:')
+            emit(depth + 2, 'append(t.encode(%r))' % self.output_encoding)
+            emit(depth + 1, 'else:')
+            emit(depth + 2, 'append(%s)' % self.encoded('t'))
+
+    def literal(self, text, depth):
+        if self.output_encoding is None:
+            self.emit(depth, 'append(%r)' % (text, ))
+        elif isinstance(text, str):
+            # Encoded once for all renders.
+            self.emit(depth, 'append(%r)' % (
+                text.encode(self.output_encoding), ))
+        else:
+            self.emit(depth, 'append(%s)' % self.encoded(repr(text)))
+
+    def encoded(self, expr):
+        """Return the code for the text of `expr` in the output encoding."""
+        if self.output_encoding is None:
+            return expr
+        return f'_encode_text({expr}, encoding, _output_encoding)'
+
+    def if_(self, block, depth):
+        emit = self.emit
+        n = self.caches
+        self.caches += 1
+        cache = 'cache%d' % n
+        done = 'done%d' % n
+        branches = [(block[i], block[i + 1])
+                    for i in range(1, len(block) - 1, 2)]
+        has_else = not len(block) % 2
+        # Chains of conditions are flattened using a flag so that long
+        # elif chains do not result in deeply indented code.
+        chained = len(branches) > 1
+
+        emit(depth, f'{cache} = {{}}')
+        emit(depth, f'push({cache})')
+        emit(depth, 'try:')
+        for i, (cond, section) in enumerate(branches):
+            indent = depth + 1
+            if i:
+                emit(indent, f'if not {done}:')
+                indent += 1
+            if isinstance(cond, str):
+                # We have to be careful to handle key errors here
+                emit(indent, 'try:')
+                emit(indent + 1, f'cond = md[{cond!r}]')
+                emit(indent, 'except KeyError as e:')
+                emit(indent + 1, f'if {cond!r} != e.args[0]:')
+                emit(indent + 2, 'raise')
+                emit(indent + 1, 'cond = None')
+                emit(indent, 'else:')
+                emit(indent + 1, f'{cache}[{cond!r}] = cond')
+            else:
+                emit(indent, 'cond = %s(md)' % self.constant(cond))
+            emit(indent, 'if cond:')
+            if chained:
+                emit(indent + 1, f'{done} = True')
+            self.section(section or (), indent + 1)
+            if chained:
+                if not i:
+                    emit(indent, 'else:')
+                    emit(indent + 1, f'{done} = False')
+            elif has_else:
+                emit(indent, 'else:')
+                self.section(block[-1] or (), indent + 1)
+        if chained and has_else:
+            emit(depth + 1, f'if not {done}:')
+            self.section(block[-1] or (), depth + 2)
+        elif not branches:
+            self.section(block[-1] or (), depth + 1)
+        emit(depth, 'finally:')
+        emit(depth + 1, 'pop()')
+
+
 def safe_callable(ob):
     """callable() with a workaround for a problem with ExtensionClasses
     and __call__().
@@ -266,7 +590,7 @@ def safe_callable(ob):
 class InstanceDict:
     """"""
 
-    guarded_getattr = None
+    __slots__ = ('inst', 'namespace', 'cache', 'guarded_getattr')
 
     def __init__(self, inst, namespace, guarded_getattr=None):
         self.inst = inst
@@ -277,6 +601,16 @@ class InstanceDict:
         else:
             self.guarded_getattr = guarded_getattr
 
+    def rebind(self, inst):
+        """Look up the attributes of `inst` from now on.
+
+        This lets a loop use one namespace for all its items.  It must
+        not be on the stack of a TemplateDict while it is rebound, as the
+        lookup cache of the TemplateDict only notices pushed namespaces.
+        """
+        self.inst = inst
+        self.cache.clear()
+
     def __repr__(self):
         return 'InstanceDict(%r)' % self.inst
 
@@ -322,12 +656,95 @@ class DictInstance:
             raise AttributeError(name)
 
 
+class LookupCache:
+    """Remember where names were found on a TemplateDict stack
+
+    Every layer pushed onto the stack gets a serial number higher than the
+    ones of all layers below it.  An entry records the layer a name was
+    found in (or -1 if it was not found) and the last serial number given
+    out at that time: layers with a serial number up to that one are still
+    the ones the entry was made for, the others were pushed later.
+
+    Only misses of ``InstanceDict`` layers are skipped when an entry is
+    used.  Attribute lookup is the expensive part of name resolution and
+    ``InstanceDict`` already caches the attributes it found, other
+    mappings such as the request or the variables of an ``in`` tag may
+    change while they are on the stack and are always asked again.
+    """
+
+    def __init__(self, depth=0):
+        self.entries = {}
+        self.serial = depth
+        self.serials = list(range(1, depth + 1))
+        self.hits = self.misses = 0
+
+    def pushed(self):
+        self.serial = serial = self.serial + 1
+        self.serials.append(serial)
+
+    def popped(self, depth):
+        del self.serials[depth:]
+
+    def lookup(self, data, key):
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
+            known = layer = -1
+        else:
+            layer, serial = entry
+            # The layers below `known` are the ones the entry was made for.
+            known = bisect_right(self.serials, serial)
+            if layer >= known:
+                self.misses += 1
+                known = layer = -1
+            else:
+                self.hits += 1
+
+        for i in range(len(data) - 1, layer, -1):
+            e = data[i]
+            if i < known and isinstance(e, InstanceDict):
+                continue
+            try:
+                e = e[key]
+            except (KeyError, NameError):
+                continue
+            entries[key] = (i, self.serial)
+            return e
+
+        if layer >= 0:
+            try:
+                e = data[layer][key]
+            except (KeyError, NameError):
+                # The name is gone from its mapping, look further down.
+                for i in range(layer - 1, -1, -1):
+                    try:
+                        e = data[i][key]
+                    except (KeyError, NameError):
+                        continue
+                    entries[key] = (i, self.serial)
+                    return e
+            else:
+                entries[key] = (layer, self.serial)
+                return e
+
+        entries[key] = (-1, self.serial)
+        raise KeyError(key)
+
+
+_internal_names = frozenset(('level', '_data', '_dict', '_lookups',
+                             '_template'))
+
+
 class TemplateDict(Base):
     """TemplateDict -- Combine multiple mapping objects for lookup"""
 
     level = 0
     _data = None
     _dict = None
+    _lookups = None
+    # The template being rendered.
+    _template = None
 
     def __init__(self):
         """__init__() -- Create a new empty multi-mapping"""
@@ -337,35 +754,56 @@ class TemplateDict(Base):
 
     def _pop(self, i=1):
         """_pop() -- Remove and return the last data source added"""
-        l_ = len(self._data)
+        data = self._data
+        l_ = len(data)
         i = l_ - i
-        r = self._data[l_ - 1]
-        self._data[i:l_] = []
+        r = data[l_ - 1]
+        data[i:l_] = []
+        lookups = self._lookups
+        if lookups is not None:
+            lookups.popped(i)
         return r
 
     def _push(self, src):
         """_push(mapping_object) -- Add a data source"""
         self._data.append(src)
+        lookups = self._lookups
+        if lookups is not None:
+            lookups.pushed()
+
+    def _enable_lookup_cache(self):
+        """Remember where names were found until the stack changes"""
+        if self._lookups is None:
+            self._lookups = LookupCache(len(self._data))
+
+    def lookup_cache_info(self):
+        """Return the hits and misses of the lookup cache as a dict
+
+        Returns None if the lookup cache is not enabled.
+        """
+        lookups = self._lookups
+        if lookups is None:
+            return None
+        return {'hits': lookups.hits, 'misses': lookups.misses,
+                'size': len(lookups.entries)}
 
     def __getattribute__(self, name):
-        if name == 'level':
-            return Base.__getattribute__(self, name)
-        _dict = Base.__getattribute__(self, '_dict')
-        if _dict:
-            try:
-                return _dict[name]
-            except KeyError:
-                pass
+        if name not in _internal_names:
+            _dict = Base.__getattribute__(self, '_dict')
+            if _dict:
+                value = _dict.get(name, _marker)
+                if value is not _marker:
+                    return value
         return Base.__getattribute__(self, name)
 
     def __delattr__(self, name):
-        if name in ('level', '_data', '_dict'):
+        if name in _internal_names:
             del self.__dict__[name]
         else:
             del self._dict[name]
 
     def __setattr__(self, name, value):
-        if name in ('level', '_data', '_dict'):
+        if name in _internal_names:
             self.__dict__[name] = value
         else:
             self._dict[name] = value
@@ -381,23 +819,29 @@ class TemplateDict(Base):
         If call is false, the object will be returns without any attempt
         to call it. If not specified, call is false by default.
         """
-        for e in reversed(self._data):
-            try:
-                e = e[key]
-            except (KeyError, NameError):
-                continue
+        lookups = self._lookups
+        if lookups is None:
+            for e in reversed(self._data):
+                try:
+                    e = e[key]
+                except (KeyError, NameError):
+                    continue
+                break
+            else:
+                raise KeyError(key)
+        else:
+            e = lookups.lookup(self._data, key)
 
-            if call:
-                if hasattr(e, '__render_with_namespace__'):
-                    return e.__render_with_namespace__(self)
+        if call:
+            if hasattr(e, '__render_with_namespace__'):
+                return e.__render_with_namespace__(self)
 
-                base = aq_base(e)
-                if safe_callable(base) and not isinstance(base, HTTPException):
-                    if getattr(base, 'isDocTemp', False):
-                        return e(None, self)
-                    return e()
-            return e
-        raise KeyError(key)
+            base = aq_base(e)
+            if safe_callable(base) and not isinstance(base, HTTPException):
+                if getattr(base, 'isDocTemp', False):
+                    return e(None, self)
+                return e()
+        return e
 
     def __len__(self):
         total = 0
@@ -406,6 +850,13 @@ class TemplateDict(Base):
         return total
 
     def __contains__(self, key):
+        lookups = self._lookups
+        if lookups is not None:
+            try:
+                lookups.lookup(self._data, key)
+            except KeyError:
+                return False
+            return True
         for e in reversed(self._data):
             try:
                 e = e[key]
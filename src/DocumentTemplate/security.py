@@ -17,8 +17,10 @@
 from types import FunctionType
 
 from AccessControl import SecurityManagement
+from AccessControl import Unauthorized
 from AccessControl.ImplPython import guarded_getattr
 from AccessControl.SimpleObjectPolicies import ContainerAssertions
+from AccessControl.SimpleObjectPolicies import Containers
 from AccessControl.ZopeGuards import guarded_getitem
 from AccessControl.ZopeGuards import safe_builtins
 
@@ -37,6 +39,44 @@ class BaseRestrictedDTML:
     def guarded_getitem(self, ob, index):
         return guarded_getitem(ob, index)
 
+    def guarded_filter(self, ob, start, end):
+        getitem = self.guarded_getitem
+        if getattr(getitem, '__func__', None) is \
+           BaseRestrictedDTML.guarded_getitem:
+            return guarded_filter(ob, start, end)
+        # Keep the checks of an overridden 'guarded_getitem'.
+        items = []
+        for index in range(start, end):
+            try:
+                items.append((index, getitem(ob, index)))
+            except DT_Util.ValidationError:
+                pass
+        return items
+
+
+def guarded_filter(ob, start, end):
+    """Return the (index, item) pairs of the items of `ob` from `start`
+    to `end` that may be accessed.
+
+    The decisions are those of 'guarded_getitem', but the security
+    manager is only looked up once.
+    """
+    validate = SecurityManagement.getSecurityManager().validate
+    simple = Containers(type(ob))
+    items = []
+    for index in range(start, end):
+        v = ob[index]
+        if simple and Containers(type(v)):
+            # Simple type.  Short circuit.
+            items.append((index, v))
+            continue
+        try:
+            if validate(ob, ob, None, v):
+                items.append((index, v))
+        except Unauthorized:
+            pass
+    return items
+
 
 # This does not respect the security policy as set by AccessControl. Instead
 # it only deals with the C module being compiled or not.
@@ -0,0 +1,443 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Micro benchmarks for document templates
+
+Run all benchmarks with::
+
+  python -m DocumentTemplate.tests.benchmarks
+
+or pass the names of the benchmarks to run as arguments.
+"""
+
+import sys
+import timeit
+import types
+
+
+def best_of(func, number=1, repeat=5):
+    """Return the best time in seconds for calling `func` `number` times."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def large_template(rows=2000):
+    row = ('<tr class="&dtml-cls;">\n'
+           '  <td><dtml-var title html_quote></td>\n'
+           '  <td><dtml-if "price > 10"><b>&dtml.html_quote-price;</b>'
+           '<dtml-else><dtml-var price fmt="%.2f"></dtml-if></td>\n'
+           '  <!--#var description-->\n'
+           '  <td><a href="<dtml-var url>" title="<dtml-var "x > y">"'
+           ' onclick="return a > b">link</a></td>\n'
+           '</tr>\n')
+    return '<table>\n<dtml-in items>\n%s</dtml-in>\n</table>\n' % (
+        row * (rows // 10))
+
+
+def quoted_template(size=5000):
+    # A single tag with many quoted '>' characters in its arguments.
+    return '<dtml-var x missing="%s">' % ('->' * size)
+
+
+def scan(template, source):
+    tagre = template.tagre()
+    start = 0
+    mo = tagre.search(source, start)
+    while mo is not None:
+        start = mo.start(0) + len(mo.group(0))
+        mo = tagre.search(source, start)
+
+
+def bench_cook():
+    """Time scanning and parsing large HTML templates."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    for name, source in (('large template', large_template()),
+                         ('quoted tag', quoted_template())):
+        template = HTML(source)
+        t = best_of(lambda: scan(template, source))
+        print(f'scan {name} ({len(source)} chars): {t * 1000:.2f} ms')
+        t = best_of(lambda: template.parse(source))
+        print(f'cook {name} ({len(source)} chars): {t * 1000:.2f} ms')
+
+
+class Folder:
+    """Look up missing attributes in the parents, like acquisition."""
+
+    def __init__(self, parent=None, **kw):
+        self.__dict__.update(kw)
+        self.parent = parent
+
+    def __getattr__(self, name):
+        parent = self.__dict__['parent']
+        if parent is None:
+            raise AttributeError(name)
+        return getattr(parent, name)
+
+
+def bench_lookup():
+    """Time name lookups through a deep stack of instances."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    folder = None
+    for i in range(20):
+        folder = Folder(folder, **{'attr%d' % i: i})
+    source = ('<dtml-in items mapping><dtml-var title>'
+              '<dtml-var attr0><dtml-if missing>x</dtml-if></dtml-in>')
+    items = [{'title': str(i)} for i in range(2000)]
+
+    class CachingHTML(HTML):
+        cache_lookups = True
+
+    for name, klass in (('uncached', HTML), ('cached', CachingHTML)):
+        template = klass(source)
+        t = best_of(lambda: template(folder, items=items))
+        print(f'lookup {name}: {t * 1000:.2f} ms')
+
+
+def bench_encoded():
+    """Time rendering templates to bytes and encoding rendered text."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    # A page of mostly literal non-ASCII text with some inserted values.
+    paragraph = ('<p>\xdcbersicht \u2013 die \xc4nderungen der letzten '
+                 'Woche, gr\xf6\xdftenteils Fehlerbehebungen.</p>\n')
+    source = '<h1><dtml-var title></h1>\n%s' % ''.join(
+        '%s<h2><dtml-var "h%d"></h2>\n' % (paragraph * 20, i)
+        for i in range(40))
+    kw = {'h%d' % i: 'Kapitel %d' % i for i in range(40)}
+    template = HTML(source, encoding='utf-8')
+    t = best_of(lambda: template(title='Seite', **kw).encode('utf-8'),
+                number=100)
+    print(f'page, render and encode: {t * 1000:.3f} ms')
+    t = best_of(lambda: template.render_encoded(title='Seite', **kw),
+                number=100)
+    print(f'page, render_encoded: {t * 1000:.3f} ms')
+
+    template = HTML(large_template(), encoding='utf-8')
+    items = [types.SimpleNamespace(
+        cls='row', title='T\xe4tel %d' % i, price=i, x=i, y=10,
+        description='Some <b>text</b>', url='/item/%d' % i)
+        for i in range(20)]
+    t = best_of(lambda: template(items=items).encode('utf-8'))
+    print(f'table, render and encode: {t * 1000:.2f} ms')
+    t = best_of(lambda: template.render_encoded(items=items))
+    print(f'table, render_encoded: {t * 1000:.2f} ms')
+
+
+def bench_sort():
+    """Time sorting a large sequence with sort functions."""
+    import random
+
+    from DocumentTemplate.DT_HTML import HTML
+
+    rnd = random.Random(42)
+    items = [types.SimpleNamespace(
+        title=''.join(rnd.choice('abcABC') for i in range(6)),
+        date=rnd.randrange(1000)) for i in range(20000)]
+    for sort in ('title/nocase,date/cmp/desc', 'title/nocase,date/cmp',
+                 'date'):
+        template = HTML('<dtml-in items sort="%s" size=20 start=1>'
+                        '<dtml-var title></dtml-in>' % sort)
+        t = best_of(lambda: template(items=items))
+        print(f'first batch of 20000 items sorted by {sort}: '
+              f'{t * 1000:.2f} ms')
+
+
+def bench_statistics():
+    """Summary statistics of a report with 50000 rows."""
+    import random
+
+    from DocumentTemplate.DT_HTML import HTML
+
+    rnd = random.Random(42)
+    items = [types.SimpleNamespace(
+        price=rnd.uniform(0, 100), quantity=rnd.randrange(100))
+        for i in range(50000)]
+    template = HTML('<dtml-in items size=20 start=1><dtml-if sequence-end>'
+                    '<dtml-var total-price> <dtml-var mean-price> '
+                    '<dtml-var total-quantity> <dtml-var mean-quantity>'
+                    '</dtml-if></dtml-in>')
+    t = best_of(lambda: template(items=items))
+    print(f'totals and means of 50000 rows: {t * 1000:.2f} ms')
+    template = HTML('<dtml-in items size=20 start=1><dtml-if sequence-end>'
+                    '<dtml-var median-price> '
+                    '<dtml-var standard-deviation-price>'
+                    '</dtml-if></dtml-in>')
+    t = best_of(lambda: template(items=items))
+    print(f'median and deviation of 50000 rows: {t * 1000:.2f} ms')
+
+
+def bench_batches():
+    """A pager with ten of the next batches of 100000 items."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    items = list(range(100000))
+    template = HTML('<dtml-in items size=10 start=1><dtml-if sequence-end>'
+                    '<dtml-in next-batches mapping size=10>'
+                    '<dtml-var batch-start-number> </dtml-in>'
+                    '</dtml-if></dtml-in>')
+    t = best_of(lambda: template(items=items))
+    print(f'pager for 100000 items: {t * 1000:.2f} ms')
+
+
+def bench_groups():
+    """A report of 5000 items grouped with first- and last- variables."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    items = [types.SimpleNamespace(region=i // 1000, city=i // 50, name=i)
+             for i in range(5000)]
+    template = HTML('<dtml-in items>'
+                    '<dtml-if first-region><h1>&dtml-region;</h1></dtml-if>'
+                    '<dtml-if first-city><h2>&dtml-city;</h2><ul></dtml-if>'
+                    '<li>&dtml-name;</li>'
+                    '<dtml-if last-city></ul></dtml-if>'
+                    '<dtml-if last-region><hr></dtml-if>'
+                    '</dtml-in>')
+    t = best_of(lambda: template(items=items))
+    print(f'grouped report of 5000 items: {t * 1000:.2f} ms')
+
+
+def count_calls(func, code):
+    """Return how often the function with `code` is called by `func`."""
+    calls = 0
+
+    def profile(frame, event, arg):
+        nonlocal calls
+        if event == 'call' and frame.f_code is code:
+            calls += 1
+
+    sys.setprofile(profile)
+    try:
+        func()
+    finally:
+        sys.setprofile(None)
+    return calls
+
+
+def bench_loop():
+    """Iterating over 10000 rows of a table."""
+    from DocumentTemplate._DocumentTemplate import InstanceDict
+    from DocumentTemplate.DT_HTML import HTML
+
+    rows = [types.SimpleNamespace(id=i, title='row %d' % i)
+            for i in range(10000)]
+    template = HTML('<dtml-in rows><tr><td>&dtml-id;</td>'
+                    '<td>&dtml-title;</td></tr></dtml-in>')
+    t = best_of(lambda: template(rows=rows))
+    print(f'10000 rows: {t * 1000:.2f} ms')
+    created = count_calls(lambda: template(rows=rows),
+                          InstanceDict.__init__.__code__)
+    print(f'namespaces created per row: {created / len(rows):.4f}')
+
+
+def bench_variables():
+    """Looking up the loop variables of 10000 rows."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    rows = list(range(10000))
+    for prefix in ('sequence-', 'row_'):
+        attrs = ' prefix="row"' if prefix == 'row_' else ''
+        template = HTML(
+            f'<dtml-in rows{attrs}><dtml-if {prefix}even>even</dtml-if>'
+            f'<dtml-var {prefix}number> <dtml-var {prefix}item>'
+            f'<dtml-if {prefix}end>.</dtml-if></dtml-in>')
+        t = best_of(lambda: template(rows=rows))
+        print(f'{prefix}: {t * 1000:.2f} ms')
+
+
+def bench_unauthorized():
+    """Skipping the unauthorized half of 10000 items."""
+    from DocumentTemplate.DT_HTML import HTML
+    from DocumentTemplate.DT_Util import ValidationError
+
+    class Public:
+        pass
+
+    class Private:
+        pass
+
+    class GuardedHTML(HTML):
+        def guarded_getitem(self, seq, index):
+            item = seq[index]
+            if type(item) is Private:
+                raise ValidationError('unauthorized access to element')
+            return item
+
+    class FilteredHTML(GuardedHTML):
+        def guarded_filter(self, seq, start, end):
+            # Decide once per class, like a security policy can.
+            allowed = {}
+            items = []
+            for index in range(start, end):
+                item = seq[index]
+                t = type(item)
+                if t not in allowed:
+                    try:
+                        self.guarded_getitem(seq, index)
+                    except ValidationError:
+                        allowed[t] = False
+                    else:
+                        allowed[t] = True
+                if allowed[t]:
+                    items.append((index, item))
+            return items
+
+    rows = [Public() if i % 2 else Private() for i in range(10000)]
+    text = '<dtml-in rows skip_unauthorized>&dtml-sequence-index;</dtml-in>'
+    for doc_class in (GuardedHTML, FilteredHTML):
+        template = doc_class(text)
+        t = best_of(lambda: template(rows=rows))
+        print(f'{doc_class.__name__}: {t * 1000:.2f} ms')
+
+
+class TreeNode:
+    """A node of a synthetic tree, identified by its oid like persistent
+    objects without an id."""
+
+    def __init__(self, oid, children=()):
+        self._p_oid = oid.to_bytes(8, 'big')
+        self.children = list(children)
+
+    def tpValues(self):
+        return self.children
+
+
+def synthetic_tree(breadth, depth, counter=None):
+    if counter is None:
+        counter = iter(range(1, 1 << 62))
+    children = []
+    if depth > 1:
+        children = [synthetic_tree(breadth, depth - 1, counter)
+                    for i in range(breadth)]
+    return TreeNode(next(counter), children)
+
+
+def bench_tree_state():
+    """Encoding the state of an expanded tree of 421 nodes."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    from TreeDisplay.TreeTag import decode_seq
+    from TreeDisplay.TreeTag import encode_seq
+    from TreeDisplay.TreeTag import extract_id
+
+    root = synthetic_tree(20, 3)
+
+    def state(node):
+        return [extract_id(node, 'tpId'),
+                [state(child) for child in node.children if child.children]]
+
+    tree_state = [state(root)]
+    encoded = encode_seq(tree_state)
+    print(f'state: {len(encoded)} characters')
+    t = best_of(lambda: decode_seq(encode_seq(tree_state)), number=100)
+    print(f'encoding and decoding: {t * 1000000:.0f} us')
+
+    class Response:
+        def setCookie(self, name, value, **kw):
+            pass
+
+    template = HTML('<dtml-tree root single>.</dtml-tree>')
+    t = best_of(lambda: template(root=root, URL='/', RESPONSE=Response(),
+                                 **{'tree-s': encoded}))
+    print(f'rendering: {t * 1000:.2f} ms')
+
+
+def bench_tree():
+    """Rendering expanded synthetic trees of about 5000 nodes."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    class Response:
+        def setCookie(self, name, value, **kw):
+            pass
+
+    template = HTML('<dtml-tree root single>.</dtml-tree>')
+    for breadth, depth in ((4, 7), (2, 12)):
+        root = synthetic_tree(breadth, depth)
+
+        def render():
+            template(root=root, URL='/', RESPONSE=Response(), expand_all=1)
+
+        t = best_of(render, repeat=10)
+        calls = count_calls(render, TreeNode.tpValues.__code__)
+        nodes = (breadth ** depth - 1) // (breadth - 1)
+        print(f'{nodes} nodes, {depth} levels: {t * 1000:.2f} ms, '
+              f'{calls} tpValues calls')
+
+
+def bench_tree_ids():
+    """Extracting the ids of a synthetic tree of 5461 persistent nodes."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    from TreeDisplay.TreeTag import OID_IDS
+    from TreeDisplay.TreeTag import extract_id
+
+    class Response:
+        def setCookie(self, name, value, **kw):
+            pass
+
+    root = synthetic_tree(4, 7)
+    nodes = []
+    level = [root]
+    while level:
+        nodes.extend(level)
+        level = [child for node in level for child in node.children]
+
+    for oid_format, oid_id in sorted(OID_IDS.items()):
+        t = best_of(lambda: [extract_id(node, 'tpId', oid_id)
+                             for node in nodes], repeat=10)
+        template = HTML('<dtml-tree root single oid_format=%s>.</dtml-tree>'
+                        % oid_format)
+        r = best_of(lambda: template(root=root, URL='/', RESPONSE=Response(),
+                                     expand_all=1), repeat=10)
+        print(f'{oid_format}: ids {t * 1000:.2f} ms, '
+              f'rendering {r * 1000:.2f} ms')
+
+
+def bench_tree_fragment():
+    """Expanding a node of an expanded tree of 421 nodes."""
+    from DocumentTemplate.DT_HTML import HTML
+
+    from TreeDisplay.TreeTag import encode_seq
+    from TreeDisplay.TreeTag import extract_id
+
+    root = synthetic_tree(20, 3)
+
+    def state(node):
+        return [extract_id(node, 'tpId'),
+                [state(child) for child in node.children[:-1]
+                 if child.children]]
+
+    tree_state = encode_seq([state(root)])
+    path = encode_seq([extract_id(node, 'tpId')
+                       for node in (root, root.children[-1])])
+
+    class Response:
+        def setCookie(self, name, value, **kw):
+            pass
+
+    template = HTML('<dtml-tree root>.</dtml-tree>')
+    for name in ('tree-e', 'tree-p'):
+        t = best_of(lambda: template(root=root, URL='/', RESPONSE=Response(),
+                                     **{'tree-s': tree_state, name: path}),
+                    repeat=10)
+        print(f'{name}: {t * 1000:.2f} ms')
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or sorted(
+        name[6:] for name in globals() if name.startswith('bench_'))
+    for name in names:
+        globals()['bench_' + name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -591,6 +591,54 @@ class RESTTests(DTMLTests):
         self.assertIn(docutils_raw_warning, result)
 
 
+class CompiledDTMLTests(DTMLTests):
+
+    def _get_doc_class(self):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class CompiledHTML(HTML):
+            compile_blocks = True
+        return CompiledHTML
+    doc_class = property(_get_doc_class,)
+
+
+class LookupCacheDTMLTests(DTMLTests):
+
+    def _get_doc_class(self):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class CachingHTML(HTML):
+            cache_lookups = True
+        return CachingHTML
+    doc_class = property(_get_doc_class,)
+
+
+class StreamedDTMLTests(DTMLTests):
+
+    def _get_doc_class(self):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class StreamedHTML(HTML):
+            def __call__(self, client=None, mapping={}, **kw):
+                return ''.join(self.iter_render(client, mapping, **kw))
+        return StreamedHTML
+    doc_class = property(_get_doc_class,)
+
+
+class EncodedDTMLTests(DTMLTests):
+
+    def _get_doc_class(self):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class EncodedHTML(HTML):
+            def __call__(self, client=None, mapping={}, **kw):
+                result = self.render_encoded(client, mapping, **kw)
+                return result.decode(getattr(self, 'encoding', None)
+                                     or 'utf-8')
+        return EncodedHTML
+    doc_class = property(_get_doc_class,)
+
+
 def read_file(name):
     import os
 
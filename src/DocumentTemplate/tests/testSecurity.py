@@ -18,6 +18,7 @@ from AccessControl.SecurityManagement import getSecurityManager
 from ExtensionClass import Base
 
 from ..DT_HTML import HTML
+from ..DT_Util import ValidationError
 from ..security import RestrictedDTML
 from .testDTML import DTMLTests
 
@@ -109,3 +110,73 @@ class SecurityTests(DTMLTests):
         lines = list(filter(None, [x.strip() for x in res.split('\n')]))
 
         self.assertEqual(lines, EXPECTED)
+
+    def testSkipUnauthorized(self):
+        class Item(Base):
+            def __init__(self, name, roles):
+                self.name = name
+                self.__roles__ = roles
+
+        items = [Item('a', None), Item('b', ()), 1, Item('c', None)]
+        html = self.doc_class(
+            '<dtml-in items skip_unauthorized>'
+            '<dtml-var sequence-index></dtml-in>')
+        self.assertEqual(html(items=items), '023')
+        self.assertEqual(html.guarded_filter(items, 1, 3), [(2, 1)])
+        html = self.doc_class('<dtml-in items>.</dtml-in>')
+        with self.assertRaises(ValidationError):
+            html(items=items)
+
+    def testSkipUnauthorizedOverriddenGetitem(self):
+        class Item(Base):
+            def __init__(self, name):
+                self.name = name
+
+        class GuardedHTML(self.doc_class):
+            def guarded_getitem(self, ob, index):
+                item = super().guarded_getitem(ob, index)
+                if item.name == 'b':
+                    raise ValidationError('b')
+                return item
+
+        items = [Item('a'), Item('b'), Item('c')]
+        html = GuardedHTML(
+            '<dtml-in items skip_unauthorized>'
+            '<dtml-var sequence-index></dtml-in>')
+        self.assertEqual(html(items=items), '02')
+        self.assertEqual([index for index, item in
+                          html.guarded_filter(items, 0, 3)], [0, 2])
+
+    def testSkipUnauthorizedGroupBy(self):
+        class Item(Base):
+            __allow_access_to_unprotected_subobjects__ = 1
+
+            def __init__(self, cat, roles):
+                self.cat = cat
+                self.__roles__ = roles
+
+        items = [Item('public', None), Item('secret', ()),
+                 Item('public2', None)]
+        html = self.doc_class(
+            '<dtml-in items skip_unauthorized group_by=cat>'
+            '[<dtml-var sequence-key>]</dtml-in>')
+        self.assertEqual(html(items=items), '[public][public2]')
+        html = self.doc_class(
+            '<dtml-in items group_by=cat>'
+            '[<dtml-var sequence-key>]</dtml-in>')
+        with self.assertRaises(ValidationError):
+            html(items=items)
+
+    def testGroupByProtectedKey(self):
+        class Item(Base):
+            __roles__ = None  # Public
+            cat__roles__ = ()  # Private
+
+            def __init__(self, cat):
+                self.cat = cat
+
+        html = self.doc_class(
+            '<dtml-in items group_by=cat>'
+            '[<dtml-var sequence-key>]</dtml-in>')
+        with self.assertRaises(Unauthorized):
+            html(items=[Item('secret')])
@@ -0,0 +1,171 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+
+class CacheTagTests(unittest.TestCase):
+
+    def setUp(self):
+        from DocumentTemplate import DT_Cache
+        self.backend = DT_Cache.MemoryCache()
+        patcher = mock.patch.dict(DT_Cache.backends,
+                                  {'default': self.backend})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def _makeOne(self, source):
+        from DocumentTemplate.DT_HTML import HTML
+        return HTML(source)
+
+    def count(self):
+        self.calls += 1
+        return self.calls
+
+    def test_section_is_rendered_once(self):
+        template = self._makeOne(
+            '<dtml-cache key="x"><dtml-var count></dtml-cache>')
+        self.assertEqual(template(x=1, count=self.count), '1')
+        self.assertEqual(template(x=1, count=self.count), '1')
+        self.assertEqual(template(x=2, count=self.count), '2')
+        self.assertEqual(template(x=1, count=self.count), '1')
+
+    def test_vary(self):
+        template = self._makeOne(
+            '<dtml-cache vary="user lang"><dtml-var user></dtml-cache>')
+        self.assertEqual(template(user='a', lang='en'), 'a')
+        self.assertEqual(template(user='b', lang='en'), 'b')
+        self.assertEqual(template(user='a', lang='en'), 'a')
+        self.assertEqual(template(user='c'), 'c')
+
+    def test_ttl(self):
+        template = self._makeOne(
+            '<dtml-cache ttl="60"><dtml-var count></dtml-cache>')
+        with mock.patch('time.monotonic', return_value=1000):
+            self.assertEqual(template(count=self.count), '1')
+        with mock.patch('time.monotonic', return_value=1059):
+            self.assertEqual(template(count=self.count), '1')
+        with mock.patch('time.monotonic', return_value=1060):
+            self.assertEqual(template(count=self.count), '2')
+
+    def test_different_attributes_do_not_share_entries(self):
+        template = self._makeOne(
+            '<dtml-cache key="1">a</dtml-cache>'
+            '<dtml-cache key="1" ttl="1">b</dtml-cache>')
+        self.assertEqual(template(), 'ab')
+
+    def test_different_sections_do_not_share_entries(self):
+        template = self._makeOne(
+            '<dtml-cache ttl="60">a</dtml-cache>'
+            '<dtml-cache ttl="60">b</dtml-cache>')
+        self.assertEqual(template(), 'ab')
+        other = self._makeOne('<dtml-cache ttl="60">c</dtml-cache>')
+        self.assertEqual(other(), 'c')
+        self.assertEqual(template(), 'ab')
+
+    def test_templates_do_not_share_entries(self):
+        from DocumentTemplate.DT_HTML import HTML
+        source = '<dtml-cache><dtml-var title></dtml-cache>'
+        self.assertEqual(HTML(source, __name__='a', title='A')(), 'A')
+        self.assertEqual(HTML(source, __name__='b', title='B')(), 'B')
+        self.assertEqual(HTML(source, __name__='b', title='C')(), 'C')
+
+    def test_physical_path(self):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class Template(HTML):
+            def getPhysicalPath(self):
+                return self.path
+
+        source = '<dtml-cache><dtml-var title></dtml-cache>'
+        template = Template(source, title='A')
+        template.path = ('', 'site', 'index_html')
+        self.assertEqual(template(), 'A')
+        template = Template(source, title='B')
+        template.path = ('', 'site', 'index_html')
+        self.assertEqual(template(), 'A')
+        template.path = ('', 'other', 'index_html')
+        self.assertEqual(template(), 'B')
+        # Without a root the path does not identify the template.
+        template = Template(source, title='C')
+        template.path = ('index_html',)
+        self.assertEqual(template(), 'C')
+
+    def test_nested_templates(self):
+        section = '<dtml-cache><dtml-var title></dtml-cache>'
+        inner = self._makeOne(section)
+        outer = self._makeOne('<dtml-var inner>' + section)
+        self.assertEqual(inner(title='A'), 'A')
+        self.assertEqual(outer(title='B', inner=inner), 'AB')
+
+    def test_unknown_backend(self):
+        template = self._makeOne('<dtml-cache backend="nope">a</dtml-cache>')
+        with self.assertRaisesRegex(ValueError, 'nope'):
+            template()
+
+    def test_parse_errors(self):
+        from DocumentTemplate.DT_Util import ParseError
+        for source in ('<dtml-cache ttl="soon">a</dtml-cache>',
+                       '<dtml-cache foo>a</dtml-cache>'):
+            with self.assertRaises(ParseError):
+                self._makeOne(source)()
+
+
+class MemoryCacheTests(unittest.TestCase):
+
+    def _makeOne(self, max_size):
+        from DocumentTemplate.DT_Cache import MemoryCache
+        return MemoryCache(max_size)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = self._makeOne(10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        self.assertEqual(cache.get('a'), 'aaaa')
+        cache.set('c', 'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'aaaa')
+        self.assertEqual(cache.get('c'), 'cccc')
+        self.assertEqual(cache.size, 8)
+
+    def test_replace_and_too_large(self):
+        cache = self._makeOne(10)
+        cache.set('a', 'aaaa')
+        cache.set('a', 'aa')
+        self.assertEqual(cache.size, 2)
+        cache.set('a', 'a' * 11)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+
+
+class FileCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _makeOne(self):
+        from DocumentTemplate.DT_Cache import FileCache
+        return FileCache(self.directory + '/cache')
+
+    def test_get_set(self):
+        cache = self._makeOne()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'line\r\n\xe4')
+        self.assertEqual(self._makeOne().get('a'), 'line\r\n\xe4')
+
+    def test_ttl(self):
+        cache = self._makeOne()
+        with mock.patch('time.time', return_value=1000):
+            cache.set('a', 'text', 60)
+            self.assertEqual(cache.get('a'), 'text')
+        with mock.patch('time.time', return_value=1060):
+            self.assertIsNone(cache.get('a'))
+
+    def test_damaged_file(self):
+        cache = self._makeOne()
+        cache.set('a', 'text')
+        with open(cache.filename('a'), 'w') as f:
+            f.write('soon\ntext')
+        self.assertIsNone(cache.get('a'))
@@ -0,0 +1,49 @@
+import unittest
+
+
+class DTMLTagScannerTests(unittest.TestCase):
+    """Testing ..DT_HTML.dtml_re_class."""
+
+    def _scan(self, text):
+        from DocumentTemplate.DT_HTML import dtml_re_class
+        tagre = dtml_re_class()
+        result = []
+        start = 0
+        mo = tagre.search(text, start)
+        while mo is not None:
+            tag, end, name, args = mo.group(0, 'end', 'name', 'args')
+            result.append((mo.start(0), tag, end, name, args))
+            start = mo.start(0) + len(tag)
+            mo = tagre.search(text, start)
+        return result
+
+    def test_tag_forms(self):
+        text = ('<!--#var a--> <!--#/in--> <dtml-in "b" mapping>'
+                '</dtml-in> &dtml-c; &dtml.url_quote.upper-d-e;')
+        self.assertEqual(self._scan(text), [
+            (0, '<!--#var a-->', '', 'var', 'a'),
+            (14, '<!--#/in-->', '/', 'in', ''),
+            (26, '<dtml-in "b" mapping>', '', 'in', '"b" mapping'),
+            (47, '</dtml-in>', '/', 'in', ''),
+            (58, '&dtml-c;', '', 'var', 'c html_quote'),
+            (67, '&dtml.url_quote.upper-d-e;', '', 'var',
+             'd-e url_quote upper'),
+        ])
+
+    def test_quoted_greater_than(self):
+        text = '<dtml-var x missing="->->"> <dtml-var "a > b">'
+        self.assertEqual(self._scan(text), [
+            (0, '<dtml-var x missing="->->">', '', 'var',
+             'x missing="->->"'),
+            (28, '<dtml-var "a > b">', '', 'var', '"a > b"'),
+        ])
+
+    def test_invalid_entities_are_skipped(self):
+        self.assertEqual(self._scan('&dtml.x; &dtml-a b; &dtml &dtml-'), [])
+
+    def test_unterminated_tag_stops_scanning(self):
+        self.assertEqual(self._scan('<dtml-var "x> <dtml-var y>'), [])
+        self.assertEqual(self._scan('<!--#var x <dtml-var y>'), [])
+        self.assertEqual(
+            self._scan('<dtml-var y><dtml-1><dtml-var z>'),
+            [(0, '<dtml-var y>', '', 'var', 'y')])
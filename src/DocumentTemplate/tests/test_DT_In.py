@@ -297,7 +297,7 @@ class DT_In_Tests(unittest.TestCase):
 
     def test_DT_In__InClass__renderwob__07(self):
         """It allows complex multisort. Smoke test."""
-        # This test also covers most of `SortBy`.
+        # This test also covers most of `sort_by_functions`.
         seq = [Dummy('alberta', 2), Dummy('alberta', 1), Dummy('barnie', 1)]
         html = self.doc_class(
             '<dtml-in seq sort="name/nocase/asc,number/cmp/desc">'
@@ -337,6 +337,26 @@ class DT_In_Tests(unittest.TestCase):
             'Item 4: alberta , 2')
         self.assertEqual(res, expected)
 
+    def test_DT_In__InClass__renderwob__07a(self):
+        """It sorts stably with functions from the namespace."""
+        seq = [Dummy('bb', 1), Dummy('a', 2), Dummy('B', 2), Dummy('A', 1),
+               Dummy('c', 1)]
+
+        def bylength(a, b):
+            return len(a) - len(b)
+
+        html = self.doc_class(
+            '<dtml-in seq sort="name/bylength/desc,number/cmp/desc">'
+            '<dtml-var sequence-var-name><dtml-var sequence-var-number> '
+            '</dtml-in>')
+        self.assertEqual(html(seq=seq, bylength=bylength),
+                         'bb1 a2 B2 A1 c1 ')
+        html = self.doc_class(
+            '<dtml-in seq sort="name/nocase/desc">'
+            '<dtml-var sequence-var-name><dtml-var sequence-var-number> '
+            '</dtml-in>')
+        self.assertEqual(html(seq=seq), 'c1 bb1 B2 a2 A1 ')
+
     def test_DT_In__InClass__renderwob__08(self):
         """It can iterate over list of tuples."""
         seq = [('alberta', 3), ('ylberta', 1), ('barnie', 2)]
@@ -568,3 +588,216 @@ class DT_In_Tests(unittest.TestCase):
             'Item 2: barnie'
             'Item 3: alberta')
         self.assertEqual(res, expected)
+
+    def test_DT_In__InClass__renderwb__partial_sort(self):
+        """It only sorts the first batches of long sequences."""
+        from unittest import mock
+
+        from DocumentTemplate import DT_In
+        seq = [Dummy(name, number) for number, name in enumerate(
+            'pqkaxbyczdmewfsgthuivjlnor' * 4)]
+        for sort in ('name/nocase,number/cmp', 'name,number/cmp/desc',
+                     'number/cmp/desc', 'name'):
+            html = self.doc_class(
+                '<dtml-in seq sort="%s" size=3 start=7>'
+                '<dtml-var sequence-var-name><dtml-var sequence-var-number>,'
+                '<dtml-if sequence-end><dtml-in next-batches mapping>'
+                '<dtml-var batch-start-index>,</dtml-in></dtml-if>'
+                '</dtml-in>' % sort)
+            result = html(seq=seq)
+            with mock.patch.object(DT_In, 'PARTIAL_SORT_RATIO', 1000):
+                self.assertEqual(result, html(seq=seq))
+        self.assertEqual(result[:14], 'b57,b83,c7,9,1')
+
+    def test_DT_In__InClass__renderwb__partial_sort_missing_keys(self):
+        """Every item is in one batch when some sort keys are missing."""
+        seq = [Dummy(None if i % 3 else str(i % 7), i) for i in range(200)]
+        for sort in ('name', 'name,number/cmp'):
+            html = self.doc_class(
+                '<dtml-in seq sort="%s" size=5 start=start>'
+                '<dtml-var sequence-var-number>,</dtml-in>' % sort)
+            numbers = []
+            for start in range(1, 201, 5):
+                numbers.extend(html(seq=seq, start=start).split(',')[:-1])
+            self.assertEqual(sorted(numbers, key=int),
+                             [str(i) for i in range(200)])
+
+    def test_DT_In__InClass__sort_sequence__partial(self):
+        from DocumentTemplate.DT_In import InClass
+        from DocumentTemplate.DT_In import PartiallySorted
+        from DocumentTemplate.DT_Util import TemplateDict
+        seq = [Dummy(str(i % 10), i) for i in range(100)]
+        md = TemplateDict()
+        in_ = InClass([('in', 'seq sort=name', DummySection())])
+        items = in_.sort_sequence(seq, md, 10)
+        self.assertIsInstance(items, PartiallySorted)
+        self.assertEqual([items[i].number for i in range(10)],
+                         list(range(0, 100, 10)))
+        self.assertIsNone(items.items)
+        self.assertEqual(items[10].number, 1)
+        self.assertEqual([item.number for item in items],
+                         [i % 10 * 10 + i // 10 for i in range(100)])
+        self.assertIsInstance(in_.sort_sequence(seq, md, 20), list)
+        in_ = InClass(
+            [('in', 'seq sort=name,number/cmp/desc', DummySection())])
+        self.assertIsInstance(in_.sort_sequence(seq, md, 10), list)
+
+    def test_DT_In__PartiallySorted(self):
+        from operator import itemgetter
+
+        from DocumentTemplate.DT_In import PartiallySorted
+        pairs = [(k, i) for i, k in enumerate([3, 1, 2, 1, 5, 4])]
+        items = PartiallySorted(list(pairs), itemgetter(0), False, 2)
+        self.assertEqual(len(items), 6)
+        self.assertEqual([items[0], items[1]], [1, 3])
+        self.assertIsNone(items.items)
+        self.assertEqual(items[2], 2)
+        self.assertEqual(list(items), [1, 3, 2, 0, 5, 4])
+        items = PartiallySorted(list(pairs), itemgetter(0), True, 2)
+        self.assertEqual([items[0], items[1]], [4, 5])
+        self.assertEqual(items[-1], 3)
+        self.assertEqual(list(items), [4, 5, 0, 2, 1, 3])
+
+    def test_DT_In__InClass__prefetch(self):
+        calls = []
+
+        class Items(list):
+            def __dtml_prefetch__(self, start, end, names):
+                calls.append((start, end, sorted(names)))
+
+        seq = Items(Dummy(name, number) for number, name in enumerate(
+            'abcdefghij'))
+        body = '<dtml-var name><dtml-var "number * 2"></dtml-in>'
+        for args, result, call in (
+                ('size=3 start=4', 'd6e8f10', (3, 6, ['name', 'number'])),
+                ('size=3 start=4 reverse', 'g12f10e8',
+                 (4, 7, ['name', 'number'])),
+                ('size=3 start=4 sort=name/cmp/desc', 'g12f10e8',
+                 (0, 10, ['name', 'number'])),
+                ('', 'a0b2c4d6e8f10g12h14i16j18',
+                 (0, 10, ['name', 'number'])),
+                ('sort=maybe_callable', 'a0b2c4d6e8f10g12h14i16j18',
+                 (0, 10, ['maybe_callable', 'name', 'number']))):
+            del calls[:]
+            html = self.doc_class('<dtml-in seq %s>%s' % (args, body))
+            self.assertEqual(html(seq=seq), result)
+            self.assertEqual(calls, [call])
+
+    def test_DT_In__InClass__first_last(self):
+        seq = [Dummy(name) for name in 'aabbbcd']
+        template = ('<dtml-in seq %s><dtml-if first-name>(</dtml-if>'
+                    '<dtml-var name><dtml-if last-name>)</dtml-if></dtml-in>')
+        html = self.doc_class(template % '')
+        self.assertEqual(html(seq=seq), '(aa)(bbb)(c)(d)')
+        html = self.doc_class(template % 'size=3 start=2')
+        self.assertEqual(html(seq=seq), '(a)(bb)')
+
+    def test_DT_In__InClass__group_by(self):
+        seq = [Dummy(name, number) for number, name in enumerate(
+            'aabbbcdc')]
+        template = ('<dtml-in seq %s>[<dtml-var sequence-key>'
+                    '<dtml-in sequence-item><dtml-var number></dtml-in>]'
+                    '</dtml-in>')
+        for args, result in (
+                ('group_by=name', '[a01][b234][c5][d6][c7]'),
+                ('group_by=name sort=name', '[a01][b234][c57][d6]'),
+                ('group_by=name sort=name size=2 start=2', '[b234][c57]'),
+                ('group_by=name reverse', '[c7][d6][c5][b432][a10]')):
+            html = self.doc_class(template % args)
+            self.assertEqual(html(seq=seq), result)
+
+    def test_DT_In__InClass__group_by__mapping(self):
+        seq = [{'name': name} for name in 'aab']
+        html = self.doc_class(
+            '<dtml-in seq mapping group_by=name><dtml-var sequence-key>'
+            '<dtml-var expr="len(_[\'sequence-item\'])"></dtml-in>')
+        self.assertEqual(html(seq=seq), 'a2b1')
+        with self.assertRaises(ParseError):
+            self.doc_class('<dtml-in seq group_by>x</dtml-in>')(seq=seq)
+
+    def test_DT_In__InClass__stream(self):
+        seq = [Dummy(name, number) for number, name in enumerate('aabc')]
+        html = self.doc_class(
+            '<dtml-in seq stream><dtml-if sequence-start>^</dtml-if>'
+            '<dtml-if first-name>(</dtml-if><dtml-var sequence-index>'
+            '<dtml-var name><dtml-var sequence-var-number>'
+            '<dtml-if last-name>)</dtml-if>'
+            '<dtml-if sequence-end>$</dtml-if><dtml-else>empty</dtml-in>')
+        self.assertEqual(html(seq=iter(seq)), '^(0a01a1)(2b2)(3c3)$')
+        self.assertEqual(html(seq=iter(())), 'empty')
+        html = self.doc_class(
+            '<dtml-in seq stream mapping><dtml-var name></dtml-in>')
+        self.assertEqual(html(seq=({'name': n} for n in 'ab')), 'ab')
+
+    def test_DT_In__InClass__stream__memory(self):
+        import weakref
+        alive = weakref.WeakSet()
+
+        def items():
+            for number in range(100):
+                item = Dummy('x', number)
+                alive.add(item)
+                yield item
+
+        def count():
+            return len(alive)
+
+        html = self.doc_class(
+            '<dtml-in seq stream><dtml-var count>,</dtml-in>')
+        result = html(seq=items(), count=count)
+        self.assertEqual(max(int(n) for n in result.split(',')[:-1]), 3)
+
+    def test_DT_In__InClass__stream__errors(self):
+        for args in ('sort=name', 'reverse', 'size=10', 'group_by=name'):
+            with self.assertRaises(ParseError):
+                self.doc_class('<dtml-in seq stream %s></dtml-in>' % args)()
+        html = self.doc_class(
+            '<dtml-in seq stream><dtml-var total-number></dtml-in>')
+        with self.assertRaises(TypeError):
+            html(seq=iter([Dummy('a', 1)]))
+
+    def test_DT_In__InClass__item_namespace(self):
+        import types
+        seq = [types.SimpleNamespace(name='a', x=1),
+               types.SimpleNamespace(name='b'),
+               types.SimpleNamespace(name='c', x=3, children=[
+                   types.SimpleNamespace(name='d', children=None)])]
+        html = self.doc_class(
+            '<dtml-in seq><dtml-var name><dtml-var x>'
+            '<dtml-if children>(<dtml-var expr="tpl(None, _, seq=children)">)'
+            '</dtml-if></dtml-in>')
+        self.assertEqual(html(seq=seq, x=0, tpl=html, children=None),
+                         'a1b0c3(d3)')
+
+    def test_DT_In__InClass__skip_unauthorized(self):
+        from DocumentTemplate.DT_Util import ValidationError
+        calls = []
+
+        class GuardedHTML(self.doc_class):
+            def guarded_getitem(self, seq, index):
+                if seq[index].startswith('x'):
+                    raise ValidationError(seq[index])
+                return seq[index]
+
+        class FilteredHTML(GuardedHTML):
+            def guarded_filter(self, seq, start, end):
+                calls.append((start, end))
+                return [(index, seq[index]) for index in range(start, end)
+                        if not seq[index].startswith('x')]
+
+        seq = ['a', 'xb', 'c', 'xd', 'e']
+        for args, expected, bounds in [
+                ('', 'a0 c2 e4', (0, 5)),
+                ('size=2 start=2', ' c2', (1, 3)),
+                ('size=2 start=4', ' e4', (3, 5))]:
+            text = ('<dtml-in seq skip_unauthorized %s><dtml-unless '
+                    'sequence-start> </dtml-unless><dtml-var sequence-item>'
+                    '<dtml-var sequence-index></dtml-in>' % args)
+            for doc_class in (GuardedHTML, FilteredHTML):
+                self.assertEqual(doc_class(text)(seq=seq), expected)
+            self.assertEqual(calls.pop(), bounds)
+
+        html = FilteredHTML('<dtml-in seq><dtml-var sequence-item></dtml-in>')
+        with self.assertRaisesRegex(ValidationError, r'\(item 1\): .*xb'):
+            html(seq=seq)
+        self.assertEqual(calls, [])
@@ -1,6 +1,11 @@
 import re
 import string
+import types
 import unittest
+from decimal import Decimal
+from unittest import mock
+
+from DocumentTemplate import DT_InSV
 
 
 SEQUENCE = tuple(string.ascii_letters)
@@ -58,6 +63,29 @@ class sequence_variables_Tests(unittest.TestCase):
 
         self.assertEqual(sv.alt_prefix, 'prf_')
 
+    def test_current_item(self):
+        sv = self._makeOne(items='abc', alt_prefix='prf')
+        self.assertRaises(KeyError, sv.__getitem__, 'sequence-index')
+        self.assertRaises(KeyError, sv.__getitem__, 'prf_item')
+
+        sv['sequence-index'] = 1
+        sv['sequence-start'] = 0
+        sv.end = 1
+        self.assertEqual(sv.data, {})
+        sv['mapping'] = 0
+        self.assertEqual((sv.index, sv.start), (1, 0))
+        self.assertEqual(sv['prf_index'], 1)
+        self.assertEqual(sv['sequence-start'], 0)
+        self.assertEqual(sv['prf_end'], 1)
+        self.assertEqual(sv['prf_previous-sequence'], 0)
+        self.assertEqual(sv['sequence-item'], 'b')
+        self.assertEqual(sv['prf_number'], 2)
+        self.assertFalse(sv['sequence-even'])
+        self.assertEqual(sv['prf_roman'], 'ii')
+        self.assertEqual(sv['sequence-var-upper'](), 'B')
+        self.assertRaises(KeyError, sv.__getitem__, 'sequence-items')
+        self.assertRaises(KeyError, sv.__getitem__, 'prf_bounds')
+
     def test_length(self):
         sv = self._makeOne(items=(1, 2, 3))
 
@@ -93,6 +121,290 @@ class sequence_variables_Tests(unittest.TestCase):
 
         self.assertEqual(sv.roman(1), 'ii')
 
+    def test_statistics(self):
+        items = [{'n': 4}, {'n': None}, {'n': 1.5}, {}, {'n': 'x'}, {'n': 2}]
+        sv = self._makeOne(items=items)
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['total-n'], 7.5)
+        self.assertEqual(sv['count-n'], 3)
+        self.assertEqual(sv['min-n'], 1.5)
+        self.assertEqual(sv['max-n'], 4)
+        self.assertEqual(sv['median-n'], 2)
+        self.assertEqual(sv['mean-n'], 2.5)
+        self.assertEqual(sv['variance-n'], 1.7500000000000004)
+        self.assertEqual(sv['variance-n-n'], 1.166666666666667)
+        self.assertEqual(sv['standard-deviation-n'], 1.3228756555322954)
+        self.assertEqual(sv['standard-deviation-n-n'], 1.0801234497346435)
+
+    def test_statistics_results(self):
+        # The mean of the squares minus the squared mean, as always.
+        items = [{'f': i * 1.1 + 1e5, 'i': (i * 7919) % 10007 - 5000}
+                 for i in range(3000)]
+        expected = {
+            'total-f': 304948350.0,
+            'mean-f': 101649.45,
+            'variance-f': 907802.4999994403,
+            'variance-n-f': 907499.8991661072,
+            'standard-deviation-n-f': 952.6278912388127,
+            'median-f': 101649.0,
+            'total-i': 12910,
+            'mean-i': 4.303333333333334,
+            'variance-i': 8347551.181049239,
+            'variance-n-i': 8344768.663988889,
+            'standard-deviation-n-i': 2888.731324299456,
+            'median-i': 2,
+        }
+        with mock.patch.object(DT_InSV, 'numpy', None):
+            for key, value in expected.items():
+                sv = self._makeOne(items=items)
+                sv['mapping'] = 1
+                self.assertEqual(sv[key], value, key)
+
+    def test_statistics_of_decimals(self):
+        items = [{'n': Decimal('1.5')}, {'n': Decimal('2')},
+                 {'n': Decimal('4')}]
+        sv = self._makeOne(items=items)
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['total-n'], Decimal('7.5'))
+        self.assertEqual(sv['count-n'], 3)
+        self.assertEqual(sv['min-n'], Decimal('1.5'))
+        self.assertEqual(sv['max-n'], Decimal('4'))
+        self.assertEqual(sv['median-n'], Decimal('2'))
+        self.assertEqual(sv['mean-n'], Decimal('2.5'))
+        self.assertEqual(sv['variance-n'], Decimal('1.75'))
+        self.assertEqual(sv['standard-deviation-n'], 1.3228756555322954)
+
+    def test_statistics_of_mixed_numbers(self):
+        sv = self._makeOne(items=[{'n': 1}, {'n': Decimal('2.5')}])
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['total-n'], Decimal('3.5'))
+        self.assertEqual(sv['count-n'], 2)
+        self.assertEqual(sv['min-n'], 1)
+        self.assertEqual(sv['max-n'], Decimal('2.5'))
+        self.assertEqual(sv['mean-n'], Decimal('1.75'))
+        self.assertEqual(sv['variance-n-n'], Decimal('0.5625'))
+        # Decimal values cannot be added to floats, as always.
+        sv = self._makeOne(items=[{'n': 1.5}, {'n': Decimal('2')}])
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['total-n'], 1.5)
+        self.assertEqual(sv['count-n'], 1)
+        self.assertEqual(sv['median-n'], 1.5)
+
+    def test_statistics_computes_what_is_asked_for(self):
+        sv = self._makeOne(items=[{'n': 3}, {'n': 1}, {'n': 2}])
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['total-n'], 6)
+        self.assertIn('total-n', sv.data)
+        self.assertNotIn('median-n', sv.data)
+        self.assertEqual(set(sv.summaries['n'].results), {'total'})
+
+    def test_statistics_of_other_values(self):
+        items = [types.SimpleNamespace(name=name)
+                 for name in ('jim', None, 'will', 'drew', 'ches')]
+        sv = self._makeOne(items=items)
+        sv['mapping'] = 0
+
+        self.assertEqual(sv['count-name'], 4)
+        self.assertEqual(sv['min-name'], 'ches')
+        self.assertEqual(sv['max-name'], 'will')
+        self.assertEqual(sv['median-name'], 'between jim and drew')
+        self.assertEqual(sv['total-name'], '')
+        self.assertEqual(sv['mean-name'], '')
+        self.assertEqual(sv['variance-name'], '')
+        self.assertEqual(sv['standard-deviation-n-name'], '')
+
+    def test_statistics_without_values(self):
+        sv = self._makeOne(items=[{'n': None}])
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['count-n'], 0)
+        for stat in sv.statistic_names[2:]:
+            self.assertEqual(sv[f'{stat}-n'], '')
+
+    def test_statistics_of_one_value(self):
+        sv = self._makeOne(items=[{'n': 3}])
+        sv['mapping'] = 1
+
+        self.assertEqual(sv['median-n'], 3)
+        self.assertEqual(sv['variance-n-n'], 0.0)
+        self.assertEqual(sv['variance-n'], '')
+        self.assertEqual(sv['standard-deviation-n'], '')
+
+    def test_statistics_of_item(self):
+        sv = self._makeOne(items=[3, 1, 2])
+        sv['mapping'] = 0
+
+        self.assertEqual(sv['total-item'], 6)
+
+    @unittest.skipIf(DT_InSV.numpy is None, 'numpy is not installed')
+    def test_statistics_with_numpy(self):
+        items = [{'i': i % 7 - 3, 'f': i / 4 + 1e5, 'b': 2 ** 40 * i}
+                 for i in range(2001)]
+        results = {}
+        for min_count in (1, 10000):
+            with mock.patch.object(DT_InSV, 'NUMPY_MIN_COUNT', min_count), \
+                 mock.patch.object(DT_InSV, 'CHUNK_SIZE', 700), \
+                 mock.patch.object(DT_InSV.Sums, 'add_vectorized',
+                                   autospec=True,
+                                   side_effect=DT_InSV.Sums.add_vectorized
+                                   ) as add_vectorized:
+                sv = self._makeOne(items=items)
+                sv['mapping'] = 1
+                results[min_count] = [
+                    sv[f'{stat}-{name}']
+                    for stat in sv.statistic_names for name in 'ifb']
+            self.assertEqual(add_vectorized.call_count,
+                             9 if min_count == 1 else 0)
+        vectorized, plain = results.values()
+        for a, b in zip(vectorized, plain):
+            self.assertIs(type(a), type(b))
+            self.assertEqual(a, b)
+        # Sums of these integers could overflow with numpy.
+        sums = DT_InSV.Sums()
+        self.assertIsNone(
+            sums.add_vectorized([item['b'] for item in items], {int}))
+        self.assertEqual(sums.total, 0)
+
+
+class first_last_Tests(unittest.TestCase):
+
+    def _makeOne(self, items, bounds):
+        from DocumentTemplate.DT_InSV import sequence_variables
+        sv = sequence_variables(items)
+        sv['mapping'] = 0
+        sv.bounds = bounds
+        return sv
+
+    def _groups(self, sv, first, last):
+        result = []
+        for index in range(first, last + 1):
+            sv['sequence-index'] = index
+            sv['sequence-start'] = index == first
+            sv['sequence-end'] = index == last
+            result.append((bool(sv['first-group']), bool(sv['last-group'])))
+        return result
+
+    def test_values_are_looked_up_once(self):
+        lookups = []
+
+        class Item:
+            def __init__(self, group):
+                self._group = group
+
+            @property
+            def group(self):
+                lookups.append(self)
+                return self._group
+
+        items = [Item(group) for group in 'aabbbcd']
+        sv = self._makeOne(items, (1, 5))
+
+        self.assertEqual(self._groups(sv, 1, 5),
+                         [(True, True), (True, False), (False, False),
+                          (False, True), (True, True)])
+        self.assertEqual(len(lookups), 5)
+
+    def test_without_bounds(self):
+        items = [types.SimpleNamespace(group=group) for group in 'aab']
+        sv = self._makeOne(items, None)
+
+        self.assertEqual(self._groups(sv, 0, 2),
+                         [(True, False), (False, True), (True, True)])
+        self.assertIsNone(sv.groups['group'])
+
+    def test_missing_values(self):
+        items = [types.SimpleNamespace(group='a'), types.SimpleNamespace(),
+                 types.SimpleNamespace(group='a')]
+        sv = self._makeOne(items, (0, 2))
+        sv['sequence-index'] = 2
+        sv['sequence-start'] = sv['sequence-end'] = 0
+
+        self.assertRaises(AttributeError, sv.__getitem__, 'first-group')
+        self.assertIsNone(sv.groups['group'])
+
+
+class Batches_Tests(unittest.TestCase):
+
+    def _makeOne(self, items, start, size, overlap=0, orphan=0):
+        from DocumentTemplate.DT_InSV import opt
+        from DocumentTemplate.DT_InSV import sequence_variables
+        sv = sequence_variables(items)
+        start, end, size = opt(start, 0, size, orphan, items)
+        sv['mapping'] = 1
+        sv['sequence-step-start'] = start
+        sv['sequence-step-end'] = end
+        sv['sequence-step-size'] = size
+        sv['sequence-step-overlap'] = overlap
+        sv['sequence-step-orphan'] = orphan
+        sv['previous-sequence'] = start > 1
+        try:
+            items[end]
+        except IndexError:
+            sv['next-sequence'] = 0
+        else:
+            sv['next-sequence'] = 1
+        return sv
+
+    def _bounds(self, batches):
+        return [(batch['batch-start-index'], batch['batch-end-index'],
+                 batch['batch-size']) for batch in batches]
+
+    def test_next_batches(self):
+        sv = self._makeOne(SEQUENCE, 11, 10, overlap=2, orphan=3)
+        batches = sv['next-batches']
+
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(self._bounds(batches),
+                         [(18, 27, 10), (26, 35, 10), (34, 43, 10),
+                          (42, 51, 10)])
+        self.assertEqual(self._bounds(batches[-2:]),
+                         [(34, 43, 10), (42, 51, 10)])
+        self.assertRaises(IndexError, batches.__getitem__, 4)
+
+    def test_previous_batches(self):
+        sv = self._makeOne(SEQUENCE, 30, 10, overlap=2, orphan=3)
+        batches = sv['previous-batches']
+
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(self._bounds(batches),
+                         [(0, 6, 7), (5, 14, 10), (13, 22, 10),
+                          (21, 30, 10)])
+        self.assertEqual(self._bounds([batches[-1]]), [(21, 30, 10)])
+        self.assertRaises(IndexError, batches.__getitem__, 4)
+
+    def test_no_batches(self):
+        sv = self._makeOne(SEQUENCE, 1, 60)
+
+        self.assertEqual(sv['next-batches'], ())
+        self.assertEqual(sv['previous-batches'], ())
+
+    def test_batches_are_computed_when_accessed(self):
+        class Items:
+            accessed = 0
+
+            def __getitem__(self, index):
+                if index >= 100000:
+                    raise IndexError(index)
+                self.accessed = max(self.accessed, index)
+                return index
+
+            def __len__(self):
+                raise AssertionError('len() is not needed')
+
+        items = Items()
+        sv = self._makeOne(items, 1, 10)
+        batches = sv['next-batches']
+
+        self.assertTrue(batches)
+        self.assertEqual(self._bounds([batches[0], batches[9]]),
+                         [(10, 19, 10), (100, 109, 10)])
+        self.assertLess(items.accessed, 120)
+
 
 class opt_Tests(unittest.TestCase):
     """ The opt function calculates batch values
@@ -0,0 +1,263 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+SOURCE = """\
+<dtml-let x="1 + 1" y=title>
+<dtml-in seq prefix=s mapping sort_expr="'key'"><dtml-var s_item
+  fmt="%s"> <dtml-var key html_quote>
+<dtml-if "s_index == 0">first<dtml-elif x>more</dtml-if></dtml-in>
+<dtml-try><dtml-var missing><dtml-except KeyError>caught</dtml-try>
+<dtml-with "_.namespace(z=y)"><dtml-var z></dtml-with>
+</dtml-let>"""
+
+
+class ParseTests(unittest.TestCase):
+    """Testing ..DT_String.String.parse."""
+
+    def _makeOne(self, source):
+        from DocumentTemplate.DT_HTML import HTML
+        return HTML(source)
+
+    def test_nested_sections(self):
+        template = self._makeOne(
+            '<dtml-if a>\nA<dtml-in s>[<dtml-if sequence-item>x<dtml-else>'
+            'y</dtml-if>]</dtml-in><dtml-elif b>B<dtml-else>\nC</dtml-if>.')
+        self.assertEqual(template(a=1, s=[0, 1]), 'A[y][x].')
+        self.assertEqual(template(a=0, b=1), 'B.')
+        self.assertEqual(template(a=0, b=0), 'C.')
+
+    def test_deep_nesting(self):
+        source = 'x'
+        for i in range(300):
+            source = f'<dtml-if a>{source}<dtml-else>-</dtml-if>'
+        self.assertEqual(self._makeOne(source)(a=1), 'x')
+
+    def test_else_with_other_args_opens_block(self):
+        template = self._makeOne(
+            '<dtml-in s><dtml-else t>no t</dtml-else></dtml-in>')
+        self.assertEqual(template(s=[1], t=0), 'no t')
+
+    def test_no_closing_tag_reports_innermost_block(self):
+        from DocumentTemplate.DT_Util import ParseError
+        template = self._makeOne('<dtml-if a>\n<dtml-in s>\n</dtml-if>')
+        with self.assertRaisesRegex(ParseError, 'unexpected end tag'):
+            template()
+        template = self._makeOne('<dtml-if a>\n<dtml-in s>\n')
+        with self.assertRaisesRegex(ParseError,
+                                    'No closing tag.*dtml-in s.*line 2'):
+            template()
+
+
+class IterRenderTests(unittest.TestCase):
+    """Testing ..DT_String.String.iter_render."""
+
+    def _makeOne(self, source, chunk_size=1):
+        from DocumentTemplate.DT_HTML import HTML
+
+        class StreamedHTML(HTML):
+            stream_chunk_size = chunk_size
+        return StreamedHTML(source)
+
+    def test_same_text_as_call(self):
+        template = self._makeOne(SOURCE)
+        seq = [{'key': 'b<'}, {'key': 'a'}]
+        self.assertEqual(''.join(template.iter_render(seq=seq, title='t')),
+                         template(seq=seq, title='t'))
+
+    def test_in_tag_is_streamed(self):
+        template = self._makeOne(
+            '<dtml-in seq><dtml-let x=sequence-item><dtml-with "_">'
+            '[<dtml-var x>]</dtml-with></dtml-let></dtml-in>')
+        chunks = template.iter_render(seq=[0, 1, 2])
+        self.assertEqual(list(chunks), ['[', '0', ']', '[', '1', ']',
+                                        '[', '2', ']'])
+
+    def test_chunks_are_joined_up_to_chunk_size(self):
+        template = self._makeOne(
+            '<dtml-in seq><dtml-var sequence-item>,</dtml-in>', 4)
+        self.assertEqual(list(template.iter_render(seq=range(5))),
+                         ['0,1,', '2,3,', '4,'])
+
+    def test_namespace_is_cleaned_up_when_closed(self):
+        from DocumentTemplate._DocumentTemplate import TemplateDict
+        template = self._makeOne('<dtml-in seq>x</dtml-in>')
+        md = TemplateDict()
+        md.guarded_getattr = md.guarded_getitem = None
+        md._push({'seq': [1, 2]})
+        chunks = template.iter_render(None, md)
+        self.assertEqual(next(chunks), 'x')
+        self.assertEqual(len(md._data), 4)
+        chunks.close()
+        self.assertEqual(len(md._data), 1)
+        self.assertEqual(md.level, 0)
+
+    def test_return(self):
+        from DocumentTemplate.DT_Return import DTReturn
+        template = self._makeOne('x<dtml-return "42">', 10)
+        self.assertEqual(list(template.iter_render()), [42])
+        template = self._makeOne('x<dtml-return "42">')
+        with self.assertRaises(DTReturn):
+            list(template.iter_render())
+
+
+class RenderToTests(unittest.TestCase):
+    """Testing ..DT_String.String.render_to."""
+
+    def _makeOne(self, source, encoding=None):
+        from DocumentTemplate.DT_HTML import HTML
+        return HTML(source, encoding=encoding)
+
+    def test_text_stream(self):
+        import io
+        template = self._makeOne(SOURCE)
+        seq = [{'key': 'b<'}, {'key': 'a'}]
+        out = io.StringIO()
+        self.assertIsNone(template.render_to(out, seq=seq, title='t'))
+        self.assertEqual(out.getvalue(), template(seq=seq, title='t'))
+
+    def test_binary_stream(self):
+        import io
+        out = io.BytesIO()
+        self._makeOne('<dtml-var x>').render_to(out, x='\xe4')
+        self.assertEqual(out.getvalue(), b'\xc3\xa4')
+        out = io.BytesIO()
+        self._makeOne('<dtml-var x>', 'latin-1').render_to(out, x='\xe4')
+        self.assertEqual(out.getvalue(), b'\xe4')
+
+    def test_callable(self):
+        written = []
+        template = self._makeOne('<dtml-in seq><dtml-var sequence-item>'
+                                 '</dtml-in>')
+        template.render_to(written.append, seq=['a', '\xe4'])
+        self.assertEqual(''.join(written), 'a\xe4')
+        written = []
+        template.render_to(written.append, seq=['a', '\xe4'],
+                           output_encoding='utf-8')
+        self.assertEqual(b''.join(written), b'a\xc3\xa4')
+
+    def test_return(self):
+        written = []
+        self._makeOne('<dtml-return "42">').render_to(written.append)
+        self.assertEqual(written, ['42'])
+
+
+class RenderEncodedTests(unittest.TestCase):
+    """Testing ..DT_String.String.render_encoded."""
+
+    def _makeOne(self, source, encoding=None):
+        from DocumentTemplate.DT_HTML import HTML
+        return HTML(source, encoding=encoding)
+
+    def test_same_text_as_call(self):
+        template = self._makeOne(SOURCE + '\xe4')
+        seq = [{'key': 'b<'}, {'key': '\xf6'}]
+        self.assertEqual(template.render_encoded(seq=seq, title='t'),
+                         template(seq=seq, title='t').encode('utf-8'))
+
+    def test_output_encoding(self):
+        template = self._makeOne(
+            '<p>\xe4<dtml-in seq><dtml-var sequence-item></dtml-in></p>',
+            'latin-1')
+        self.assertEqual(template.render_encoded(seq=['\xf6', b'\xfc']),
+                         b'<p>\xe4\xf6\xfc</p>')
+        self.assertEqual(
+            template.render_encoded(seq=['\xf6', b'\xfc'],
+                                    output_encoding='utf-8'),
+            b'<p>\xc3\xa4\xc3\xb6\xc3\xbc</p>')
+
+    def test_renderer_is_reused(self):
+        template = self._makeOne('<p><dtml-var x></p>')
+        self.assertEqual(template.render_encoded(x=1), b'<p>1</p>')
+        renderer = template._encoded_renderer('utf-8')
+        self.assertEqual(template.render_encoded(x=2), b'<p>2</p>')
+        self.assertIs(template._encoded_renderer('utf-8'), renderer)
+        template.munge('<b><dtml-var x></b>')
+        self.assertEqual(template.render_encoded(x=3), b'<b>3</b>')
+        self.assertIsNot(template._encoded_renderer('utf-8'), renderer)
+
+    def test_bytes_are_recoded(self):
+        template = self._makeOne('<dtml-var x>')
+        self.assertEqual(template.render_encoded(x=b'\xc3\xa4'),
+                         b'\xc3\xa4')
+        # Older objects without encoding have Latin-1 data.
+        del template.encoding
+        self.assertEqual(template.render_encoded(x=b'\xe4'), b'\xc3\xa4')
+
+    def test_return(self):
+        template = self._makeOne('x<dtml-return "42">')
+        self.assertEqual(template.render_encoded(), b'42')
+
+
+class FileCacheTests(unittest.TestCase):
+    """Testing ..DT_String.FileMixin.cache_directory."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'template.dtml')
+        self._write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, source):
+        with open(self.filename, 'w') as f:
+            f.write(source)
+
+    def _makeOne(self):
+        from DocumentTemplate.DT_HTML import HTMLFile
+
+        class CachedHTMLFile(HTMLFile):
+            cache_directory = self.cachedir
+        return CachedHTMLFile(self.filename)
+
+    def _render(self, template):
+        return template(title='T', seq=[{'key': 'b'}, {'key': 'a'}])
+
+    def test_cache_is_written_and_used(self):
+        expected = self._render(self._makeOne())
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
+
+        template = self._makeOne()
+
+        def parse(*args):
+            raise AssertionError('template parsed again')
+        template.parse = parse
+        self.assertEqual(self._render(template), expected)
+
+    def test_changed_source_is_parsed(self):
+        self._render(self._makeOne())
+        self._write('changed')
+        st = os.stat(self.filename)
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(self._makeOne()(), 'changed')
+
+    def test_damaged_cache_file_is_ignored(self):
+        self._render(self._makeOne())
+        for name in os.listdir(self.cachedir):
+            with open(os.path.join(self.cachedir, name), 'wb') as f:
+                f.write(b'garbage')
+        self.assertEqual(self._render(self._makeOne()).count('caught'), 1)
+
+    def test_unpicklable_blocks_are_not_cached(self):
+        from DocumentTemplate.DT_String import store_cached_blocks
+        filename = os.path.join(self.cachedir, 'x.dtml')
+        self.assertFalse(store_cached_blocks(filename, (), [lambda md: 1]))
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_compiled_blocks(self):
+        template = self._makeOne()
+        template.compile_blocks = True
+        expected = self._render(template)
+        template = self._makeOne()
+        template.compile_blocks = True
+        self.assertEqual(self._render(template), expected)
+
+    def test_no_cache_directory(self):
+        from DocumentTemplate.DT_HTML import HTMLFile
+        self.assertEqual(self._render(HTMLFile(self.filename)),
+                         self._render(self._makeOne()))
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
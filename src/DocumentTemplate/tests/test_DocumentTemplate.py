@@ -47,3 +47,80 @@ class InstanceDictTests(unittest.TestCase):
         path = side.here.__of__(main)
         i_dict = InstanceDict(path, {}, getattr)
         self.assertEqual(main.sub, i_dict['sub'])
+
+    def test_rebind(self):
+        from DocumentTemplate._DocumentTemplate import InstanceDict
+
+        i_dict = InstanceDict(Item('a'), {}, getattr)
+        self.assertEqual(i_dict['id'], 'a')
+        i_dict.rebind(Item('b'))
+        self.assertEqual(i_dict['id'], 'b')
+        self.assertEqual(i_dict.cache, {'id': 'b'})
+
+
+class CompileBlocksTests(unittest.TestCase):
+    """Testing .._DocumentTemplate.compile_blocks."""
+
+    def _render(self, blocks, **kw):
+        from DocumentTemplate._DocumentTemplate import TemplateDict
+        from DocumentTemplate._DocumentTemplate import compile_blocks
+        from DocumentTemplate._DocumentTemplate import render_blocks
+
+        md = TemplateDict()
+        md._push(kw)
+        rendered = []
+        compile_blocks(blocks)(rendered, md, 'utf-8')
+        self.assertEqual(''.join(rendered), render_blocks(blocks, md))
+        self.assertEqual(len(md._data), 1)
+        return ''.join(rendered)
+
+    def test_literal_and_var(self):
+        blocks = ['a', '', ('v', 'x'), ('v', 'y', 'h')]
+        self.assertEqual(self._render(blocks, x=1, y='<b>'), 'a1&lt;b&gt;')
+
+    def test_callable_blocks(self):
+        blocks = [('v', lambda md: '<%s>' % md['x'], 'h'),
+                  lambda md: md['x'] * 2]
+        self.assertEqual(self._render(blocks, x='z'), '&lt;z&gt;zz')
+
+    def test_if_elif_else(self):
+        blocks = [('i', 'a', ['A'], 'b', ['B'], ['C'])]
+        self.assertEqual(self._render(blocks, a=1, b=1), 'A')
+        self.assertEqual(self._render(blocks, a=0, b=1), 'B')
+        self.assertEqual(self._render(blocks, a=0, b=0), 'C')
+        self.assertEqual(self._render(blocks, b=0), 'C')
+
+    def test_unless_and_call(self):
+        blocks = [('i', 'a', None, ['U']), ('i', 'a', None)]
+        self.assertEqual(self._render(blocks, a=0), 'U')
+        self.assertEqual(self._render(blocks, a=1), '')
+
+    def test_if_caches_condition(self):
+        blocks = [('i', 'a', [('v', 'a')])]
+        self.assertEqual(self._render(blocks, a=[1]), '[1]')
+
+    def test_if_unrelated_keyerror(self):
+        from DocumentTemplate._DocumentTemplate import TemplateDict
+        from DocumentTemplate._DocumentTemplate import compile_blocks
+
+        def a():
+            raise KeyError('b')
+
+        md = TemplateDict()
+        md._push({'a': a})
+        render = compile_blocks([('i', 'a', ['A'])])
+        with self.assertRaises(KeyError):
+            render([], md, None)
+        self.assertEqual(len(md._data), 1)
+
+    def test_deep_nesting(self):
+        blocks = ['x']
+        for i in range(60):
+            blocks = [('i', 'a', blocks, 'b', ['no'], ['no'])]
+        self.assertEqual(self._render(blocks, a=1, b=0), 'x')
+
+    def test_invalid_command_code(self):
+        from DocumentTemplate._DocumentTemplate import compile_blocks
+        render = compile_blocks(['a', ('x', 'y')])
+        with self.assertRaises(ValueError):
+            render([], {}, None)
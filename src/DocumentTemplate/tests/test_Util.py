@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from ..DT_Util import SequenceFromIter
+from ..DT_Util import SequenceWindow
 from ..DT_Util import sequence_ensure_subscription
 from ..DT_Util import sequence_supports_subscription
 
@@ -65,3 +66,60 @@ class SequenceTests(TestCase):
         self.assertEqual(list(s), [0, 1])
         self.assertEqual(len(s), 2)
         self.assertEqual(len(S(i for i in range(2))), 2)
+
+    def test_Window(self):
+        s = SequenceWindow(iter(range(5)))
+        self.assertTrue(s.move(0))
+        self.assertEqual(s[1], 1)
+        self.assertTrue(s.move(3))
+        self.assertEqual(s.data, [2, 3])
+        self.assertEqual(s[2], 2)
+        self.assertEqual(s[4], 4)
+        with self.assertRaises(IndexError):
+            s[1]
+        with self.assertRaises(IndexError):
+            s[5]
+        self.assertFalse(s.move(5))
+        with self.assertRaises(TypeError):
+            len(s)
+        with self.assertRaises(TypeError):
+            list(s)
+
+
+class EvalTests(TestCase):
+
+    def _makeOne(self, expr):
+        from ..DT_Util import Eval
+        return Eval(expr)
+
+    def test_code_is_shared(self):
+        from .._DocumentTemplate import TemplateDict
+        one = self._makeOne('a + b')
+        two = self._makeOne('\na + b ')
+        self.assertIs(one.ucode, two.ucode)
+        self.assertEqual(sorted(one.used), ['a', 'b'])
+
+        md = TemplateDict()
+        md._push({'a': 1, 'b': 2})
+        md.guarded_getattr = getattr
+        md.guarded_getitem = None
+        self.assertEqual(one.eval(md), 3)
+        self.assertEqual(two.eval(md), 3)
+        self.assertIs(one.rcode, two.rcode)
+
+    def test_syntax_error(self):
+        with self.assertRaises(SyntaxError):
+            self._makeOne('a +')
+        expr = self._makeOne('_x')
+        with self.assertRaises(SyntaxError):
+            expr.prepRestrictedCode()
+        with self.assertRaises(SyntaxError):
+            expr.prepRestrictedCode()
+
+    def test_cache_is_bounded(self):
+        from ..DT_Util import EVAL_CACHE_SIZE
+        from ..DT_Util import compile_unrestricted
+        for i in range(EVAL_CACHE_SIZE + 10):
+            self._makeOne('x%d' % i)
+        self.assertEqual(compile_unrestricted.cache_info().currsize,
+                         EVAL_CACHE_SIZE)
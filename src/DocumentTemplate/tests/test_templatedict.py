@@ -192,3 +192,105 @@ class TestRestrictedTemplateDict(unittest.TestCase):
             return td['tainted']
         found = func(td)
         self.assertEqual(found, 'found')
+
+
+class TestLookupCache(unittest.TestCase):
+
+    def _makeOne(self):
+        td = TemplateDict()
+        td._enable_lookup_cache()
+        return td
+
+    def test_disabled(self):
+        td = TemplateDict()
+        self.assertIsNone(td.lookup_cache_info())
+
+    def test_counters(self):
+        td = self._makeOne()
+        td._push({'one': 1})
+        td._push({'two': 2})
+        self.assertEqual(td['one'], 1)
+        self.assertEqual(td['one'], 1)
+        self.assertIn('one', td)
+        self.assertNotIn('three', td)
+        self.assertNotIn('three', td)
+        self.assertEqual(td.lookup_cache_info(),
+                         {'hits': 3, 'misses': 2, 'size': 2})
+
+    def test_push_pop(self):
+        td = self._makeOne()
+        td._push({'one': 1})
+        self.assertEqual(td['one'], 1)
+        td._push({'one': 11})
+        self.assertEqual(td['one'], 11)
+        td._pop()
+        self.assertEqual(td['one'], 1)
+        td._pop()
+        td._push({'one': 111})
+        self.assertEqual(td['one'], 111)
+        td._pop()
+        self.assertNotIn('one', td)
+
+    def test_replaced_layers(self):
+        td = self._makeOne()
+        td._push({'name': 'dict'})
+        td._push(InstanceDict(object(), td, getattr))
+        self.assertEqual(td['name'], 'dict')
+        td._pop()
+        td._push(InstanceDict(DummyDocTemp('inst'), td, getattr))
+        self.assertEqual(td['name'], 'inst')
+
+    def test_mutated_mappings(self):
+        td = self._makeOne()
+        bottom = {'one': 1}
+        top = {}
+        td._push(bottom)
+        td._push(top)
+        self.assertEqual(td['one'], 1)
+        top['one'] = 2
+        self.assertEqual(td['one'], 2)
+        del top['one']
+        del bottom['one']
+        self.assertNotIn('one', td)
+        bottom['one'] = 3
+        self.assertEqual(td['one'], 3)
+
+    def test_instance_misses_are_skipped(self):
+        class Inst:
+            pass
+
+        td = self._makeOne()
+        td._push({'one': 1})
+        inst = Inst()
+        td._push(InstanceDict(inst, td, getattr))
+        self.assertEqual(td['one'], 1)
+        # The attribute showed up after the instance missed it.
+        inst.one = 2
+        self.assertEqual(td['one'], 1)
+        td._pop()
+        td._push(InstanceDict(inst, td, getattr))
+        self.assertEqual(td['one'], 2)
+
+    def test_rebound_instance(self):
+        class Inst:
+            pass
+
+        td = self._makeOne()
+        td._push({'one': 1})
+        inst = Inst()
+        namespace = InstanceDict(inst, td, getattr)
+        td._push(namespace)
+        self.assertEqual(td['one'], 1)
+        td._pop()
+        other = Inst()
+        other.one = 2
+        namespace.rebind(other)
+        td._push(namespace)
+        self.assertEqual(td['one'], 2)
+
+    def test_call(self):
+        td = self._makeOne()
+        td._push({'one': DummyDocTemp('one')})
+        self.assertEqual(td['one'], ('doctemp', 'one', (None, td)))
+        self.assertEqual(td['one'], ('doctemp', 'one', (None, td)))
+        self.assertIsInstance(td.getitem('one'), DummyDocTemp)
@@ -13,8 +13,11 @@
 """Rendering object hierarchies as Trees
 """
 
+import functools
 import json
 import zlib
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
 from binascii import a2b_base64
 from binascii import b2a_base64
 
@@ -25,11 +28,25 @@ from DocumentTemplate.DT_Util import Eval
 from DocumentTemplate.DT_Util import ParseError
 from DocumentTemplate.DT_Util import ValidationError
 from DocumentTemplate.DT_Util import add_with_prefix
+from DocumentTemplate.DT_Util import guarded_items
 from DocumentTemplate.DT_Util import name_param
 from DocumentTemplate.DT_Util import parse_params
 from DocumentTemplate.DT_Util import simple_name
 
 
+# Encoded tree states and paths start with the marker, followed by the
+# version of the format.  The format used before did not have a marker.
+STATE_MARKER = '.'
+STATE_MARKER_BYTES = STATE_MARKER.encode('ascii')
+STATE_VERSION = 1
+STATE_COMPRESSED = 1
+# States of at least this many bytes are compressed if that helps.
+STATE_COMPRESS_MIN = 64
+# The largest size of a decompressed tree state.
+STATE_MAX_SIZE = 1 << 20
+# The number of base64 ids of oids shared between all renders.
+OID_ID_CACHE_SIZE = 10000
+
 tbl = b''.join([chr(i).encode('latin-1') for i in range(256)])
 
 tplus = tbl[:ord('+')] + b'-' + tbl[ord('+') + 1:]
@@ -64,6 +81,9 @@ class Tree:
                             # closed_decoration=None,
                             # childless_decoration=None,
                             assume_children=1,
+                            max_depth=None,
+                            max_nodes=None,
+                            oid_format=None,
                             urlparam=None, prefix=None)
         if '' in args or 'name' in args or 'expr' in args:
             name, expr = name_param(args, 'tree', 1)
@@ -95,6 +115,18 @@ class Tree:
             raise ParseError(
                 'prefix is not a simple name', 'tree')
 
+        for limit in ('max_depth', 'max_nodes'):
+            if limit in args:
+                try:
+                    args[limit] = int(args[limit])
+                except ValueError:
+                    raise ParseError(
+                        '%s is not a number' % limit, 'tree')
+
+        if args.get('oid_format', 'base64') not in OID_IDS:
+            raise ParseError(
+                'oid_format is not base64, hex or int', 'tree')
+
         self.__name__ = name
         self.section = section.blocks
         self.args = args
@@ -142,20 +174,30 @@ def tpRender(self, md, section, args,
       ['eagle'], # eagle is open
       ['eagle'], ['jeep', [1983, 1985]]  # eagle, jeep, 1983 jeep and 1985 jeep
 
-    where the items are object ids. The state will be pickled to a
-    compressed and base64ed string that gets unencoded, uncompressed,
-    and unpickled on the other side.
+    where the items are object ids. The state will be encoded in a
+    compact binary format and base64ed, see 'encode_seq', and decoded on
+    the other side.
 
     Note that ids used in state need not be connected to urls, since
     state manipulation is internal to rendering logic.
 
+    If the request has a 'tree-p' variable, only the rows of the
+    children of one node are rendered, without the enclosing table, so
+    that they can be fetched when the node is expanded.  The value is
+    the encoded path to the node, as in the 'tree-e' parameter of the
+    link that expands it.  The node is expanded in the stored state.
+
     Note that to make unpickling safe, we use the MiniPickle module,
     that only creates safe objects
     """
 
     data = []
 
-    id = extract_id(self, args['id'])
+    node_id = NodeIds(args['id'], args.get('oid_format'))
+    id = node_id(self)
+    fragment = None
+    # The children of the nodes by their python id, if already known.
+    children = None
 
     try:
         # see if we are being run as a sub-document
@@ -188,7 +230,9 @@ def tpRender(self, md, section, args,
                     items = branches_expr(md)
                     md._pop()
                     return items
-            state = [id, tpValuesIds(self, get_items, args)],
+            children = {}
+            state = [id, tpValuesIds(self, get_items, args, children,
+                                     node_id)],
         else:
             if 'tree-s' in md:
                 state = md['tree-s']
@@ -209,6 +253,13 @@ def tpRender(self, md, section, args,
                 diff = decode_seq(md['tree-c'])
                 apply_diff(state, diff, 0)
 
+        if 'tree-p' in md:
+            # Only render the rows of the children of a node.
+            fragment = decode_seq(md['tree-p'])
+            if not fragment or fragment[0] != decode_id(id, encoding):
+                return ''
+            apply_diff(state, list(fragment), 1)
+
         colspan = tpStateLevel(state)
         substate = state
         diff = []
@@ -234,7 +285,8 @@ def tpRender(self, md, section, args,
     try:
         tpRenderTABLE(
             self, id, root, url, state, substate, diff, data, colspan,
-            section, md, treeData, level, args, encoding=encoding)
+            section, md, treeData, level, args, encoding=encoding,
+            fragment=fragment, children=children, node_id=node_id)
     finally:
         md._pop(2)
 
@@ -248,10 +300,21 @@ def tpRender(self, md, section, args,
 
 def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                   colspan, section, md, treeData, level=0, args=None,
-                  try_call_attr=try_call_attr, encoding=None,
-                  ):
-    """Render a tree as a table"""
+                  try_call_attr=try_call_attr, encoding=None, path=None,
+                  fragment=None, children=None, node_id=None):
+    """Render a tree as a table
+
+    'diff' is the list of the ids of the ancestors of the node and
+    'path' a 'PathEncoder' for them.  If 'fragment' is the path to a
+    node, only the rows of the children of that node are rendered.
+    'children' are the known children of nodes, see 'tpItems', and
+    'node_id' returns the ids of nodes, see 'NodeIds'.
+    """
     encoding = encoding or 'latin-1'
+    if path is None:
+        path = PathEncoder(diff)
+    if node_id is None:
+        node_id = NodeIds(args['id'], args.get('oid_format'))
     exp = 0
 
     if level >= 0:
@@ -282,74 +345,30 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
         if not exp:
             items = 1
 
-    get = md.guarded_getattr
-    if get is None:
-        get = getattr
-
     if items is None:
-        if 'branches' in args and hasattr(self, args['branches']):
-            items = get(self, args['branches'])
-            items = items()
-        elif 'branches_expr' in args:
-            items = args['branches_expr'](md)
-
-        if not items and 'leaves' in args:
-            items = 1
-
-    if items and items != 1:
-
-        getitem = getattr(md, 'guarded_getitem', None)
-        if getitem is not None:
-            unauth = []
-            for index in range(len(items)):
-                try:
-                    getitem(items, index)
-                except ValidationError:
-                    unauth.append(index)
-            if unauth:
-                if 'skip_unauthorized' in args and args['skip_unauthorized']:
-                    items = list(items)
-                    unauth.reverse()
-                    for index in unauth:
-                        del items[index]
-                else:
-                    raise ValidationError(unauth)
-
-        if 'sort' in args:
-            # Faster/less mem in-place sort
-            if isinstance(items, tuple):
-                items = list(items)
-            sort = args['sort']
-            size = range(len(items))
-            for i in size:
-                v = items[i]
-                k = getattr(v, sort)
-                try:
-                    k = k()
-                except Exception:
-                    pass
-                items[i] = (k, v)
-            items.sort()
-            for i in size:
-                items[i] = items[i][1]
-
-        if 'reverse' in args:
-            items = list(items)  # Copy the list
-            items.reverse()
+        items = tpItems(self, md, args, children)
 
-    if isinstance(id, bytes):
-        diff.append(id.decode(encoding))
-    else:
-        diff.append(id)
+    diff.append(decode_id(id, encoding))
+    # Whether the node is an ancestor of the node of the fragment.
+    on_path = fragment is not None and len(diff) < len(fragment)
 
     _td_colspan = '<td colspan="%s" style="white-space: nowrap"></td>'
     _td_single = '<td width="16" style="white-space: nowrap"></td>'
 
     sub = None
     if substate is state:
-        output('<table cellspacing="0">\n')
+        if fragment is None:
+            output('<table cellspacing="0">\n')
         sub = substate[0]
         exp = items
+    elif fragment is not None:
+        # The rows of the node and its ancestors are not rendered.
+        if items:
+            for i in range(len(substate)):
+                sub = substate[i]
+                if sub[0] == diff[-1]:
+                    exp = i + 1
+                    break
     else:
         # Add prefix
         output('<tr>\n')
@@ -370,11 +389,7 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                     exp = i + 1
                     break
 
-            s = encode_str(compress(json.dumps(diff)))  # bytes in ASCII enc.
-
-            # For rendering the encoded state string in a URL,
-            # we must lose the "b" prefix by decoding
-            s = s.decode('ASCII')
+            s = path.encode()
 
             # Propagate extra args through tree.
             if 'urlparam' in args:
@@ -423,7 +438,7 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
         else:
             h = ''
 
-        if 'header' in args:
+        if 'header' in args and not on_path:
             doc = args['header']
             if doc in md:
                 doc = md.getitem(doc, 0)
@@ -442,7 +457,7 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
 
         if items == 1:
             # leaves
-            if 'leaves' in args:
+            if 'leaves' in args and not on_path:
                 doc = args['leaves']
                 if doc in md:
                     doc = md.getitem(doc, 0)
@@ -465,7 +480,7 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                         ))
                     finally:
                         md._pop(1)
-        elif 'expand' in args:
+        elif 'expand' in args and not on_path:
             doc = args['expand']
             if doc in md:
                 doc = md.getitem(doc, 0)
@@ -492,7 +507,9 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
             __traceback_info__ = sub, args, state, substate
             ids = {}
             for item in items:
-                id = extract_id(item, args['id'])
+                id = node_id(item)
+                if on_path and decode_id(id, encoding) != fragment[len(diff)]:
+                    continue
                 if len(sub) == 1:
                     sub.append([])
                 substate = sub[1]
@@ -501,7 +518,9 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                 try:
                     data = tpRenderTABLE(
                         item, id, root_url, url, state, substate, diff, data,
-                        colspan, section, md, treeData, level, args)
+                        colspan, section, md, treeData, level, args,
+                        path=path, fragment=fragment if on_path else None,
+                        children=children, node_id=node_id)
                 finally:
                     md._pop()
                 if not sub[1]:
@@ -512,7 +531,7 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                 if not ids(substate[i][0]):
                     del substate[i]
 
-        if 'footer' in args:
+        if 'footer' in args and not on_path:
             doc = args['footer']
             if doc in md:
                 doc = md.getitem(doc, 0)
@@ -531,12 +550,108 @@ def tpRenderTABLE(self, id, root_url, url, state, substate, diff, data,
                 ))
 
     del diff[-1]
-    if not diff:
+    path.pop()
+    if not diff and fragment is None:
         output('</table>\n')
 
     return data
 
 
+class PathEncoder:
+    """Encode the paths to the nodes of a tree like 'encode_seq'.
+
+    `ids` is the list of the ids of the path to the current node.  The
+    packed ids of the nodes whose paths were encoded are kept, so that
+    encoding the path to a node only packs the ids that are new.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        # The packed ids at the start of the path and the last string
+        # id in them.
+        self.prefixes = [(b'', '')]
+
+    def pop(self):
+        """Forget the packed ids that were removed from the path."""
+        del self.prefixes[len(self.ids) + 1:]
+
+    def encode(self):
+        """Return the encoded path to the current node."""
+        prefixes = self.prefixes
+        for id in self.ids[len(prefixes) - 1:]:
+            packed, previous = prefixes[-1]
+            out = bytearray(packed)
+            previous = pack_value(out, id, previous)
+            prefixes.append((bytes(out), previous))
+        out = bytearray((STATE_VERSION, 0))
+        pack_head(out, KIND_LIST, len(prefixes) - 1)
+        out += prefixes[-1][0]
+        out = urlsafe_b64encode(out).rstrip(b'=')
+        return STATE_MARKER + out.decode('ascii')
+
+
+def tpItems(self, md, args, children=None):
+    """Return the children of the node `self`, 1 for leaves.
+
+    The node has to be on top of the namespace `md`.  `children` maps
+    the python ids of nodes to their children if these are already
+    known, as after computing the state of 'expand_all'.
+    """
+    get = md.guarded_getattr
+    if get is None:
+        get = getattr
+
+    items = None
+    if children is not None and pyid(self) in children:
+        items = children[pyid(self)]
+    elif 'branches' in args and hasattr(self, args['branches']):
+        items = get(self, args['branches'])
+        items = items()
+    elif 'branches_expr' in args:
+        items = args['branches_expr'](md)
+
+    if not items and 'leaves' in args:
+        items = 1
+
+    if items and items != 1:
+
+        getitem = getattr(md, 'guarded_getitem', None)
+        if getitem is not None:
+            length = len(items)
+            allowed = guarded_items(md, items, 0, length)
+            if len(allowed) < length:
+                if 'skip_unauthorized' in args and args['skip_unauthorized']:
+                    items = [items[index] for index in range(length)
+                             if index in allowed]
+                else:
+                    raise ValidationError([index for index in range(length)
+                                           if index not in allowed])
+
+        if 'sort' in args:
+            # Faster/less mem in-place sort
+            if isinstance(items, tuple):
+                items = list(items)
+            sort = args['sort']
+            size = range(len(items))
+            for i in size:
+                v = items[i]
+                k = getattr(v, sort)
+                try:
+                    k = k()
+                except Exception:
+                    pass
+                items[i] = (k, v)
+            items.sort()
+            for i in size:
+                items[i] = items[i][1]
+
+        if 'reverse' in args:
+            items = list(items)  # Copy the list
+            items.reverse()
+
+    return items
+
+
 def apply_diff(state, diff, expand):
     if not diff:
         return
@@ -575,24 +690,8 @@ def apply_diff(state, diff, expand):
 
 def encode_seq(state):
     """Convert a sequence to an encoded string"""
-    state = compress(json.dumps(state))
-    l_ = len(state)
-
-    if l_ > 57:
-        states = []
-        for i in range(0, l_, 57):
-            states.append(b2a_base64(state[i:i + 57])[:-1])
-        state = b''.join(states)
-    else:
-        state = b2a_base64(state)[:-1]
-
-    l_ = state.find(b'=')
-    if l_ >= 0:
-        state = state[:l_]
-
-    state = state.translate(tplus)
-    state = state.decode('ascii')
-    return state
+    state = urlsafe_b64encode(pack_state(state)).rstrip(b'=')
+    return STATE_MARKER + state.decode('ascii')
 
 
 def encode_str(state):
@@ -623,10 +722,21 @@ def encode_str(state):
 
 
 def decode_seq(state):
-    """Convert an encoded string to a sequence"""
+    """Convert an encoded string to a sequence
+
+    Strings in the format used before the compact one are decoded, too.
+    """
     if not isinstance(state, bytes):
         state = state.encode('ascii')
 
+    if state.startswith(STATE_MARKER_BYTES):
+        state = state[len(STATE_MARKER_BYTES):]
+        try:
+            state = urlsafe_b64decode(state + b'=' * (-len(state) % 4))
+            return unpack_state(state)
+        except (ValueError, IndexError, OverflowError, zlib.error):
+            return []
+
     state = state.translate(tminus)
     l_ = len(state)
 
@@ -660,6 +770,177 @@ def decode_seq(state):
         return []
 
 
+# The kinds of values in the compact format of tree states and paths.
+# A value starts with a byte with the kind in the lower three bits and
+# the length of a list or string or the value of an integer in the
+# upper five bits.  Numbers that do not fit are stored as varints that
+# follow.
+KIND_LIST = 0
+KIND_INT = 1
+KIND_STR = 2
+KIND_OID = 3
+KIND_JSON = 4
+INLINE_MAX = 31
+
+
+def pack_varint(out, number):
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def unpack_varint(data, pos):
+    number = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def pack_state(state):
+    """Convert a tree state or path to the compact binary format.
+
+    Lists are stored with their length and integer ids as varints.
+    String ids are stored with the length of the prefix they share with
+    the string before them, so that similar ids take little space, and
+    the ids used for persistent objects without an id as the number of
+    their oid.  Other ids are stored as JSON.  Larger states are compressed if
+    that makes them smaller.
+    """
+    out = bytearray()
+    pack_value(out, state, '')
+    if len(out) >= STATE_COMPRESS_MIN:
+        compressed = zlib.compress(out)
+        if len(compressed) < len(out):
+            return bytes((STATE_VERSION, STATE_COMPRESSED)) + compressed
+    return bytes((STATE_VERSION, 0)) + out
+
+
+def pack_head(out, kind, number):
+    if number < INLINE_MAX:
+        out.append(kind | number << 3)
+    else:
+        out.append(kind | INLINE_MAX << 3)
+        pack_varint(out, number - INLINE_MAX)
+
+
+def pack_value(out, value, previous):
+    """Append `value` to `out` and return the last string packed."""
+    t = type(value)
+    if t is list or t is tuple:
+        pack_head(out, KIND_LIST, len(value))
+        for item in value:
+            previous = pack_value(out, item, previous)
+    elif t is int and value >= 0:
+        pack_head(out, KIND_INT, value)
+    elif t is str:
+        if len(value) == 12 and value[-1] == '=':
+            oid = oid_from_id(value)
+            if oid is not None:
+                pack_head(out, KIND_OID, int.from_bytes(oid, 'big'))
+                return previous
+        shared = 0
+        if previous[:1] == value[:1]:
+            for a, b in zip(previous, value):
+                if a != b:
+                    break
+                shared += 1
+        encoded = value[shared:].encode('utf-8')
+        pack_head(out, KIND_STR, len(encoded))
+        pack_varint(out, shared)
+        out.extend(encoded)
+        previous = value
+    else:
+        encoded = json.dumps(value).encode('utf-8')
+        pack_head(out, KIND_JSON, len(encoded))
+        out.extend(encoded)
+    return previous
+
+
+def oid_from_id(value):
+    """Return the oid of which `value` is the id used by `extract_id`,
+    or None."""
+    try:
+        oid = a2b_base64(value)
+    except ValueError:
+        return None
+    if b2a_base64(oid)[:-1].decode('ascii') != value:
+        return None
+    return oid
+
+
+def unpack_state(data):
+    """Convert the compact binary format to a tree state or path.
+
+    ValueError is raised if `data` is not in the format.
+    """
+    if len(data) < 2 or data[0] != STATE_VERSION:
+        raise ValueError('Unknown tree state format')
+    if data[1] & STATE_COMPRESSED:
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(data[2:], STATE_MAX_SIZE)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Tree state too large')
+    else:
+        data = data[2:]
+
+    end = len(data)
+    pos = 0
+    previous = ''
+    result = []
+    # The lists being filled and the number of values still missing.
+    stack = [[result, 1]]
+    while stack:
+        top = stack[-1]
+        if not top[1]:
+            stack.pop()
+            continue
+        top[1] -= 1
+        byte = data[pos]
+        pos += 1
+        kind = byte & 7
+        number = byte >> 3
+        if number == INLINE_MAX:
+            number, pos = unpack_varint(data, pos)
+            number += INLINE_MAX
+        if kind == KIND_LIST:
+            if number > end - pos:
+                raise ValueError('Truncated tree state')
+            value = []
+            top[0].append(value)
+            stack.append([value, number])
+            continue
+        if kind == KIND_INT:
+            value = number
+        elif kind == KIND_STR:
+            shared, pos = unpack_varint(data, pos)
+            if shared > len(previous) or pos + number > end:
+                raise ValueError('Truncated tree state')
+            value = previous[:shared] + data[pos:pos + number].decode('utf-8')
+            previous = value
+            pos += number
+        elif kind == KIND_OID:
+            value = b2a_base64(number.to_bytes(8, 'big'))[:-1]
+            value = value.decode('ascii')
+        elif kind == KIND_JSON:
+            if pos + number > end:
+                raise ValueError('Truncated tree state')
+            value = json.loads(data[pos:pos + number])
+            pos += number
+        else:
+            raise ValueError('Unknown kind of value in tree state')
+        top[0].append(value)
+    if pos != end:
+        raise ValueError('Trailing data in tree state')
+    if not isinstance(result[0], list):
+        raise ValueError('Tree states and paths are lists')
+    return result[0]
+
+
 def compress(input):
     """Compress text to bytes.
 
@@ -691,44 +972,120 @@ def tpStateLevel(state, level=0):
     return level
 
 
-def tpValuesIds(self, get_items, args,
-                try_call_attr=try_call_attr,
-                ):
-    # get_item(node) is a function that returns the subitems of node
+def tpValuesIds(self, get_items, args, children=None, node_id=None):
+    """Return the state of the tree of `self` with all nodes expanded.
 
-    # This should build the ids of subitems which are
-    # expandable (non-empty). Leaves should never be
-    # in the state - it will screw the colspan counting.
-    r = []
-    try:
-        try:
-            items = get_items(self)
-        except AttributeError:
-            items = ()
-        for item in items:
+    `get_items(node)` returns the children of a node.  They are stored
+    in `children` by the python id of the node, so that every node is
+    only asked once.  The tree is walked level by level, down to the
+    'max_depth' level and until the children of 'max_nodes' nodes were
+    asked for.  Nodes beyond these limits are left collapsed.  The ids
+    of the nodes are returned by `node_id`, see 'NodeIds'.
+    """
+    # Leaves are never in the state, it would screw the colspan
+    # counting.  So the children of all nodes of a level are asked for
+    # before the nodes are added to the state.
+    if children is None:
+        children = {}
+    if node_id is None:
+        node_id = NodeIds(args['id'], args.get('oid_format'))
+    max_depth = args.get('max_depth')
+    budget = args.get('max_nodes')
+
+    def fetch(node):
+        nonlocal budget
+        key = pyid(node)
+        if key not in children:
+            if budget is not None:
+                if budget <= 0:
+                    return ()
+                budget -= 1
             try:
-                if get_items(item):
-                    id = extract_id(item, args['id'])
-
-                    e = tpValuesIds(item, get_items, args)
-                    if e:
-                        id = [id, e]
-                    else:
-                        id = [id]
-                    r.append(id)
-            except Exception:
-                pass
-    except Exception:
-        pass
-    return r
+                children[key] = get_items(node) or ()
+            except (AttributeError, ValidationError):
+                children[key] = ()
+        return children[key]
+
+    state = []
+    expanded = []
+    level = [(self, state)]
+    seen = {pyid(self)}
+    depth = 1
+    while level and (max_depth is None or depth < max_depth):
+        next_level = []
+        for node, substate in level:
+            for item in fetch(node):
+                if not fetch(item):
+                    continue
+                sub = [node_id(item)]
+                substate.append(sub)
+                # A node in the tree more than once is expanded once.
+                if pyid(item) not in seen:
+                    seen.add(pyid(item))
+                    sub.append([])
+                    expanded.append(sub)
+                    next_level.append((item, sub[1]))
+        level = next_level
+        depth += 1
+
+    for sub in expanded:
+        if not sub[1]:
+            del sub[1]
+    return state
+
+
+def decode_id(id, encoding):
+    """Return the id as used in tree states and paths."""
+    if isinstance(id, bytes):
+        return id.decode(encoding or 'latin-1')
+    return id
+
+
+@functools.lru_cache(maxsize=OID_ID_CACHE_SIZE)
+def base64_oid_id(oid):
+    """Return the base64 id of a persistent object with `oid`."""
+    return b2a_base64(oid)[:-1].decode('ascii')
+
+
+def int_oid_id(oid):
+    """Return the integer id of a persistent object with `oid`."""
+    return int.from_bytes(oid, 'big')
+
+
+# The ids of persistent objects by the 'oid_format' of the tree tag.
+OID_IDS = {
+    'base64': base64_oid_id,
+    'hex': bytes.hex,
+    'int': int_oid_id,
+}
+
+
+class NodeIds:
+    """Return the ids of the nodes of a tree during a render.
+
+    The id of a node is extracted once.  The nodes are kept with their
+    ids, so that their python ids are not reused by other objects.
+    """
+
+    def __init__(self, idattr, oid_format=None):
+        self.idattr = idattr
+        self.oid_id = OID_IDS[oid_format or 'base64']
+        self.ids = {}
+
+    def __call__(self, item):
+        key = pyid(item)
+        if key in self.ids:
+            return self.ids[key][1]
+        id = extract_id(item, self.idattr, self.oid_id)
+        self.ids[key] = item, id
+        return id
 
 
-def extract_id(item, idattr):
+def extract_id(item, idattr, oid_id=base64_oid_id):
     if hasattr(item, idattr):
         return try_call_attr(item, idattr)
-    elif getattr(item, '_p_oid', None):
-        value = b2a_base64(item._p_oid)[:-1]
-        value = value.decode('ascii')
-        return value
+    oid = getattr(item, '_p_oid', None)
+    if oid:
+        return oid_id(oid)
     else:
         return pyid(item)
@@ -40,6 +40,16 @@ class DummyFolder:
                 DummyContent('id2')]
 
 
+class DummyNode(DummyContent):
+
+    def __init__(self, id, children=()):
+        self.id = id
+        self.children = list(children)
+
+    def tpValues(self):
+        return self.children
+
+
 class TestTreeTag(unittest.TestCase):
 
     def setUp(self):
@@ -64,10 +74,180 @@ class TestTreeTag(unittest.TestCase):
         self.assertEqual(res, EMPTY_TREE)
         self.assertEqual(self.response.same_site, 'Lax')
 
+    def test_skip_unauthorized(self):
+        from DocumentTemplate.DT_Util import ValidationError
+        calls = []
+
+        class GuardedHTML(self.doc_class):
+            def guarded_getitem(self, seq, index):
+                raise AssertionError('Items are filtered at once.')
+
+            def guarded_filter(self, seq, start, end):
+                calls.append((start, end))
+                return [(index, seq[index]) for index in range(start, end)
+                        if seq[index].id != 'id1']
+
+        html = GuardedHTML('<dtml-tree fldr skip_unauthorized>'
+                           '<dtml-var id></dtml-tree>')
+        res = html(URL='/', RESPONSE=self.response, fldr=DummyFolder())
+        self.assertNotIn('id1', res)
+        self.assertIn('id2', res)
+        self.assertEqual(calls, [(0, 2)])
+
+        html = GuardedHTML('<dtml-tree fldr><dtml-var id></dtml-tree>')
+        with self.assertRaises(ValidationError) as raised:
+            html(URL='/', RESPONSE=self.response, fldr=DummyFolder())
+        self.assertEqual(raised.exception.args, ([0],))
+
+    def test_fragment(self):
+        root = DummyNode('root', [
+            DummyNode('a', [DummyNode('a1')]),
+            DummyNode('b', [DummyNode('b1', [DummyNode('x')]),
+                            DummyNode('b2')])])
+        text = '<dtml-tree root><dtml-var id></dtml-tree>'
+        path = TreeTag.encode_seq(['root', 'b'])
+        full = self._render(text, root=root, **{'tree-e': path})
+        state = getattr(self.response, 'tree-s')
+        self.assertIn('tree-e=%s#b' % path, self._render(text, root=root))
+
+        res = self._render(text, root=root, **{'tree-p': path})
+        self.assertNotIn('<table', res)
+        self.assertNotIn('>a<', res)
+        self.assertNotIn('>b<', res)
+        self.assertIn('>b1<', res)
+        self.assertIn('>b2<', res)
+        self.assertIn(res, full)
+        self.assertEqual(getattr(self.response, 'tree-s'), state)
+
+        res = self._render(text, root=root,
+                           **{'tree-p': TreeTag.encode_seq(['root'])})
+        self.assertNotIn('<table', res)
+        self.assertIn('>a<', res)
+        self.assertNotIn('>b1<', res)
+
+        for path in (['root', 'c'], ['b'], []):
+            res = self._render(text, root=root,
+                               **{'tree-p': TreeTag.encode_seq(path)})
+            self.assertEqual(res, '')
+
+    def test_expand_all(self):
+        calls = []
+
+        class Node(DummyNode):
+            def tpValues(self):
+                calls.append(self.id)
+                return self.children
+
+        root = Node('root', [
+            Node('a', [Node('a1')]),
+            Node('b', [Node('b1', [Node('x')]), Node('b2')])])
+        res = self._render('<dtml-tree root><dtml-var id></dtml-tree>',
+                           root=root, expand_all=1)
+        for id in ('a', 'a1', 'b', 'b1', 'x', 'b2'):
+            self.assertIn('>%s<' % id, res)
+        self.assertEqual(sorted(calls),
+                         ['a', 'a1', 'b', 'b1', 'b2', 'root', 'x'])
+        self.assertEqual(TreeTag.decode_seq(getattr(self.response, 'tree-s')),
+                         [['root', [['a'], ['b', [['b1']]]]]])
+
+        def get_items(node):
+            return node.children
+
+        args = {'id': 'tpId', 'max_depth': 2}
+        self.assertEqual(TreeTag.tpValuesIds(root, get_items, args),
+                         [['a'], ['b']])
+        args = {'id': 'tpId', 'max_nodes': 4}
+        self.assertEqual(TreeTag.tpValuesIds(root, get_items, args),
+                         [['a'], ['b']])
+
+    def test_expand_all_limits(self):
+        from DocumentTemplate.DT_Util import ParseError
+        res = self._render('<dtml-tree fldr max_depth=1 max_nodes=10>'
+                           '</dtml-tree>', fldr=DummyFolder(), expand_all=1)
+        self.assertEqual(res, EMPTY_TREE)
+        with self.assertRaises(ParseError):
+            self._render('<dtml-tree fldr max_depth=deep></dtml-tree>')
+
+    def test_oid_format(self):
+        from DocumentTemplate.DT_Util import ParseError
+
+        class Persistent:
+            def __init__(self, oid, children=()):
+                self._p_oid = oid.to_bytes(8, 'big')
+                self.children = list(children)
+
+            def tpValues(self):
+                return self.children
+
+        root = Persistent(1, [Persistent(258, [Persistent(3)])])
+        for oid_format, id in ((None, 'AAAAAAAAAQI='),
+                               ('base64', 'AAAAAAAAAQI='),
+                               ('hex', '0000000000000102'),
+                               ('int', 258)):
+            text = '<dtml-tree root>.</dtml-tree>'
+            if oid_format:
+                text = text.replace('root', 'root oid_format=' + oid_format)
+            res = self._render(text, root=root, expand_all=1)
+            self.assertIn('<a name="%s"' % id, res)
+            state = TreeTag.decode_seq(getattr(self.response, 'tree-s'))
+            self.assertEqual(state[0][1], [[id]])
+        with self.assertRaises(ParseError):
+            self._render('<dtml-tree root oid_format=b32></dtml-tree>')
+
+    def test_node_ids(self):
+        calls = []
+
+        class Node(DummyNode):
+            def tpId(self):
+                calls.append(self.id)
+                return self.id
+
+        node_id = TreeTag.NodeIds('tpId')
+        node = Node('a')
+        self.assertEqual(node_id(node), 'a')
+        self.assertEqual(node_id(node), 'a')
+        self.assertEqual(node_id(Node('b')), 'b')
+        self.assertEqual(calls, ['a', 'b'])
+
     def test_encode_decode_seq(self):
         state = [['AAAAAAAAAAE=', [['AAAAAAAAAAY=']]]]
         self.assertEqual(TreeTag.decode_seq(TreeTag.encode_seq(state)), state)
 
+    def test_encode_seq_compact(self):
+        state = [['AAAAAAAAAAE=', [['AAAAAAAAAAY=']]]]
+        self.assertEqual(TreeTag.encode_seq(state), '.AQAIEAsICDM')
+        path = ['folder', 'folder_1', 'folder_12', 12, 'AAAAAAAAAAY=']
+        encoded = TreeTag.encode_seq(path)
+        self.assertLess(len(encoded), 30)
+        self.assertEqual(TreeTag.decode_seq(encoded), path)
+
+        ids = [[str(i), [[i], ['\xe4' * i], [-i, [[None], [1.5]]]]]
+               for i in range(100)]
+        packed = TreeTag.pack_state(ids)
+        self.assertEqual(packed[:2], b'\x01\x01')
+        self.assertEqual(TreeTag.unpack_state(packed), ids)
+
+    def test_path_encoder(self):
+        diff = []
+        path = TreeTag.PathEncoder(diff)
+        for ids in (['folder'], ['folder', 'folder_1', 3],
+                    ['folder', 'folder_2'], ['AAAAAAAAAAE=', 'f\xfcr', 'f']):
+            while diff and diff != ids[:len(diff)]:
+                del diff[-1]
+                path.pop()
+            diff.extend(ids[len(diff):])
+            self.assertEqual(path.encode(), TreeTag.encode_seq(ids))
+
+    def test_decode_seq_old_format(self):
+        self.assertEqual(
+            TreeTag.decode_seq('eJyLjlZyhANXWyUdhWhkkUhbpVggAAC7Ggnh'),
+            [['AAAAAAAAAAE=', [['AAAAAAAAAAY=']]]])
+
+    def test_decode_seq_invalid(self):
+        for encoded in ('.', '.AQ', '.AQAIEAsI', '.AQAIEAsICDMA',
+                        '.AgAIEAsICDM', '.AQAh', '.AQAK', '.AQEAAAA', '.AQAB'):
+            self.assertEqual(TreeTag.decode_seq(encoded), [])
+
 
 EMPTY_TREE = """\
 <table cellspacing="0">